@@ -20,12 +20,13 @@ class BattleAction(object):
         # Remove the attack points for this action
         self.attacker.atk -= self.cost
         roll = randint(1,20) + self.attacker.hit.calculate() + self.bonuses - self.target.evade.calculate()
-        if not (self.target in self.battle.teamA or self.target in self.battle.teamB):
+        if not self.battle.has_character(self.target):
             # If our attack target is no longer part of this battle (died, ran, etc)
-            if self.attacker in self.battle.teamA:
-                self.target = self.battle.teamB[0]
-            else:
-                self.target = self.battle.teamA[0]
+            opponents = self.battle.opponents(self.attacker)
+            if not opponents:
+                # There's nobody left to attack
+                return
+            self.target = opponents[0]
         if roll > 20:
             self.log.debug("CRITICAL HIT!")
             self.critical()
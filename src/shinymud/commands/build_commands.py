@@ -893,6 +893,10 @@ and should be a short, descriptive, and unique word.
 <b>level range - (set levelrange <level-range>)</b> A range of levels (such as
 5-20) or a short description (e.g. Builders Only) that expresses who this level
 is for.
+<b>reset interval - (set resetinterval <seconds>)</b> How many seconds should pass
+after this area resets before it resets again (areas only reset if a player has
+visited them since their last reset). Use "set resetinterval default" to go
+back to the game's default interval.
 <b>builders - (add builder <builder-name>)</b> A list of builders who have
 access to edit this area (Builders that create an area are automatically
 added to that area's Builder's List).
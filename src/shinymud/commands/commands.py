@@ -92,7 +92,7 @@ channel off.
         if 'drunk' in self.pc.effects:
             self.args = self.pc.effects['drunk'].filter_speech(self.args)
         message = '%s chats, "%s"' % (self.pc.fancy_name(), self.args)
-        self.world.tell_players(message, exclude, chat_color)
+        self.world.tell_players(message, exclude, chat_color, priority='low')
     
 
 command_list.register(Chat, ['chat', 'c'])
@@ -1882,10 +1882,8 @@ character)
             # Start the battle if it doesn't exist yet.
             self.pc.enter_battle()
             b = Battle()
-            b.teamA.append(self.pc)
-            self.pc.battle = b
-            b.teamB.append(target)
-            target.battle = b
+            b.add_character(self.pc, 'A')
+            b.add_character(target, 'B')
             target.enter_battle()
             self.world.battle_add(b)
             target.battle_target = self.pc
@@ -2364,6 +2362,125 @@ You must be in the same room as an npc to log it.
 command_list.register(Log, ['log'])
 command_help.register(Log.help, ['log'])
 
+class TickStats(BaseCommand):
+    """Report how long each phase of the world's turn is taking."""
+    required_permissions = ADMIN
+    help = (
+    """<title>TickStats (Command)</title>
+The TickStats command shows how long each phase of the world's turn has been
+taking over the last several turns, so you can find out what is slowing the
+game down. Times are in milliseconds, given as the median (p50), the 95th and
+99th percentiles, and the maximum. It also shows how many lines of output have
+been thrown away because players' connections couldn't keep up.
+\nREQUIRED PERMISSIONS: ADMIN
+\nUSAGE:
+To see the turn timings:
+  tickstats
+To get the timings as JSON (for feeding to other tools):
+  tickstats json
+To throw away the timings collected so far and start over:
+  tickstats reset
+    """
+    )
+    def execute(self):
+        if not self.args:
+            self.pc.update_output(self.world.profiler.display())
+            drops = self.world.output_drops
+            self.pc.update_output('Output dropped for slow clients: %s low priority, '
+                                  '%s normal.' % (drops['low'], drops['normal']))
+        elif self.args.strip().lower() == 'json':
+            self.pc.update_output(self.world.profiler.dump())
+        elif self.args.strip().lower() == 'reset':
+            self.world.profiler.reset()
+            self.pc.update_output('Tick stats have been reset.')
+        else:
+            self.pc.update_output('Type "help tickstats" for help with this command.')
+    
+
+command_list.register(TickStats, ['tickstats'])
+command_help.register(TickStats.help, ['tickstats', 'tick stats'])
+
+class NetStats(BaseCommand):
+    """Report how much output each player's connection has sent."""
+    required_permissions = ADMIN
+    help = (
+    """<title>NetStats (Command)</title>
+The NetStats command shows how much output has been sent to each player, both
+before and after compression (for telnet clients that support MCCP), how well
+it compressed, and how much time the server has spent compressing it.
+\nREQUIRED PERMISSIONS: ADMIN
+\nUSAGE:
+  netstats
+    """
+    )
+    def execute(self):
+        lines = [' Net Stats '.center(60, '-')]
+        lines.append('%-15s %12s %12s %7s %9s' % ('player', 'output', 'sent',
+                                                 'ratio', 'zlib ms'))
+        output = sent = 0
+        for player in self.world.player_list.values():
+            if not (isinstance(player.name, basestring) and
+                    hasattr(player.conn, 'output_stats')):
+                continue
+            stats = player.conn.output_stats()
+            output += stats['output_bytes']
+            sent += stats['wire_bytes']
+            lines.append('%-15s %12s %12s %7.2f %9.2f' % (player.fancy_name(),
+                         stats['output_bytes'], stats['wire_bytes'],
+                         stats['ratio'], stats['compress_ms']))
+        lines.append('%-15s %12s %12s' % ('total', output, sent))
+        lines.append('-' * 60)
+        self.pc.update_output('\n'.join(lines))
+    
+
+command_list.register(NetStats, ['netstats'])
+command_help.register(NetStats.help, ['netstats', 'net stats', 'mccp'])
+
+class DBStats(BaseCommand):
+    """Report how often each database query runs and how long it takes."""
+    required_permissions = ADMIN
+    help = (
+    """<title>DBStats (Command)</title>
+The DBStats command shows how many times each database statement has been run
+since the server started (or the stats were reset), and how long it has taken
+in total, on average and at most, in milliseconds. Statements that only differ
+by their values are counted together, so a query that suddenly gets run
+thousands of times (say, once for every item in a big area) stands out.
+\nREQUIRED PERMISSIONS: ADMIN
+\nUSAGE:
+To see the statements that have taken the most time:
+  dbstats
+To see the most recent queries that were slower than DB_SLOW_QUERY_MS:
+  dbstats slow
+To see the statements that scan whole tables (if DB_EXPLAIN_SCANS is on):
+  dbstats scans
+To get the stats as JSON (for feeding to other tools):
+  dbstats json
+To throw away the stats collected so far and start over:
+  dbstats reset
+    """
+    )
+    def execute(self):
+        stats = self.world.db.query_stats
+        args = (self.args or '').strip().lower()
+        if not args:
+            self.pc.update_output(stats.display())
+        elif args == 'slow':
+            self.pc.update_output(stats.display_slow())
+        elif args == 'scans':
+            self.pc.update_output(stats.display_scans())
+        elif args == 'json':
+            self.pc.update_output(stats.dump())
+        elif args == 'reset':
+            stats.reset()
+            self.pc.update_output('Database stats have been reset.')
+        else:
+            self.pc.update_output('Type "help dbstats" for help with this command.')
+    
+
+command_list.register(DBStats, ['dbstats'])
+command_help.register(DBStats.help, ['dbstats', 'db stats', 'query stats'])
+
 
 # **************** Command Specific Exceptions *******************
 class SaleFail(Exception):
@@ -0,0 +1,192 @@
+from shinymud.lib.ansi_codes import *
+from logging import DEBUG, INFO, WARN, ERROR, CRITICAL
+import os
+
+ROOT_DIR = os.path.abspath(os.path.dirname(__file__))
+VERSION = '0.6' # The codebase version (don't change this)
+
+# *********** GAME DEFAULTS *************** #
+
+GAME_NAME = 'ShinyMUD' # Replace this with the name of your game!
+CURRENCY = 'bottlecaps' # The units for the in-game currency
+HOST = ''
+
+# Comment out any connection handlers you don't want running.
+# Connection handlers live in shinymud.lib.connection_handlers.con_handlers.py
+# Format is: (port, 'connection_handler')
+CONNECTIONS = [
+    (4111, 'TelnetHandler'),
+    (4112, 'StatSender'),
+    #(4113, 'WebsocketHandler') # Uncomment to enable Websocket ConnectionHandler
+]
+
+RESET_INTERVAL = 320 # Amount of time (in seconds) that should pass before an area resets
+# Big areas can take a while to reset. Rather than resetting all of an area's
+# rooms at once, spend at most RESET_TIME_BUDGET seconds of each turn resetting
+# rooms until the area is done (set it to 0 to reset whole areas at once).
+RESET_TIME_BUDGET = 0.02
+# Whether rooms with players in them get reset 'first' or 'last' when an area
+# is reset a few rooms at a time
+RESET_OCCUPIED_ROOMS = 'first'
+# The most npc commands that get run in a single turn, across all npcs (0 means
+# no limit). Npcs that don't get to act before the limit is hit go first next
+# turn.
+NPC_COMMAND_BUDGET = 500
+DEFAULT_LOCATION = ('library', '4') # The area, room_id that newbies should start in
+TICK_STATS_TURNS = 240 # The number of turns the tickstats command reports timings over
+# Keep slow clients from eating up the server's memory. Once a player has more
+# than OUTPUT_HIGH_WATER lines of output waiting to be sent, low-priority output
+# (chat, emotes, room echoes) gets thrown away instead of queued, and past
+# OUTPUT_MAX_LINES all output does. While a connection has more than
+# SEND_BUFFER_HIGH_WATER bytes the client hasn't taken yet, we stop sending it
+# more output (and throw away its low-priority output) until it catches up.
+OUTPUT_HIGH_WATER = 100
+OUTPUT_MAX_LINES = 1000
+SEND_BUFFER_HIGH_WATER = 65536
+# The zlib compression level (1-9) for telnet clients that support MCCP2 (MUD
+# Client Compression Protocol). Higher levels compress better but cost more CPU.
+# Set it to 0 to turn compression off.
+MCCP_LEVEL = 6
+# The zlib compression level (1-9) for websocket clients that support the
+# permessage-deflate extension (0 turns it off).
+WEBSOCKET_DEFLATE_LEVEL = 6
+# Ping websocket clients we haven't heard from in this many seconds, and drop
+# them if they don't answer within as long again.
+WEBSOCKET_PING_INTERVAL = 30
+
+# *********** LOGGING CONFIGURATION *************** #
+
+SHINYMUD_LOGFILE = ROOT_DIR + '/logs/shinymud.log'
+SHINYMUD_LOGLEVEL = INFO
+SHINYMUD_MAXBYTES = 1024 * 1024
+SHINYMUD_NUMFILES = 5
+
+SOCIAL_LOGFILE = ROOT_DIR + '/logs/social.log'
+SOCIAL_LOGLEVEL = INFO
+SOCIAL_MAXBYTES = 1024 * 1024
+SOCIAL_NUMFILES = 2
+
+
+# *********** MAIL CONFIGURATION *************** #
+# shinymail will use the following settings to send email. The default values
+# reflect using a fake gmail address - replace these with your own info before
+# you set EMAIL_ENABLED to True.
+
+EMAIL_ENABLED = False
+EMAIL_HOST = 'smtp.gmail.com'
+EMAIL_PORT = 587
+EMAIL_HOST_USER = 'myaddress@gmail.com'
+EMAIL_HOST_PASSWORD = 'sooperseekret'
+EMAIL_USE_TLS = True
+
+# *********** CRON CONFIGURATION *************** #
+
+CRON_NOTIFY = [# All the important people you want notified if the mud crashes:
+               #'yourname@example.com',
+               #'yourmomsname@example.com',
+               #'yourdogsname@example.com',
+               #'thefbi@example.com'
+              ]
+
+# *********** SPORT CONFIGURATION *************** #
+
+DB_NAME = ROOT_DIR + '/shinymud.db' # path/name of the sqlite3 database
+# Rather than writing every change to the database as soon as it's saved, save
+# up changes and write them all at once every WRITE_BEHIND_TURNS turns (changes
+# are also written when a player logs out and when the server shuts down). Set
+# it to 0 to write every change straight away.
+WRITE_BEHIND_TURNS = 20
+# Hand inserts, updates and deletes to a separate thread with its own
+# connection to the database, so the game doesn't have to wait for them to be
+# committed (it still waits for new rows' ids, and before reading).
+DB_WRITER_THREAD = False
+# The sqlite settings the database is opened with (None leaves sqlite's default
+# alone). WAL lets the game read while something else is writing, and with it
+# synchronous NORMAL only risks losing the last few commits if the machine
+# (not just the server) crashes; use FULL if that matters more than speed.
+# A negative cache_size is in KiB, mmap_size is in bytes.
+DB_PROFILE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,
+    'mmap_size': 64 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+# How often (in seconds) to copy the WAL log back into the database, from a
+# separate thread. Set to 0 to let sqlite do it whenever the log gets big.
+DB_CHECKPOINT_INTERVAL = 60
+# Queries that take longer than this many milliseconds get logged (see the
+# dbstats command for the rest of the query statistics)
+DB_SLOW_QUERY_MS = 100
+# Check the query plan of every new statement the first time it runs, and
+# keep track of the ones that scan whole tables. This costs an extra query per
+# statement, so it's best left off unless you're looking for missing indexes.
+DB_EXPLAIN_SCANS = False
+AREAS_IMPORT_DIR = ROOT_DIR + '/areas' # directory for inmport areas
+AREAS_EXPORT_DIR = ROOT_DIR + '/areas' # directory for exported areas
+PREPACK = ROOT_DIR + '/areas/builtin' # directory for built-in areas
+
+# ************ COLOR THEMES ************
+
+# Player Permissions
+PLAYER = 1
+BUILDER = 2
+DM = 4
+ADMIN = 8
+GOD = 16
+
+# Should import and use this instead, and phase the above method of constants
+# out
+PERMS = {'player': 1, 'builder': 2, 'dm': 4, 'admin': 8, 'god': 16}
+
+EQUIP_SLOTS =    {  'main-hand': 'You wield #item in your main-hand.',
+                    'off-hand': 'You wield #item in your off-hand.',
+                    'head': 'You place #item on your head.',
+                    'neck': 'You wear #item around your neck.',
+                    'ring': 'You wear #item on your finger.',
+                    'crown': 'You place #item upon your head.',
+                    'hands': 'You wear #item on your hands.',
+                    'wrist': "You wear #item on your wrist.",
+                    'earring': 'You slip #item into your ear.',
+                    'arms': 'You wear #item on your arms.',
+                    'legs': 'You wear #item on your legs.',
+                    'feet': 'You pull #item on to your feet.',
+                    'torso': 'You wear #item on your body.',
+                    'waist': 'You wear #item around your waist.',
+                    'back': 'you throw #item over your back.'
+                    #'face',
+                    #'eyes',
+                }
+
+DAMAGE_TYPES =  [   'slashing', 
+                    'piercing', 
+                    'impact', 
+                    'fire', 
+                    'ice', 
+                    'shock', 
+                    'sonic', 
+                    'poison',
+                    # 'holy'
+                ]
+
+# Color constants:
+clear_fcolor = COLOR_FG_RESET # DON'T CHANGE THIS ONE!
+clear_bcolor = COLOR_BG_RESET # DON'T CHANGE THIS ONE EITHER!
+
+# Communication colors
+chat_color = COLOR_FG_CYAN
+say_color = COLOR_FG_YELLOW
+wecho_color = COLOR_FG_BLUE
+
+# Object colors
+npc_color = COLOR_FG_YELLOW
+player_color = COLOR_FG_YELLOW
+room_title_color = COLOR_FG_GREEN
+room_body_color = COLOR_FG_GREEN
+room_exit_color = COLOR_FG_CYAN
+room_id_color = COLOR_FG_RED
+item_color = COLOR_FG_RED
+
+# Help colors
+help_title = BOLD
+
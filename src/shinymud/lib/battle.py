@@ -1,4 +1,6 @@
 from shinymud.lib.world import World
+import heapq
+import itertools
 import re
 
 class Damage(object):
@@ -24,42 +26,82 @@ class Damage(object):
     
     def __str__(self):
         return self.type + ' ' + str(self.range[0]) + '-' + str(self.range[1]) + ' ' + str(self.probability) + '%'
-    
+
 
 class Battle(object):
     """A battle is a fight between two teams until one team is unable to continue.
+    
+    teamA and teamB keep the fighters in the order they joined, but who is on
+    which team is also kept in a dictionary (see add_character), so checking
+    whether someone is still in the fight doesn't mean searching both lists.
     """
     def __init__(self):
         self.teamA = []
         self.teamB = []
+        # character:team-name, for everyone still in the battle
+        self.teams = {}
         self.remove_list = []
         self.id = None
         self.world = World.get_world()
     active = lambda self: len(self.teamA) > 0 and len(self.teamB) > 0
     
+    def add_character(self, character, team):
+        """Add a character to the battle on team (either 'A' or 'B')."""
+        self.teams[character] = team
+        if team == 'A':
+            self.teamA.append(character)
+        else:
+            self.teamB.append(character)
+        character.battle = self
+    
+    def has_character(self, character):
+        """Return True if character is still fighting in this battle."""
+        return character in self.teams
+    
+    def team_of(self, character):
+        """Return the name of the team character is on ('A' or 'B'), or None
+        if they aren't in this battle.
+        """
+        return self.teams.get(character)
+    
+    def opponents(self, character):
+        """Return the list of characters fighting against character (empty
+        if character isn't in this battle).
+        """
+        team = self.teams.get(character)
+        if team == 'A':
+            return self.teamB
+        if team == 'B':
+            return self.teamA
+        return []
+    
     def perform_round(self):
-        ready_characters = []
-        ready_characters.extend(self.teamA)
-        ready_characters.extend(self.teamB)
-        for character in ready_characters:
+        # Everyone gets their attack points for the round, then whoever has
+        # the fewest attack points goes first, and keeps attacking until
+        # they run out (attacking only ever lowers their points, so they stay
+        # the lowest). The initiative queue is a heap of (atk, join order,
+        # character), so ties go to whoever was queued first.
+        initiative = []
+        order = itertools.count()
+        for character in self.teamA + self.teamB:
             character.atk += 1.0
             self.world.log.debug("%s has %s ATK points" % (character.fancy_name(), str(character.atk)))
-        while len(ready_characters) and self.active():
+            heapq.heappush(initiative, (character.atk, order.next(), character))
+        while initiative and self.active():
             # while we have someone ready to attack AND both teams are still active
-            #sort the list
-            ready_characters.sort(lambda x,y: -1 if (x.atk < y.atk) else 1)
-            attacker = ready_characters[0]
-            if attacker.next_action_cost() > attacker.atk:
-                self.world.log.debug(attacker.fancy_name() + " has no more attacks this round")
-                del ready_characters[0]
-                continue
-            #perform the attack
-            attacker.attack()
-            self.cleanup()
+            attacker = heapq.heappop(initiative)[2]
+            while attacker in self.teams and self.active():
+                # (they may have died or run away since the round started)
+                if attacker.next_action_cost() > attacker.atk:
+                    self.world.log.debug(attacker.fancy_name() + " has no more attacks this round")
+                    break
+                #perform the attack
+                attacker.attack()
+                self.cleanup()
         self.world.log.debug("No more ready characters this round")
         if not self.active():
             self.end_battle()
-
+    
     def end_battle(self):
         self.world.battle_remove(self.id)
         for x in self.teamA if len(self.teamA) else self.teamB:
@@ -68,15 +110,21 @@ class Battle(object):
             x.update_output("You won the battle!")
     
     def remove_character(self, character):
-        self.remove_list.append(character)
+        """Take character out of the battle. They stop counting as a member
+        straight away, but aren't taken out of the team lists until the next
+        cleanup.
+        """
+        if self.teams.pop(character, None):
+            self.remove_list.append(character)
     
     def cleanup(self):
+        if not self.remove_list:
+            return
         self.world.log.debug("cleaning up %s" % str([x.fancy_name() for x in self.remove_list]))
-        for c in self.remove_list:
-            if c in self.teamA:
-                self.teamA.remove(c)
-            elif c in self.teamB:
-                self.teamB.remove(c)
+        # Rebuild the teams in one pass rather than searching the lists for
+        # each character that left
+        self.teamA = [c for c in self.teamA if c in self.teams]
+        self.teamB = [c for c in self.teamB if c in self.teams]
         self.remove_list = []
     
     def tell_all(self, message, exclude=[]):
@@ -85,4 +133,3 @@ class Battle(object):
         for player in r:
             if player.name not in exclude:
                 player.update_output(message)
-        
\ No newline at end of file
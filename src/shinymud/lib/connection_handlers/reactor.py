@@ -0,0 +1,244 @@
+import errno
+import select
+import threading
+import time
+
+class EpollPoller(object):
+    """Wait on sockets with epoll (Linux)."""
+    READ = select.EPOLLIN if hasattr(select, 'EPOLLIN') else 0
+    WRITE = select.EPOLLOUT if hasattr(select, 'EPOLLOUT') else 0
+    ERROR = (select.EPOLLHUP | select.EPOLLERR) if hasattr(select, 'EPOLLIN') else 0
+    
+    def __init__(self):
+        self.epoll = select.epoll()
+    
+    def register(self, fd):
+        self.epoll.register(fd, self.READ | self.ERROR)
+    
+    def modify(self, fd, write):
+        """Change whether we're waiting for fd to become writable."""
+        self.epoll.modify(fd, self.READ | self.ERROR | (self.WRITE if write else 0))
+    
+    def unregister(self, fd):
+        self.epoll.unregister(fd)
+    
+    def poll(self, timeout):
+        return self.epoll.poll(timeout)
+
+
+class PollPoller(object):
+    """Wait on sockets with poll (most other unixes)."""
+    READ = getattr(select, 'POLLIN', 0) | getattr(select, 'POLLPRI', 0)
+    WRITE = getattr(select, 'POLLOUT', 0)
+    ERROR = getattr(select, 'POLLHUP', 0) | getattr(select, 'POLLERR', 0)
+    
+    def __init__(self):
+        self.poller = select.poll()
+    
+    def register(self, fd):
+        self.poller.register(fd, self.READ | self.ERROR)
+    
+    def modify(self, fd, write):
+        """Change whether we're waiting for fd to become writable."""
+        self.poller.modify(fd, self.READ | self.ERROR | (self.WRITE if write else 0))
+    
+    def unregister(self, fd):
+        self.poller.unregister(fd)
+    
+    def poll(self, timeout):
+        # poll takes its timeout in milliseconds
+        return self.poller.poll(timeout * 1000)
+
+
+class SelectPoller(object):
+    """Wait on sockets with plain old select, if nothing better exists."""
+    READ = 1
+    WRITE = 4
+    ERROR = 0
+    
+    def __init__(self):
+        self.fds = set()
+        self.write_fds = set()
+    
+    def register(self, fd):
+        self.fds.add(fd)
+    
+    def modify(self, fd, write):
+        """Change whether we're waiting for fd to become writable."""
+        if write:
+            self.write_fds.add(fd)
+        else:
+            self.write_fds.discard(fd)
+    
+    def unregister(self, fd):
+        self.fds.discard(fd)
+        self.write_fds.discard(fd)
+    
+    def poll(self, timeout):
+        readable, writable, _ = select.select(list(self.fds), list(self.write_fds),
+                                              [], timeout)
+        events = dict([(fd, self.READ) for fd in readable])
+        for fd in writable:
+            events[fd] = events.get(fd, 0) | self.WRITE
+        return events.items()
+
+
+def get_poller():
+    """Return the most efficient poller this platform supports."""
+    if hasattr(select, 'epoll'):
+        return EpollPoller()
+    if hasattr(select, 'poll'):
+        return PollPoller()
+    return SelectPoller()
+
+
+class Reactor(threading.Thread):
+    """The Reactor owns every socket the MUD has open - the listening sockets
+    of the connection handlers, and the client sockets of every connected
+    player - and waits on all of them at once.
+    
+    Rather than the world asking every player's connection for input on every
+    turn (which costs a failing recv call per idle player), the Reactor sleeps
+    until the kernel tells it which sockets are actually ready, and only calls
+    handle_read() on those. Connection handlers accept new clients from
+    handle_read(); player connections read whatever the socket has and queue it
+    up to be picked up by the player on their next turn. Idle players don't
+    cost anything.
+    
+    Player connections don't block when sending output either: whatever the
+    socket won't take right away stays in the connection's output buffer, and
+    the connection asks the Reactor (with want_write()) to call its
+    handle_write() once the socket has room for more.
+    
+    Every keepalive_interval seconds, handlers that have a keepalive() function
+    get it called (with the current time), so that connections can check on
+    their clients without waiting on the world's turn.
+    
+    Anything added to the Reactor needs a fileno() and a handle_read() function.
+    handle_read() (and handle_write(), for handlers that ask for it) should
+    return False if the socket has been closed and should no longer be watched.
+    """
+    
+    def __init__(self, world, timeout=1.0, keepalive_interval=5.0):
+        threading.Thread.__init__(self)
+        self.daemon = True # So this thread will exit when the main thread does
+        self.world = world
+        self.timeout = timeout
+        self.keepalive_interval = keepalive_interval
+        self.poller = get_poller()
+        self.handlers = {}
+        # The fds of handlers waiting for their sockets to become writable
+        self.writers = set()
+        # Connections get added and removed from other threads (the world
+        # thread removes connections when players log out)
+        self.lock = threading.Lock()
+    
+    def add(self, handler):
+        """Start watching a handler's socket for activity."""
+        fd = handler.fileno()
+        handler.reactor = self
+        # Remember the fd - once the socket is closed we can't ask for it
+        handler.reactor_fd = fd
+        self.lock.acquire()
+        try:
+            self.handlers[fd] = handler
+            self.poller.register(fd)
+        finally:
+            self.lock.release()
+        # A connection might have written something before it was added (like
+        # telnet option negotiation) that the socket couldn't take all of yet
+        if getattr(handler, 'outbuf', None):
+            self.want_write(handler)
+    
+    def remove(self, handler):
+        """Stop watching a handler's socket. This must be called before the
+        socket is closed (it's safe to call more than once).
+        """
+        fd = getattr(handler, 'reactor_fd', None)
+        self.lock.acquire()
+        try:
+            if self.handlers.get(fd) is handler:
+                del self.handlers[fd]
+                self.writers.discard(fd)
+                try:
+                    self.poller.unregister(fd)
+                except (KeyError, IOError, OSError, ValueError):
+                    pass
+        finally:
+            self.lock.release()
+    
+    def want_write(self, handler, wanted=True):
+        """Start (or, if wanted is False, stop) calling handler.handle_write()
+        whenever its socket can take more output.
+        """
+        fd = getattr(handler, 'reactor_fd', None)
+        self.lock.acquire()
+        try:
+            if self.handlers.get(fd) is not handler:
+                return
+            if (fd in self.writers) == wanted:
+                # Nothing's changed, don't bother the kernel
+                return
+            if wanted:
+                self.writers.add(fd)
+            else:
+                self.writers.discard(fd)
+            self.poller.modify(fd, wanted)
+        finally:
+            self.lock.release()
+    
+    def poll(self, timeout=0):
+        """Wait (up to timeout seconds) for socket activity, and hand any
+        ready sockets to their handlers. Returns the number of sockets that
+        were handled.
+        """
+        try:
+            events = self.poller.poll(timeout)
+        except (select.error, IOError, OSError) as e:
+            if e.args[0] == errno.EINTR:
+                return 0
+            raise
+        for fd, event in events:
+            self.lock.acquire()
+            handler = self.handlers.get(fd)
+            self.lock.release()
+            if handler is None:
+                # This socket was removed after the poll returned
+                continue
+            try:
+                alive = True
+                if event & self.poller.WRITE:
+                    alive = handler.handle_write()
+                if alive is not False and event & ~self.poller.WRITE:
+                    alive = handler.handle_read()
+            except Exception as e:
+                self.world.log.error('Reactor: error handling %s: %s' %
+                                     (handler.__class__.__name__, str(e)))
+                alive = False
+            if alive is False:
+                self.remove(handler)
+        return len(events)
+    
+    def keepalive(self):
+        """Call keepalive() on every handler that has one, and stop watching
+        the ones that return False.
+        """
+        now = time.time()
+        self.lock.acquire()
+        handlers = self.handlers.values()
+        self.lock.release()
+        for handler in handlers:
+            keepalive = getattr(handler, 'keepalive', None)
+            if keepalive and keepalive(now) is False:
+                self.remove(handler)
+    
+    def run(self):
+        """Start the Reactor thread running."""
+        self.world.log.debug("Reactor started (%s)" % self.poller.__class__.__name__)
+        next_keepalive = time.time() + self.keepalive_interval
+        while not self.world.shutdown_flag:
+            self.poll(self.timeout)
+            if time.time() >= next_keepalive:
+                self.keepalive()
+                next_keepalive = time.time() + self.keepalive_interval
+
@@ -1,69 +1,238 @@
-import re
-import hashlib
+from collections import deque
+import errno
+import threading
+import time
+import zlib
 from struct import pack
 from socket import error as socket_error
+from shinymud.lib.connection_handlers.telnet import *
+from shinymud.lib.connection_handlers.websocket import *
+from shinymud.data.config import (MCCP_LEVEL, WEBSOCKET_DEFLATE_LEVEL,
+                                  WEBSOCKET_PING_INTERVAL)
 
 class ShinyConnection(object):
-    
+
     def __init__(self, conn_info, log):
         self.conn, self.addr = conn_info
         self.log = log
+        self.reactor = None
+        self.closed = False
+        # Input that the Reactor has read off of the socket, waiting to be
+        # picked up by the player on their next turn
+        self.pending = deque()
+        # Output that the socket wouldn't take yet, waiting for the Reactor to
+        # tell us the socket is writable again. The world thread writes to it
+        # and the Reactor thread flushes it, so it gets a lock.
+        self.outbuf = ''
+        self.out_lock = threading.Lock()
+        # How many bytes of output the game has given us, and how many we've
+        # put on the wire for them (these differ for compressed connections)
+        self.output_bytes = 0
+        self.wire_bytes = 0
+        # Seconds spent compressing output
+        self.compress_time = 0.0
+    
+    def fileno(self):
+        return self.conn.fileno()
+    
+    def handle_read(self):
+        """Called by the Reactor when there is data waiting on our socket.
+        Read it, and put anything the player should see into self.pending.
+        Return False if the client has closed the connection.
+        """
+        return False
+    
+    def send(self, queue):
+        """Send everything in queue to the client in one go, and empty the
+        queue. Returns False if the connection has died, True otherwise.
+        """
+        if self.closed:
+            # We've already been logged out, there's no one to send to
+            del queue[:]
+            return True
+        data = self.format_output(queue)
+        del queue[:]
+        return self.write(data)
+    
+    def backlog(self):
+        """Return the number of bytes of output we haven't been able to send
+        yet.
+        """
+        return len(self.outbuf)
     
-    def send(self):
-        pass
+    def format_output(self, lines):
+        """Turn a list of lines of output into the string of bytes we should
+        put on the wire.
+        """
+        return ''.join(lines)
+    
+    def write(self, data):
+        """Write data to the socket, or as much of it as the socket will take
+        right now. Whatever is left over waits in the output buffer until the
+        Reactor tells us the socket is writable (see handle_write).
+        Returns False if the connection has died.
+        """
+        self.out_lock.acquire()
+        try:
+            self.output_bytes += len(data)
+            data = self.encode_output(data)
+            self.wire_bytes += len(data)
+            self.outbuf += data
+            return self.flush()
+        finally:
+            self.out_lock.release()
+    
+    def encode_output(self, data):
+        """Do any last transformation (like compression) to output before it
+        goes into the output buffer. This is called with out_lock held, so
+        output is encoded in the same order it's sent.
+        """
+        return data
+    
+    def output_stats(self):
+        """Return a dictionary describing how much output we've sent and how
+        well it compressed.
+        """
+        ratio = 1.0
+        if self.wire_bytes:
+            ratio = float(self.output_bytes) / self.wire_bytes
+        return {'output_bytes': self.output_bytes,
+                'wire_bytes': self.wire_bytes,
+                'ratio': ratio,
+                'compress_ms': self.compress_time * 1000}
+    
+    def handle_write(self):
+        """Called by the Reactor when our socket can take more output."""
+        self.out_lock.acquire()
+        try:
+            alive = self.flush()
+        finally:
+            self.out_lock.release()
+        if not alive:
+            # Let the player find out the next time they look for input
+            self.closed = True
+        return alive
+    
+    def flush(self):
+        """Send as much of the output buffer as the socket will take without
+        blocking, and let the Reactor know whether we're still waiting to send
+        more. Returns False if the connection has died.
+        Only call this while holding out_lock.
+        """
+        if self.outbuf:
+            try:
+                sent = self.conn.send(self.outbuf)
+            except socket_error as e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    # Probably a broken pipe - the client is gone
+                    return False
+                # The client just isn't keeping up; try again later
+                sent = 0
+            self.outbuf = self.outbuf[sent:]
+        if self.reactor:
+            self.reactor.want_write(self, bool(self.outbuf))
+        return True
     
     def recv(self):
-        pass
+        """Return a list of the input the Reactor has queued up for us since
+        the last call, False if there isn't any, or None if the client has
+        closed the connection. This never touches the socket.
+        """
+        lines = []
+        while self.pending:
+            lines.append(self.pending.popleft())
+        if lines:
+            return lines
+        if self.closed:
+            return None
+        return False
+    
+    def read_socket(self, size):
+        """Read up to size bytes from our (non-blocking) socket. Returns None
+        if there wasn't anything there after all, or an empty string if the
+        client has gone away.
+        """
+        try:
+            return self.conn.recv(size)
+        except socket_error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return None
+            return ''
+    
+    def close(self):
+        if self.reactor:
+            self.reactor.remove(self)
+        self.out_lock.acquire()
+        try:
+            if self.outbuf and not self.closed:
+                # Give any output we're still holding one last chance to go
+                # out (it's probably a goodbye message)
+                try:
+                    self.conn.send(self.outbuf)
+                except socket_error:
+                    pass
+            self.outbuf = ''
+        finally:
+            self.out_lock.release()
+        self.closed = True
+        self.conn.close()
 
 
 class TelnetConnection(ShinyConnection):
-    
-    win_change_regexp = re.compile(r"\xff\xfa\x1f(?P<size>.*?)\xff\xf0")
+
+    # Clients should send us lines well short of this; if they don't, treat
+    # what we've got as a line rather than holding on to it forever
+    max_line_length = 4096
     
     def __init__(self, conn_info, log):
         ShinyConnection.__init__(self, conn_info, log)
         self.win_size = (80,40)
-        self.set_telnet_options()
-        # Put our socket into non-blocking mode - we'll periodically poll for data
-        # instead of blocking until we get it
+        self.parser = TelnetParser()
+        # Text the client has sent that doesn't make up a whole line yet
+        self.partial_line = ''
+        # The options we've offered to use (WILL) or asked the client to use
+        # (DO), mapped to whether the client agreed yet. Anything else the
+        # client asks for gets refused.
+        self.our_options = {LINEMODE: False}
+        self.their_options = {NAWS: False}
+        # MCCP2 (MUD Client Compression Protocol) - once the client agrees,
+        # everything we send gets run through this
+        self.compressor = None
+        if MCCP_LEVEL:
+            self.our_options[COMPRESS2] = False
+        # Put our socket into non-blocking mode - the Reactor will tell us
+        # when there's data to read instead of us blocking until we get it
         self.conn.setblocking(0)
+        self.set_telnet_options()
     
-    def send(self, queue):
-        try:
-            for index, line in enumerate(queue):
-                if index != (len(queue) - 1):
-                    line += '\r\n'
-                self.conn.send(line)
-            del queue[:]
-        except socket_error:
-            # If we die here, it's probably because we got a broken pipe...
-            # tell the function that's calling us we're not alive anymore
-            return False
-        else:
-            return True
+    def format_output(self, lines):
+        data = '\r\n'.join(lines)
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        return data
     
-    def recv(self):
-        try:
-            new_stuff = self.conn.recv(256)
-        except socket_error:
-            # In non-blocking mode, recv generates an error if it doesn't find
-            # any data to recieve. We want to ignore that error and quitely wait until
-            # there is data.
-            return False
-        else:
-            # Get rid of the \r \n line terminators
-            new_stuff = new_stuff.replace('\n', '').replace('\r', '')
-            # See if the input is a notice of window size change
-            self.parse_winchange(new_stuff)
-            # Ignore any other telnet negotiations
-            new_stuff = re.sub(r"\xff((\xfa.*?\xf0)|(..))", '', new_stuff)
-            if new_stuff:
-                return new_stuff
+    def handle_read(self):
+        new_stuff = self.read_socket(256)
+        if new_stuff is None:
+            return True
+        if not new_stuff:
+            # The client closed the connection
+            self.closed = True
             return False
-    
-    
-    def close(self):
-        self.conn.close()
+        text, commands = self.parser.feed(new_stuff)
+        for command in commands:
+            self.handle_command(*command)
+        # Only hand over whole lines; the rest waits for the next read
+        lines = (self.partial_line + text).split('\n')
+        self.partial_line = lines.pop()
+        if len(self.partial_line) > self.max_line_length:
+            lines.append(self.partial_line)
+            self.partial_line = ''
+        for line in lines:
+            line = line.replace('\r', '').replace('\x00', '')
+            if line:
+                self.pending.append(line)
+        return True
     
     def set_telnet_options(self):
         """Petition client to run in linemode and to send window size change
@@ -73,154 +242,280 @@ class TelnetConnection(ShinyConnection):
         them to switch to linemode in this case, where they transmit each line
         after it's been assembled. We also wan't the client to tell us their
         screen size so we can display things appropriately.
+        We don't wait around for the answers - they get picked up by
+        handle_command whenever the client gets around to sending them.
+        """
+        # IAC + WILL + LINEMODE, IAC DO NAWS (Negotiate About Window Size)
+        options = IAC + WILL + LINEMODE + IAC + DO + NAWS
+        if COMPRESS2 in self.our_options:
+            # IAC WILL COMPRESS2 - offer to compress our output
+            options += IAC + WILL + COMPRESS2
+        self.write(options)
+    
+    def handle_command(self, command, option, payload=None):
+        """Deal with a telnet command the client sent us."""
+        if command == SB:
+            if option == NAWS:
+                self.parse_winchange(payload)
+        elif command in (DO, DONT):
+            if option in self.our_options:
+                self.our_options[option] = (command == DO)
+                if option == COMPRESS2 and command == DO:
+                    self.start_compression()
+            elif command == DO:
+                # They want us to do something we don't know how to do
+                self.write(IAC + WONT + option)
+        elif command in (WILL, WONT):
+            if option in self.their_options:
+                self.their_options[option] = (command == WILL)
+            elif command == WILL:
+                self.write(IAC + DONT + option)
+        self.log.debug('Telnet command from %s: %r' % (str(self.addr),
+                                                      (command, option, payload)))
+    
+    def start_compression(self):
+        """Tell the client that everything from here on is compressed, and
+        start compressing.
         """
-        # IAC + WILL + LINEMODE
-        self.conn.send(chr(255) + chr(251) + chr(34) + '\r\n')
-        # We should get a response from their client (immediately)
-        self.conn.settimeout(1.0)
+        self.out_lock.acquire()
         try:
-            result = list(self.conn.recv(256))
-        except socket.timeout:
-            # This just means that their telnet client didn't send us a timely
-            # response to our initiating linemode... we should just move on
-            result = 'Client response FAIL for linemode.'
+            if self.compressor:
+                return
+            self.outbuf += IAC + SB + COMPRESS2 + IAC + SE
+            self.compressor = zlib.compressobj(MCCP_LEVEL)
+            self.flush()
         finally:
-            self.log.debug(result)
-            
-        # IAC DO NAWS (Negotiate About Window Size)
-        self.conn.send(chr(255) + chr(253) + chr(31) + '\r\n')
-        try:
-            result = list(self.conn.recv(256))
-        except:
-            result = 'Client response FAIL for NAWS.'
-        else:
-            # IAC WILL NAWS
-            if result[0:3] == ['\xff', '\xfb', '\x1f']:
-                # win, they're willing to do NAWS! Parse their window info
-                stuff = ''.join(result[3:])
-                self.parse_winchange(stuff)
-        finally:
-            self.conn.settimeout(None)
-            self.log.debug(str(result))
+            self.out_lock.release()
+    
+    def encode_output(self, data):
+        if not self.compressor:
+            return data
+        start = time.time()
+        # Each write is a turn's worth of output, so flush the compressor
+        # here; the client can't show anything that's stuck inside it
+        data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.compress_time += time.time() - start
+        return data
     
     def parse_winchange(self, data):
         """Parse and set the terminal size of the player."""
-        match = self.win_change_regexp.match(data)
-        if match:
-            size = match.group('size')
-            self.win_size = (ord(size[1]), ord(size[3]))
+        size = parse_naws(data)
+        if size:
+            self.win_size = size
     
 
 
 class WebsocketConnection(ShinyConnection):
-    handshake_string = "HTTP/1.1 101 Web Socket Protocol Handshake\r\n\
-Upgrade: WebSocket\r\n\
-Connection: Upgrade\r\n\
-Sec-WebSocket-Origin: %(origin)s\r\n\
-Sec-WebSocket-Location: ws://%(host)s/\r\n\r\n"
+    """A connection from a WebSocket (RFC 6455) client, such as a browser.
+    
+    Nothing here blocks: the client's opening handshake is read a piece at a
+    time like any other input, and the connection calls on_open (with itself)
+    once the handshake is done and it's ready to be handed to a player. Each
+    turn's output goes out as a single text message, compressed with
+    permessage-deflate if the client supports it. Keepalive pings are sent
+    from the Reactor thread (see keepalive), so they never wait on the world.
+    """
     
-    def __init__(self, conn_info, log, host, port):
+    # The most we'll read of an opening handshake before giving up on it
+    max_handshake_size = 8192
+    
+    def __init__(self, conn_info, log, on_open=None):
         ShinyConnection.__init__(self, conn_info, log)
-        self.host = host
-        self.port = port
-        self.data_fragment = ''
-        self.handshake()
+        self.on_open = on_open
+        self.handshake_data = ''
+        self.open = False
+        self.parser = FrameParser()
+        # The pieces of a fragmented message we're still waiting for the end
+        # of, and whether that message is compressed
+        self.fragments = bytearray()
+        self.fragments_opcode = None
+        self.fragments_compressed = False
+        # permessage-deflate state
+        self.deflate = None
+        self.compressor = None
+        self.decompressor = None
+        # Keepalive state: when we last heard from the client, and when we
+        # sent a ping they haven't answered yet
+        self.last_heard = time.time()
+        self.ping_sent = None
         self.conn.setblocking(0)
     
-    def send(self, queue):
-        try:
-            while (len(queue) > 0):
-                line = queue.pop(0)
-                line = '\x00' + line.encode('utf-8') + '\xFF'
-                self.conn.send(line)
-        except socket_error:
-            # If we die here, it's probably because we got a broken pipe...
-            # tell the function that's calling us we're not alive anymore 
-            return False
-        else:
-            return True
+    def format_output(self, lines):
+        data = '\r\n'.join(lines)
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        return data
     
+    def encode_output(self, data):
+        if not self.open:
+            # Handshake replies and the like go out as they are
+            return data
+        return self.encode_message(data)
     
-    def recv(self):
+    def encode_message(self, data, opcode=TEXT):
+        """Frame data as a single WebSocket message, compressing it if we've
+        agreed to. Only call this while holding out_lock.
+        """
+        if self.deflate and opcode in (TEXT, BINARY) and data:
+            start = time.time()
+            if self.deflate['no_context_takeover']:
+                self.compressor = zlib.compressobj(WEBSOCKET_DEFLATE_LEVEL,
+                                                   zlib.DEFLATED,
+                                                   -self.deflate['wbits'])
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.compress_time += time.time() - start
+            return encode_frame(opcode, data[:-len(DEFLATE_TAIL)], True)
+        return encode_frame(opcode, data)
+    
+    def send_control(self, opcode, payload=''):
+        """Send a control frame (ping, pong or close) straight away."""
+        self.out_lock.acquire()
         try:
-            new_stuff = self.data_fragment + self.conn.recv(256)
-        except socket_error:
-            # In non-blocking mode, recv generates an error if it doesn't find
-            # any data to recieve. We want to ignore that error and quitely wait until
-            # there is data.
+            self.outbuf += encode_frame(opcode, payload)
+            return self.flush()
+        finally:
+            self.out_lock.release()
+    
+    def handle_read(self):
+        new_stuff = self.read_socket(4096)
+        if new_stuff is None:
+            return True
+        if not new_stuff:
+            # The client closed the connection
+            self.drop()
             return False
-        else:
-            valid_lines = []
-            
-            # Split all lines on the terminating character
-            lines = new_stuff.split('\xFF')
-            
-            # Pop the last line off of the end - this will either be an empty string if the
-            # last line was terminated, or a left over fragment that should wait for the next batch
-            # of lines to be processed
-            self.data_fragment = lines.pop()
-            
-            # Now we should make sure the lines have a valid prefix. Ignore any that don't.
-            for line in lines:
-                if line[0] == '\x00':
-                    valid_lines.append(line[1:])
-                elif line == '':
-                    # The client wishes to terminate - send the closing handshake and disconnect
-                    self.close()
-                    # Return None so that the player object knows to log the player out
-                    return None
-                else:
-                    self.log.error('Received invalid message from client '
-                                    '(frame did not begin with 0x00 byte): %s' % (line))
-                
-            if valid_lines:
-                return valid_lines
-            
+        self.last_heard = time.time()
+        try:
+            if not self.open:
+                return self.read_handshake(new_stuff)
+            return self.handle_frames(new_stuff)
+        except WebsocketError as e:
+            self.log.debug('Websocket error from %s: %s' % (str(self.addr), str(e)))
+            if self.open:
+                # 1002: protocol error
+                self.send_control(CLOSE, pack('!H', 1002))
+            self.drop()
             return False
     
+    def drop(self):
+        """Give up on the connection. Once we're open, the player notices and
+        logs out (which closes the socket), but before then there's no player
+        yet, so close the socket ourselves.
+        """
+        if self.open:
+            self.closed = True
+        else:
+            self.close()
     
-    def handshake(self):
-        data = self.conn.recv(1024)
-        host = re.findall(r'Host: (.*?)\r\n', data)[0]
-        origin = re.findall(r'Origin: (.*?)\r\n', data)[0]
-        response = self.handshake_string % {'origin': origin, 'host': host}
-        
-        response = response.encode('utf-8') + self.parse_hybi00(data)
-        self.conn.send(response)
+    def read_handshake(self, data):
+        """Collect the client's opening handshake, and answer it once we have
+        the whole thing.
+        """
+        self.handshake_data += data
+        if '\r\n\r\n' not in self.handshake_data:
+            if len(self.handshake_data) > self.max_handshake_size:
+                raise WebsocketError('Handshake was too long.')
+            return True
+        request, extra = self.handshake_data.split('\r\n\r\n', 1)
+        self.handshake_data = ''
+        try:
+            headers = parse_request(request)
+        except WebsocketError:
+            self.write(BAD_REQUEST)
+            raise
+        response = HANDSHAKE_RESPONSE % accept_key(headers['sec-websocket-key'])
+        if WEBSOCKET_DEFLATE_LEVEL:
+            ext, options = negotiate_deflate(headers.get('sec-websocket-extensions', ''))
+            if ext:
+                response += 'Sec-WebSocket-Extensions: %s\r\n' % ext
+                self.deflate = options
+                self.compressor = zlib.compressobj(WEBSOCKET_DEFLATE_LEVEL,
+                                                   zlib.DEFLATED, -options['wbits'])
+                self.decompressor = zlib.decompressobj(-15)
+        self.write(response + '\r\n')
+        self.open = True
+        if self.on_open:
+            self.on_open(self)
+        if extra:
+            # The client didn't wait for our answer before sending frames
+            return self.handle_frames(extra)
+        return True
     
-    def close(self):
-        self.conn.close()
+    def handle_frames(self, data):
+        """Handle all of the complete frames in data (along with whatever was
+        left over from last time). Returns False if the connection should be
+        closed.
+        """
+        for fin, compressed, opcode, payload in self.parser.feed(data):
+            if not self.handle_frame(fin, compressed, opcode, payload):
+                self.drop()
+                return False
+        return True
     
-    def parse_hybi00(self, request):
-        """ Parses an HTTP request header and forms a response according to
-        The WebSocket protocol, draft-ietf-hybi-thewebsocketprotocol-00
-        (http://tools.ietf.org/html/draft-ietf-hybi-thewebsocketprotocol-00).
-        """
-        # The random tokens will be in the last 8 bytes of the request
-        random_tokens = request[-8:]
-        # Grab the sooper seekret keys hidden away in the request headers
-        key1 = re.findall(r'Sec-WebSocket-Key1: (.*?)\r\n', request)[0]
-        key2 = re.findall(r'Sec-WebSocket-Key2: (.*?)\r\n', request)[0]
-        
-        def parse_key(key):
-            spaces = 0
-            digits = ''
-            
-            for char in list(key):
-                if char.isdigit():
-                    # If the character is a digit, concatonate it to our string of digits
-                    digits += char
-                elif char == ' ':
-                    # If the character is a space, add it to our space counter orgecc
-                    spaces += 1
-            
-            result = int(int(digits) / spaces)
-            return result
-        
-        
-        response = pack('>II8s', parse_key(key1), parse_key(key2), str(random_tokens))
-        hashed_response = hashlib.md5()
-        hashed_response.update(response)
-        return hashed_response.digest()
+    def handle_frame(self, fin, compressed, opcode, payload):
+        """Deal with a single frame from the client. Returns False if the
+        connection should be closed.
+        """
+        if opcode == PING:
+            self.send_control(PONG, str(payload))
+            return True
+        if opcode == PONG:
+            self.ping_sent = None
+            return True
+        if opcode == CLOSE:
+            # Echo the close back (with the client's status code, if any)
+            self.send_control(CLOSE, str(payload[:2]))
+            return False
+        if opcode == CONTINUATION:
+            if self.fragments_opcode is None:
+                raise WebsocketError('Continuation frame with nothing to continue.')
+        elif opcode in (TEXT, BINARY):
+            if self.fragments_opcode is not None:
+                raise WebsocketError('New message before the last one was finished.')
+            self.fragments_opcode = opcode
+            self.fragments_compressed = compressed
+        else:
+            raise WebsocketError('Unknown opcode %s.' % opcode)
+        self.fragments.extend(payload)
+        if len(self.fragments) > MAX_MESSAGE_SIZE:
+            raise WebsocketError('Client sent a message that was too big.')
+        if fin:
+            message = str(self.fragments)
+            if self.fragments_compressed:
+                if not self.decompressor:
+                    raise WebsocketError('Compressed message without permessage-deflate.')
+                message = self.decompressor.decompress(message + DEFLATE_TAIL,
+                                                       MAX_MESSAGE_SIZE)
+                if self.decompressor.unconsumed_tail:
+                    raise WebsocketError('Client sent a message that was too big.')
+            self.fragments = bytearray()
+            self.fragments_opcode = None
+            message = message.replace('\r', '').replace('\n', '')
+            if message:
+                self.pending.append(message)
+        return True
+    
+    def keepalive(self, now):
+        """Called by the Reactor every so often. Ping the client if we haven't
+        heard from it in a while, and give up on it if it never answers.
+        """
+        if self.closed:
+            return True
+        if not self.open:
+            if now - self.last_heard > WEBSOCKET_PING_INTERVAL:
+                # They never finished their handshake
+                self.drop()
+                return False
+            return True
+        if self.ping_sent is not None:
+            if now - self.ping_sent > WEBSOCKET_PING_INTERVAL:
+                self.log.debug('Websocket client %s stopped answering pings.' %
+                               str(self.addr))
+                self.closed = True
+                return False
+        elif now - self.last_heard > WEBSOCKET_PING_INTERVAL:
+            self.ping_sent = now
+            return self.send_control(PING)
+        return True
     
 
@@ -0,0 +1,117 @@
+"""Telnet protocol constants, and a parser for the byte stream a telnet client
+sends us.
+
+See RFC 854 (telnet), RFC 855 (option negotiation), RFC 1073 (NAWS),
+RFC 1184 (LINEMODE) and http://www.zuggsoft.com/zmud/mcp.htm (MCCP).
+"""
+
+# Telnet commands
+IAC = chr(255)  # Interpret As Command
+DONT = chr(254)
+DO = chr(253)
+WONT = chr(252)
+WILL = chr(251)
+SB = chr(250)   # Subnegotiation Begin
+SE = chr(240)   # Subnegotiation End
+
+# Telnet options
+NAWS = chr(31)  # Negotiate About Window Size
+LINEMODE = chr(34)
+COMPRESS2 = chr(86) # MCCP2 (MUD Client Compression Protocol v2)
+
+# Parser states
+DATA = 0        # plain text
+COMMAND = 1     # got an IAC, waiting for the command
+OPTION = 2      # got IAC + WILL/WONT/DO/DONT, waiting for the option
+SUBNEG = 3      # inside IAC SB ... IAC SE
+SUBNEG_IAC = 4  # got an IAC inside a subnegotiation
+
+# Nothing we understand needs a subnegotiation anywhere near this long, so
+# don't let a misbehaving client make us hold on to more than this
+MAX_SUBNEG = 1024
+
+class TelnetParser(object):
+    """Splits the bytes a telnet client sends us into plain text and telnet
+    commands.
+    
+    The parser remembers where it was between calls to feed(), so commands
+    that get split up across reads (which happens all the time, since TCP
+    doesn't care where our commands start and end) are still put back
+    together properly.
+    """
+    def __init__(self):
+        self.state = DATA
+        self.command = None
+        self.subneg = []
+    
+    def feed(self, data):
+        """Parse a chunk of bytes from the client.
+        Returns a tuple of (text, commands), where text is the plain text
+        that was in data, and commands is a list of the complete telnet
+        commands found, each one either (command, option) for option
+        negotiation (e.g. (WILL, NAWS)), or (SB, option, payload) for a
+        subnegotiation.
+        """
+        text = []
+        commands = []
+        i = 0
+        end = len(data)
+        while i < end:
+            if self.state == DATA:
+                # Skip straight to the next IAC, rather than looking at the
+                # text one byte at a time
+                iac = data.find(IAC, i)
+                if iac == -1:
+                    text.append(data[i:])
+                    break
+                text.append(data[i:iac])
+                self.state = COMMAND
+                i = iac + 1
+                continue
+            byte = data[i]
+            i += 1
+            if self.state == COMMAND:
+                if byte == IAC:
+                    # An escaped 255 byte
+                    text.append(IAC)
+                    self.state = DATA
+                elif byte in (WILL, WONT, DO, DONT):
+                    self.command = byte
+                    self.state = OPTION
+                elif byte == SB:
+                    self.subneg = []
+                    self.state = SUBNEG
+                else:
+                    # A command with no option (NOP, GA, etc.) - ignore it
+                    self.state = DATA
+            elif self.state == OPTION:
+                commands.append((self.command, byte))
+                self.state = DATA
+            elif self.state == SUBNEG:
+                if byte == IAC:
+                    self.state = SUBNEG_IAC
+                elif len(self.subneg) < MAX_SUBNEG:
+                    self.subneg.append(byte)
+            elif self.state == SUBNEG_IAC:
+                if byte == SE:
+                    if self.subneg:
+                        commands.append((SB, self.subneg[0],
+                                         ''.join(self.subneg[1:])))
+                    self.subneg = []
+                    self.state = DATA
+                else:
+                    # IAC IAC is an escaped 255 byte; anything else shouldn't
+                    # happen, so just keep the byte
+                    self.subneg.append(byte)
+                    self.state = SUBNEG
+        return ''.join(text), commands
+
+
+def parse_naws(payload):
+    """Return the (width, height) from a NAWS subnegotiation payload, or None
+    if the payload isn't valid.
+    """
+    if len(payload) != 4:
+        return None
+    return (ord(payload[0]) * 256 + ord(payload[1]),
+            ord(payload[2]) * 256 + ord(payload[3]))
@@ -0,0 +1,189 @@
+"""WebSocket (RFC 6455) handshake and framing, and the permessage-deflate
+extension (RFC 7692).
+"""
+from struct import pack, unpack_from
+import base64
+import hashlib
+
+# The magic string the client's key gets hashed with during the handshake
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Opcodes
+CONTINUATION = 0x0
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+# Control frames (close, ping and pong) can't be fragmented, and have to fit
+# in a single short frame (see RFC 6455, section 5.5)
+MAX_CONTROL_PAYLOAD = 125
+
+# The tail that a sync-flushed deflate block always ends with; it's left off
+# of compressed messages (see RFC 7692, section 7.2.1)
+DEFLATE_TAIL = '\x00\x00\xff\xff'
+
+# We only ever expect short commands from players, so anything bigger than
+# this (even after it's been decompressed) is a misbehaving client
+MAX_MESSAGE_SIZE = 65536
+
+HANDSHAKE_RESPONSE = ("HTTP/1.1 101 Switching Protocols\r\n"
+                      "Upgrade: websocket\r\n"
+                      "Connection: Upgrade\r\n"
+                      "Sec-WebSocket-Accept: %s\r\n")
+
+BAD_REQUEST = "HTTP/1.1 400 Bad Request\r\n\r\n"
+
+class WebsocketError(Exception):
+    """The client broke the protocol; the connection should be closed."""
+    pass
+
+
+def accept_key(key):
+    """Return the Sec-WebSocket-Accept value for the client's
+    Sec-WebSocket-Key.
+    """
+    return base64.b64encode(hashlib.sha1(key + GUID).digest())
+
+
+def parse_request(request):
+    """Parse the client's opening handshake (an HTTP request) into a dictionary
+    of lowercase-header-name:value. Raises WebsocketError if it isn't a valid
+    WebSocket handshake.
+    """
+    lines = request.split('\r\n')
+    if not lines[0].startswith('GET '):
+        raise WebsocketError('Handshake was not a GET request.')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            name = name.strip().lower()
+            if name in headers:
+                headers[name] += ', ' + value.strip()
+            else:
+                headers[name] = value.strip()
+    if 'websocket' not in headers.get('upgrade', '').lower():
+        raise WebsocketError('Handshake did not ask to upgrade to websocket.')
+    if 'sec-websocket-key' not in headers:
+        raise WebsocketError('Handshake had no Sec-WebSocket-Key.')
+    if headers.get('sec-websocket-version') != '13':
+        raise WebsocketError('Unsupported websocket version: %s' %
+                             headers.get('sec-websocket-version'))
+    return headers
+
+
+def negotiate_deflate(extensions):
+    """Look through the client's Sec-WebSocket-Extensions header for a
+    permessage-deflate offer we can accept.
+    Returns a tuple of (response, options), where response is the value we
+    should send back in our Sec-WebSocket-Extensions header and options is a
+    dictionary of the parameters that matter to us, or (None, None) if we
+    shouldn't use compression.
+    """
+    for offer in extensions.split(','):
+        params = [p.strip() for p in offer.split(';')]
+        if params[0] != 'permessage-deflate':
+            continue
+        options = {'wbits': 15, 'no_context_takeover': False}
+        response = ['permessage-deflate']
+        usable = True
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            name = name.strip()
+            value = value.strip().strip('"')
+            if name == 'server_no_context_takeover':
+                options['no_context_takeover'] = True
+                response.append(name)
+            elif name == 'server_max_window_bits':
+                # zlib can't write raw deflate streams with a window smaller
+                # than 2**9
+                if not value.isdigit() or not 9 <= int(value) <= 15:
+                    usable = False
+                    break
+                options['wbits'] = int(value)
+                response.append('%s=%s' % (name, value))
+            elif name not in ('client_no_context_takeover', 'client_max_window_bits'):
+                # Something we don't understand - try their next offer
+                usable = False
+                break
+        if usable:
+            return '; '.join(response), options
+    return None, None
+
+
+def encode_frame(opcode, payload, compressed=False):
+    """Return a complete, unfragmented frame (servers don't mask their
+    frames).
+    """
+    first = 0x80 | opcode
+    if compressed:
+        first |= 0x40
+    length = len(payload)
+    if length < 126:
+        header = pack('!BB', first, length)
+    elif length < 65536:
+        header = pack('!BBH', first, 126, length)
+    else:
+        header = pack('!BBQ', first, 127, length)
+    return header + payload
+
+
+class FrameParser(object):
+    """Pulls whole frames out of the bytes a WebSocket client sends us.
+    
+    Incoming bytes get added to a bytearray buffer, and frames are sliced out
+    of it with a memoryview once they're complete, so partial frames just
+    wait in the buffer for the rest of their bytes.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+    
+    def feed(self, data):
+        """Add data to the buffer, and return a list of the complete frames
+        in it, each one a tuple of (fin, rsv1, opcode, payload), where payload
+        is an (unmasked) bytearray.
+        """
+        self.buffer.extend(data)
+        frames = []
+        view = memoryview(self.buffer)
+        pos = 0
+        end = len(self.buffer)
+        while end - pos >= 2:
+            first, second = self.buffer[pos], self.buffer[pos + 1]
+            if not second & 0x80:
+                raise WebsocketError('Client sent an unmasked frame.')
+            length = second & 0x7F
+            header = 2
+            if length == 126:
+                if end - pos < 4:
+                    break
+                length = unpack_from('!H', self.buffer, pos + 2)[0]
+                header = 4
+            elif length == 127:
+                if end - pos < 10:
+                    break
+                length = unpack_from('!Q', self.buffer, pos + 2)[0]
+                header = 10
+            if length > MAX_MESSAGE_SIZE:
+                raise WebsocketError('Client sent a frame that was too big.')
+            if first & 0x08:
+                if not first & 0x80:
+                    raise WebsocketError('Client sent a fragmented control frame.')
+                if length > MAX_CONTROL_PAYLOAD:
+                    raise WebsocketError('Client sent a control frame that was too big.')
+            if end - pos < header + 4 + length:
+                break
+            mask = self.buffer[pos + header:pos + header + 4]
+            start = pos + header + 4
+            payload = bytearray(view[start:start + length])
+            for i in xrange(length):
+                payload[i] ^= mask[i & 3]
+            frames.append((bool(first & 0x80), bool(first & 0x40), first & 0x0F,
+                           payload))
+            pos = start + length
+        del view
+        if pos:
+            del self.buffer[:pos]
+        return frames
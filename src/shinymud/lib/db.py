@@ -1,18 +1,214 @@
-from shinymud.data.config import DB_NAME
+from shinymud.data.config import DB_NAME, DB_SLOW_QUERY_MS, DB_EXPLAIN_SCANS
+from shinymud.lib.query_stats import QueryStats
 
+from itertools import imap, izip, repeat
+import logging
 import sqlite3
+import threading
+import time
+import Queue
 import re
 
+# Parameter types sqlite can bind as they are. Anything else (including
+# bytestrings, which sqlite won't take unless they're plain ascii) gets
+# turned into unicode first, the way every parameter used to be
+PARAM_TYPES = frozenset([unicode, int, long, float, bool, type(None), buffer])
+
+# The names a select reads from (tables, and the odd common table expression)
+READ_TABLES = re.compile(r'\b(?:from|join)\s+(\w+)', re.IGNORECASE)
+# The table an update (without the "update") writes to
+UPDATE_TABLE = re.compile(r'^\s*(\w+)')
+
+# The pragmas a storage profile (see DB_PROFILE in the config) can set, in the
+# order they're set in
+PROFILE_PRAGMAS = ['journal_mode', 'synchronous', 'cache_size', 'mmap_size',
+                   'temp_store']
+
+def apply_profile(conn, profile):
+    """Set the pragmas in profile (a dictionary of pragma-name:value) on conn.
+    Returns a dictionary of the values actually in effect afterwards, since
+    sqlite quietly ignores some settings (an in-memory database can't use WAL,
+    for example).
+    """
+    in_effect = {}
+    for name in PROFILE_PRAGMAS:
+        if profile.get(name) is not None:
+            conn.execute('PRAGMA %s = %s' % (name, profile[name]))
+        row = conn.execute('PRAGMA %s' % name).fetchone()
+        in_effect[name] = row[0] if row else None
+    return in_effect
+
+
+class Future(object):
+    """The result of a write that's waiting its turn in a DBWriter's queue."""
+    def __init__(self):
+        self.finished = threading.Event()
+        self.value = None
+        self.error = None
+    
+    def set_result(self, value):
+        self.value = value
+        self.finished.set()
+    
+    def set_exception(self, error):
+        self.error = error
+        self.finished.set()
+    
+    def done(self):
+        return self.finished.is_set()
+    
+    def result(self):
+        """Wait for the write to happen, then return its result (or raise the
+        exception it raised).
+        """
+        self.finished.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+    
+
+class DBWriter(threading.Thread):
+    """A thread that owns its own connection to the database, and runs every
+    write it's given on it, one at a time, in the order they were submitted.
+    
+    This keeps the world thread from waiting on sqlite to commit (which can
+    take a long time on a slow disk); the world only waits when it needs the
+    result of a write, like the id of a new row.
+    """
+    def __init__(self, path, log, foreign_keys=True, profile={}):
+        threading.Thread.__init__(self, name='DBWriter')
+        # Don't keep the server from exiting if it dies without stopping us
+        self.daemon = True
+        self.log = log
+        self.queue = Queue.Queue()
+        # The connection is only ever used by our thread, but it's opened here
+        # so that any problems with it show up straight away
+        self.conn = sqlite3.Connection(path, check_same_thread=False)
+        if foreign_keys:
+            self.conn.execute('PRAGMA foreign_keys = true')
+        apply_profile(self.conn, profile)
+    
+    def submit(self, func, args):
+        """Queue func(connection, *args) to be run on the writer's connection.
+        Returns a Future for its result.
+        """
+        future = Future()
+        self.queue.put((func, args, future))
+        return future
+    
+    def sync(self):
+        """Wait until everything submitted so far has been written."""
+        self.queue.join()
+    
+    def stop(self):
+        """Write everything that's been submitted, then stop the thread."""
+        self.queue.put((None, None, None))
+        self.join()
+    
+    def run(self):
+        while True:
+            func, args, future = self.queue.get()
+            try:
+                if func is None:
+                    break
+                try:
+                    future.set_result(func(self.conn, *args))
+                except Exception as e:
+                    self.log.error('Database write failed: ' + str(e))
+                    future.set_exception(e)
+            finally:
+                self.queue.task_done()
+        self.conn.close()
+    
+
+def stop_autocheckpoints(conn):
+    """Stop sqlite from checkpointing on its own when commits on conn fill up
+    the log (because a DBCheckpointer is doing it instead).
+    """
+    conn.execute('PRAGMA wal_autocheckpoint = 0')
+
+
+class DBCheckpointer(threading.Thread):
+    """Checkpoints a WAL-mode database every interval seconds, from its own
+    thread and connection, so that neither the world nor the DBWriter has to
+    stop and do it when the log fills up.
+    """
+    def __init__(self, path, log, interval):
+        threading.Thread.__init__(self, name='DBCheckpointer')
+        self.daemon = True
+        self.log = log
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.checkpoints = 0
+        self.conn = sqlite3.Connection(path, check_same_thread=False)
+    
+    def checkpoint(self):
+        """Copy as much of the log back into the database as we can without
+        waiting for anyone.
+        """
+        try:
+            busy, frames, done = self.conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+        except sqlite3.Error as e:
+            self.log.error('Database checkpoint failed: ' + str(e))
+        else:
+            self.checkpoints += 1
+            self.log.debug('Checkpointed %s of %s log frames.' % (done, frames))
+    
+    def stop(self):
+        """Do one last checkpoint, then stop the thread."""
+        self.stopped.set()
+        self.join()
+    
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.checkpoint()
+        self.checkpoint()
+        self.conn.close()
+    
+
 class DB(object):
-    def __init__(self, logger, conn=None):
+    def __init__(self, logger, conn=None, profile=None):
+        # The file the database lives in, so that a DBWriter can open its own
+        # connection to it (None if we were handed a connection)
+        self.path = None
         if conn:
             if isinstance(conn, basestring):
+                self.path = conn
                 self.conn = sqlite3.Connection(conn)
             else:
                 self.conn = conn
         else:
+            self.path = DB_NAME
             self.conn = sqlite3.Connection(DB_NAME)
         self.log = logger
+        # Call counts and timings of every statement we run
+        self.query_stats = QueryStats(logger, DB_SLOW_QUERY_MS, DB_EXPLAIN_SCANS)
+        # The storage profile we were asked for, and the pragmas actually in
+        # effect
+        self.profile_settings = profile or {}
+        self.profile = apply_profile(self.conn, self.profile_settings)
+        self.checkpointer = None
+        # When there's a writer, inserts, updates and deletes are handed to it
+        # and self.conn is only used for reading (see start_writer)
+        self.writer = None
+        # table:the Future of the last write to it handed to the writer, so a
+        # select only has to wait for the writes to the tables it reads (see
+        # wait_for_writes). Writes that could touch any table (deletes can
+        # cascade) are kept under '*'.
+        self.pending_writes = {}
+        # (table, column):{value:[rows]} for child rows fetched ahead of time,
+        # so that loading lots of objects doesn't take a query for each one
+        # (see preload)
+        self.preloaded = {}
+        # When write_behind is on, models that already have a row in the
+        # database don't update it every time they're saved; they're added to
+        # self.dirty instead, and written all at once by flush()
+        self.write_behind = False
+        self.dirty = set()
+        # The tables that (might) have models in self.dirty
+        self.dirty_tables = set()
+        # query:the set of tables it reads (see read_tables)
+        self.read_tables_cache = {}
     
     def insert(self, query, params=None):
         """    Insert a new row into a table.
@@ -24,26 +220,18 @@ class DB(object):
             db = DB()
             new_id = db.insert("into table mytable (field1, field2...) values (?, ?...)", [val1, val2...])
         """
-        cursor = self.conn.cursor()
-        self.log.debug(query + ' ' + repr(params))
-        try:
-            if params:
-                cursor.execute("insert " + query, params)
-            else:
-                cursor.execute("insert " + query)
-        except Exception as e:
-            self.conn.rollback()
-            raise Exception(str(e) + '\n%s\n%s' % (query, repr(params)))
-        else:
-            new_id = cursor.lastrowid
-            self.conn.commit()
-            return new_id
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(query + ' ' + repr(params))
+        # Whoever's inserting needs the new id, so wait for it even if there's
+        # a writer
+        return self.write(True, self._execute, "insert " + query, params, 'lastrowid')
     
     def insert_from_dict(self, table, d):
         query = "INTO " + table + " "
         keys = []
         values = []
-        self.log.debug("INSERTING: " + str(d))
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("INSERTING: " + str(d))
         for key,val in d.items():
             keys.append(key)
             values.append(val)
@@ -64,34 +252,124 @@ class DB(object):
             print rows
             > [{'field1': somevalue, 'field2', someothervalue...}, {'field1':...}...]
         """
-        self.log.debug(query + ' ' + repr(params))
+        tables = self.read_tables(query)
+        if self.dirty_tables and (tables is None or tables & self.dirty_tables):
+            # Make sure we read back what's been saved, but leave the models
+            # that don't live in the tables we're reading to the next flush
+            self.flush(tables)
+        if self.writer:
+            self.wait_for_writes(tables)
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(query + ' ' + repr(params))
         cursor = self.conn.cursor()
+        start = time.time()
         if params:
-            params = [unicode(p) for p in params]
-            cursor.execute(u"select " + unicode(query), params)
+            query = u"select " + unicode(query)
+            # Keep numbers as numbers, so that comparing them against integer
+            # columns (like dbid and owner) doesn't need a conversion
+            params = [p if type(p) in PARAM_TYPES else unicode(p) for p in params]
+            cursor.execute(query, params)
         else:
-            cursor.execute("select " + query)
+            query = "select " + query
+            cursor.execute(query)
+        # Build a dictionary from each row as the cursor hands it to us,
+        # zipping it with the column names entirely in C instead of indexing
+        # both in python
         keys = [_[0] for _ in cursor.description]
-        rows = [dict([(keys[i], vals[i]) for i in range(len(keys))]) for vals in cursor.fetchall()]
+        rows = map(dict, imap(izip, repeat(keys), cursor))
+        self.measure(self.conn, query, params, start)
         return rows
     
+    def read_tables(self, query):
+        """Return the set of (lowercase) table names query (a select, without
+        the "select") reads from, or None if we can't tell.
+        """
+        tables = self.read_tables_cache.get(query)
+        if tables is None:
+            tables = set([name.lower() for name in READ_TABLES.findall(query)]) or None
+            if tables is not None and len(self.read_tables_cache) < 10000:
+                self.read_tables_cache[query] = tables
+        return tables
+    
+    def wait_for_writes(self, tables):
+        """Wait until the writer has written everything that's been handed to
+        it for tables (or everything at all, if tables is None), so a select
+        reads back what's been saved without waiting on unrelated writes.
+        """
+        if tables is None:
+            self.writer.sync()
+            self.pending_writes = {}
+            return
+        for table in list(tables) + ['*']:
+            future = self.pending_writes.get(table)
+            if future is not None:
+                # The writer logs any errors; the select doesn't care
+                future.finished.wait()
+                if self.pending_writes.get(table) is future:
+                    del self.pending_writes[table]
+    
+    def remember_write(self, future, tables):
+        """Remember that future is the latest write to tables (see
+        wait_for_writes). The writer writes in order, so once it's done,
+        every earlier write to those tables is too.
+        """
+        for table in tables:
+            self.pending_writes[table] = future
+    
+    def measure(self, conn, query, params, start):
+        """Record how long query (which started at start) took to run on conn,
+        and check its query plan if we're looking for full table scans.
+        """
+        statement = self.query_stats.record(query, time.time() - start)
+        if self.query_stats.explain:
+            self.query_stats.check_plan(conn, query, params, statement)
+    
+    def preload(self, table, column, query, params=None):
+        """Fetch rows from table with a single select, and group them by
+        column, so that select_related can hand them out without going back
+        to the database.
+        column -- the column to group by, or a list of columns to group the
+            same rows by each of (e.g. game items by both owner and container)
+        query -- the select to run (e.g. "room_exit.* FROM room_exit JOIN ...");
+            it should only return rows from table.
+        Preloading the same table again (e.g. in batches) adds to its rows.
+        Returns the number of rows fetched.
+        """
+        if isinstance(column, basestring):
+            column = [column]
+        rows = self.select(query, params)
+        for col in column:
+            groups = self.preloaded.setdefault((table, col), {})
+            for row in rows:
+                groups.setdefault(unicode(row[col]), []).append(row)
+        return len(rows)
+    
+    def select_related(self, table, column, value):
+        """Return the rows of table where column is value (e.g. all of a
+        room's exits). If the table has been preloaded, the rows come from
+        memory (and are handed out only once); otherwise they're selected.
+        """
+        groups = self.preloaded.get((table, column))
+        if groups is None:
+            return self.select('* FROM %s WHERE %s=?' % (table, column), [value])
+        return groups.pop(unicode(value), [])
+    
+    def clear_preloaded(self):
+        """Forget about any preloaded rows that weren't used."""
+        self.preloaded = {}
+    
     def update(self, query, params=None):
         """    Change data in the database.
         If successful, returns the number of rows updated (may be zero if no matches).
         If there is a problem with the query, it will raise an exception.
+        If there's a writer, returns a Future for the number of rows instead,
+        and problems are logged by the writer.
         """
-        cursor = self.conn.cursor()
-        try:
-            if params:
-                cursor.execute("update " + query, params)
-            else:
-                cursor.execute("update " + query)
-        except Exception as e:
-            self.conn.rollback()
-            raise Exception(str(e) + '\n%s\n%s' % (query, repr(params)))
-        else:
-            self.conn.commit()
-            return cursor.rowcount
+        future = self.write(False, self._execute, "update " + query, params, 'rowcount')
+        if self.writer:
+            match = UPDATE_TABLE.match(query)
+            self.remember_write(future, [match.group(1).lower() if match else '*'])
+        return future
     
     def update_from_dict(self, table, d):
         if 'dbid' in d:
@@ -104,7 +382,8 @@ class DB(object):
                     values.append(val)
             query = query + ','.join(attributes) + " WHERE dbid=?"
             values.append(d['dbid'])
-            self.log.debug('Updating %s: \n%s' % (table, query))
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug('Updating %s: \n%s' % (table, query))
             return self.update(query, values)
         else:
             raise Exception("Cannot update unsaved entity.")
@@ -113,17 +392,190 @@ class DB(object):
         """    Delete rows from a table.
         If successful, returns the number of rows deleted (may be zero if no matches).
         If there is a problem with the query, it will raise an exception.
+        If there's a writer, returns a Future for the number of rows instead,
+        and problems are logged by the writer.
         """
-        cursor = self.conn.cursor()
+        future = self.write(False, self._execute, "delete " + query, params, 'rowcount')
+        if self.writer:
+            # Deleting a row can cascade into other tables
+            self.remember_write(future, ['*'])
+        return future
+    
+    def _execute(self, conn, query, params, result):
+        """Run a single statement on conn and commit it. Returns the cursor
+        attribute named by result (lastrowid or rowcount).
+        """
+        cursor = conn.cursor()
+        start = time.time()
         try:
             if params:
-                cursor.execute("delete " + query, params)
+                cursor.execute(query, params)
             else:
-                cursor.execute("delete " + query)
+                cursor.execute(query)
         except Exception as e:
-            self.conn.rollback()
+            conn.rollback()
             raise Exception(str(e) + '\n%s\n%s' % (query, repr(params)))
         else:
-            self.conn.commit()
-            return cursor.rowcount
+            conn.commit()
+            self.measure(conn, query, params, start)
+            return getattr(cursor, result)
+    
+    def update_many(self, batch):
+        """Run a batch of updates in a single transaction.
+        batch -- a list of (table, rows) pairs, where rows is a list of
+            dictionaries of column-name:value that all have the same keys,
+            including dbid. Each table's rows go to the database in one
+            executemany call.
+        Returns the number of rows updated (or a Future for it, if there's a
+        writer).
+        """
+        future = self.write(False, self._update_many, batch)
+        if self.writer:
+            self.remember_write(future, [table.lower() for table, rows in batch])
+        return future
     
+    def _update_many(self, conn, batch):
+        cursor = conn.cursor()
+        count = 0
+        try:
+            for table, rows in batch:
+                keys = [key for key in rows[0] if key != 'dbid']
+                query = "update %s SET %s WHERE dbid=?" % (table,
+                        ','.join([key + "=?" for key in keys]))
+                if self.log.isEnabledFor(logging.DEBUG):
+                    self.log.debug('Updating %s %s rows: \n%s' % (len(rows), table, query))
+                params = [[row[key] for key in keys] + [row['dbid']] for row in rows]
+                start = time.time()
+                cursor.executemany(query, params)
+                self.measure(conn, query, params[0], start)
+                count += cursor.rowcount
+        except Exception as e:
+            conn.rollback()
+            raise Exception(str(e) + '\n%s' % query)
+        else:
+            conn.commit()
+            return count
+    
+    def write(self, wait, func, *args):
+        """Run func(connection, *args), either right now on our own connection,
+        or on the writer's connection once everything before it has been
+        written.
+        If there's a writer and wait is False, returns a Future for the result
+        instead of the result itself.
+        """
+        if self.writer is None:
+            return func(self.conn, *args)
+        future = self.writer.submit(func, args)
+        if wait:
+            return future.result()
+        return future
+    
+    def start_writer(self):
+        """Hand all of our writes over to a DBWriter thread from now on.
+        Returns False if we can't (an in-memory database can't be shared with
+        another connection).
+        """
+        if self.writer:
+            return True
+        if not self.path or self.path == ':memory:':
+            self.log.warning('Cannot start a database writer for %s.' % self.path)
+            return False
+        self.conn.commit()
+        foreign_keys = self.conn.execute('PRAGMA foreign_keys').fetchone()[0]
+        self.writer = DBWriter(self.path, self.log, bool(foreign_keys),
+                               self.profile_settings)
+        self.writer.start()
+        if self.checkpointer:
+            self.write(False, stop_autocheckpoints)
+        return True
+    
+    def stop_writer(self):
+        """Write out everything that's waiting to be written (including dirty
+        models), then stop the writer thread, if there is one.
+        """
+        self.flush()
+        if self.writer:
+            writer = self.writer
+            self.writer = None
+            writer.stop()
+            self.pending_writes = {}
+    
+    def start_checkpoints(self, interval):
+        """Checkpoint the database from a DBCheckpointer thread every interval
+        seconds, instead of letting sqlite do it whenever a commit fills up the
+        log. Only works for WAL-mode databases; returns False otherwise.
+        """
+        if self.checkpointer:
+            return True
+        if not interval or not self.path or self.profile.get('journal_mode') != 'wal':
+            return False
+        stop_autocheckpoints(self.conn)
+        if self.writer:
+            self.write(False, stop_autocheckpoints)
+        self.checkpointer = DBCheckpointer(self.path, self.log, interval)
+        self.checkpointer.start()
+        return True
+    
+    def stop_checkpoints(self):
+        """Stop the DBCheckpointer thread (after one last checkpoint), if there
+        is one.
+        """
+        if self.checkpointer:
+            checkpointer = self.checkpointer
+            self.checkpointer = None
+            checkpointer.stop()
+    
+    def profile_report(self):
+        """Return a line describing the storage profile in effect."""
+        settings = ', '.join(['%s=%s' % (name, self.profile[name]) for name in PROFILE_PRAGMAS])
+        if self.checkpointer:
+            settings += ', checkpoint every %ss' % self.checkpointer.interval
+        return 'Database %s: %s' % (self.path or 'connection', settings)
+    
+    def mark_dirty(self, model):
+        """Remember that model needs to be written to the database (see
+        flush).
+        """
+        self.dirty.add(model)
+        self.dirty_tables.add(model.db_table_name)
+    
+    def discard(self, model):
+        """Forget about any unwritten changes to model (it's being deleted)."""
+        self.dirty.discard(model)
+    
+    def flush(self, tables=None):
+        """Write the changed columns of every dirty model (or only the ones
+        that live in tables, a set of table names) to the database in a single
+        transaction.
+        Returns the number of models that actually had changes to write.
+        """
+        if not self.dirty:
+            self.dirty_tables = set()
+            return 0
+        if tables is None:
+            dirty = self.dirty
+            self.dirty = set()
+            self.dirty_tables = set()
+        else:
+            dirty = set([model for model in self.dirty if model.db_table_name in tables])
+            self.dirty -= dirty
+            self.dirty_tables = set([model.db_table_name for model in self.dirty])
+        groups = {}
+        written = []
+        for model in dirty:
+            if not model.dbid:
+                continue
+            save_dict, changes = model.changed_save_dict()
+            if not save_dict:
+                continue
+            key = (model.db_table_name, tuple(sorted(save_dict)))
+            groups.setdefault(key, []).append(save_dict)
+            written.append((model, changes))
+        if groups:
+            # If there's a writer, this only waits for the updates to be
+            # queued; the changes are already as good as saved, since
+            # everything after this will be written after them
+            self.update_many([(table, rows) for (table, _), rows in groups.items()])
+            for model, changes in written:
+                model.mark_saved(changes)
+        return len(written)
@@ -0,0 +1,58 @@
+from collections import deque
+
+class NpcScheduler(object):
+    """Decides which npcs get to act each turn.
+    
+    Npcs that have commands waiting to run (or events that just fired) are
+    subscribed to the scheduler, and each turn the world calls run(), which
+    goes round-robin over the subscribed npcs and runs one command for each
+    of them. An npc is only ever in the queue once no matter how many times it
+    gets subscribed, so a chatty room can't make an npc act more than once a
+    turn.
+    
+    The number of commands run in a turn is capped by a budget, so that a
+    flood of scripts can't stall the whole world. Npcs that don't get to act
+    before the budget runs out stay at the front of the queue, and get to go
+    first next turn.
+    """
+    def __init__(self, budget=0):
+        # The most npc commands to run in one turn (0 means no limit)
+        self.budget = budget
+        self.queue = deque()
+        self.members = set()
+    
+    def __len__(self):
+        return len(self.queue)
+    
+    def __contains__(self, npc):
+        return npc in self.members
+    
+    def subscribe(self, npc):
+        """Give npc a turn to act (if it doesn't have one coming already)."""
+        if npc not in self.members:
+            self.members.add(npc)
+            self.queue.append(npc)
+    
+    def run(self, budget=None):
+        """Run one command for each npc in the queue, up to budget commands
+        in total (the scheduler's own budget if none is given).
+        Returns the number of commands that were run.
+        """
+        if budget is None:
+            budget = self.budget
+        ran = 0
+        # Only look at the npcs that were in line when the turn started; npcs
+        # that subscribe (or are put back in line) while we're running wait
+        # until next turn
+        for _ in xrange(len(self.queue)):
+            if budget and ran >= budget:
+                break
+            npc = self.queue.popleft()
+            if npc.do_tick():
+                ran += 1
+            if npc.cmdq:
+                # Still has things to do, so back of the line
+                self.queue.append(npc)
+            else:
+                self.members.discard(npc)
+        return ran
@@ -0,0 +1,90 @@
+from collections import deque
+import json
+import math
+import time
+
+class TickProfiler(object):
+    """Keeps rolling timings of each phase of the world's turn.
+    
+    The world calls record() at the end of each phase of its turn, and the
+    TickProfiler keeps the durations of the last window_size turns for each
+    phase so we can get percentiles out of them (see stats()) to see which
+    part of the turn is slow under load.
+    """
+    def __init__(self, window_size=240):
+        self.window_size = window_size
+        self.phases = {}
+        # Keep track of the order phases were first seen in, so they are
+        # displayed in the order they happen in
+        self.phase_order = []
+        self.turns = 0
+    
+    def record(self, phase, since):
+        """Record that phase took from since until now.
+        Returns now, so that it can be passed as since to the next phase.
+        """
+        now = time.time()
+        timings = self.phases.get(phase)
+        if timings is None:
+            timings = deque(maxlen=self.window_size)
+            self.phases[phase] = timings
+            self.phase_order.append(phase)
+        timings.append(now - since)
+        return now
+    
+    def end_turn(self, since):
+        """Record the total time of a turn that started at since."""
+        self.turns += 1
+        return self.record('turn', since)
+    
+    def reset(self):
+        """Throw away all of the timings we have collected so far."""
+        self.phases = {}
+        self.phase_order = []
+        self.turns = 0
+    
+    def stats(self):
+        """Return a dictionary of phase-name:statistics, where statistics is
+        a dictionary of the p50, p95, p99, and max of that phase's durations
+        over the window (in milliseconds), along with the number of samples.
+        """
+        stats = {}
+        for phase in self.phase_order:
+            samples = sorted(self.phases[phase])
+            stats[phase] = {'count': len(samples),
+                            'p50': percentile(samples, 50) * 1000,
+                            'p95': percentile(samples, 95) * 1000,
+                            'p99': percentile(samples, 99) * 1000,
+                            'max': samples[-1] * 1000}
+        return stats
+    
+    def dump(self):
+        """Return the statistics as a JSON string."""
+        return json.dumps({'window': self.window_size,
+                           'turns': self.turns,
+                           'phases': self.stats()}, sort_keys=True)
+    
+    def display(self):
+        """Return the statistics as a table for an admin to read."""
+        header = ' Tick Stats (last %s turns) ' % min(self.turns, self.window_size)
+        lines = [header.center(50, '-')]
+        lines.append('%-15s %8s %8s %8s %8s' % ('phase (ms)', 'p50', 'p95', 'p99', 'max'))
+        stats = self.stats()
+        for phase in self.phase_order:
+            s = stats[phase]
+            lines.append('%-15s %8.2f %8.2f %8.2f %8.2f' % (phase, s['p50'], s['p95'],
+                                                          s['p99'], s['max']))
+        if not self.phase_order:
+            lines.append('No turns have been timed yet.')
+        lines.append('-' * 50)
+        return '\n'.join(lines)
+
+
+def percentile(samples, p):
+    """Return the p-th percentile of a list of sorted samples (nearest-rank
+    method), or 0 if there are no samples.
+    """
+    if not samples:
+        return 0
+    rank = int(math.ceil(p / 100.0 * len(samples)))
+    return samples[max(0, rank - 1)]
@@ -0,0 +1,178 @@
+from collections import deque
+import json
+import re
+import threading
+import time
+
+# Literal values, so that statements that only differ by them (like ids
+# formatted into the SQL) are counted together
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+class QueryStats(object):
+    """Keeps call counts and timings for each statement the database runs.
+    
+    Statements are normalised (literals replaced with ?, whitespace collapsed)
+    so that the same query with different values is counted as one statement.
+    Statements slower than slow_ms are logged and kept in a short list, and if
+    explain is on, the query plan of each new statement is checked once, and
+    the ones that scan a whole table are remembered (see scans) - those are
+    usually a missing index or an N+1 pattern waiting to happen.
+    """
+    def __init__(self, log, slow_ms=100, explain=False, slow_size=20):
+        self.log = log
+        self.slow_ms = slow_ms
+        self.explain = explain
+        # statement:[calls, total seconds, max seconds]
+        self.statements = {}
+        # The most recent slow statements, as (when, milliseconds, statement)
+        self.slow = deque(maxlen=slow_size)
+        # statement:query plan, for statements that scan a whole table
+        self.scans = {}
+        # Statements whose query plans have already been checked
+        self.explained = set()
+        # Statements can be run from the world thread and a DBWriter at the
+        # same time
+        self.lock = threading.Lock()
+        # query:statement, so that each query only gets normalised once
+        self.normalised = {}
+    
+    def normalise(self, query):
+        """Return query with its literals replaced with ? and its whitespace
+        collapsed.
+        """
+        statement = self.normalised.get(query)
+        if statement is None:
+            statement = STRING_LITERAL.sub('?', query)
+            statement = NUMBER_LITERAL.sub('?', statement)
+            statement = ' '.join(statement.split())
+            if len(self.normalised) < 10000:
+                self.normalised[query] = statement
+        return statement
+    
+    def record(self, query, seconds):
+        """Record that query took seconds to run.
+        Returns the normalised statement.
+        """
+        statement = self.normalise(query)
+        with self.lock:
+            stats = self.statements.get(statement)
+            if stats is None:
+                self.statements[statement] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                if seconds > stats[2]:
+                    stats[2] = seconds
+            ms = seconds * 1000
+            slow = ms >= self.slow_ms
+            if slow:
+                self.slow.append((time.time(), ms, statement))
+        if slow:
+            self.log.warning('Slow query (%.1f ms): %s' % (ms, statement))
+        return statement
+    
+    def check_plan(self, conn, query, params, statement):
+        """Look at the query plan for query (the first time we see its
+        statement), and remember it if it scans a whole table.
+        """
+        with self.lock:
+            if statement in self.explained:
+                return
+            self.explained.add(statement)
+        try:
+            if params:
+                rows = conn.execute('EXPLAIN QUERY PLAN ' + query, params).fetchall()
+            else:
+                rows = conn.execute('EXPLAIN QUERY PLAN ' + query).fetchall()
+        except Exception as e:
+            self.log.debug('Could not explain %s: %s' % (statement, str(e)))
+            return
+        details = [row[-1] for row in rows]
+        if [d for d in details if d.startswith('SCAN') and 'INDEX' not in d]:
+            plan = '; '.join(details)
+            with self.lock:
+                self.scans[statement] = plan
+            self.log.warning('Full table scan: %s (%s)' % (statement, plan))
+    
+    def reset(self):
+        """Throw away all of the statistics collected so far."""
+        with self.lock:
+            self.statements = {}
+            self.slow.clear()
+            self.scans = {}
+            self.explained = set()
+    
+    def stats(self):
+        """Return a list of dictionaries with the calls, total, mean and max
+        times (in milliseconds) of each statement, slowest total first.
+        """
+        with self.lock:
+            items = [(statement, list(s)) for statement, s in self.statements.items()]
+        stats = [{'statement': statement,
+                  'calls': calls,
+                  'total': total * 1000,
+                  'mean': total * 1000 / calls,
+                  'max': most * 1000} for statement, (calls, total, most) in items]
+        stats.sort(key=lambda s: s['total'], reverse=True)
+        return stats
+    
+    def dump(self):
+        """Return the statistics as a JSON string."""
+        with self.lock:
+            slow = list(self.slow)
+            scans = dict(self.scans)
+        return json.dumps({'statements': self.stats(),
+                           'slow': [{'time': when, 'ms': ms, 'statement': statement}
+                                    for when, ms, statement in slow],
+                           'scans': scans}, sort_keys=True)
+    
+    def display(self, limit=15):
+        """Return the limit statements with the most total time as a table for
+        an admin to read.
+        """
+        stats = self.stats()
+        with self.lock:
+            slow, scans = len(self.slow), len(self.scans)
+        lines = [' Query Stats '.center(70, '-')]
+        lines.append('%8s %10s %8s %8s  %s' % ('calls', 'total ms', 'mean', 'max',
+                                               'statement'))
+        for s in stats[:limit]:
+            lines.append('%8s %10.1f %8.2f %8.2f  %s' % (s['calls'], s['total'], s['mean'],
+                                                       s['max'], s['statement']))
+        if not stats:
+            lines.append('No queries have been run yet.')
+        elif len(stats) > limit:
+            lines.append('(%s more statements)' % (len(stats) - limit))
+        lines.append('%s slow queries (over %s ms), %s statements that scan whole tables.' %
+                     (slow, self.slow_ms, scans))
+        lines.append('-' * 70)
+        return '\n'.join(lines)
+    
+    def display_slow(self):
+        """Return the most recent slow statements, newest first."""
+        with self.lock:
+            slow = list(self.slow)
+        lines = [(' Slow Queries (over %s ms) ' % self.slow_ms).center(70, '-')]
+        for when, ms, statement in reversed(slow):
+            lines.append('%s %8.1f ms  %s' % (time.strftime('%H:%M:%S', time.localtime(when)),
+                                               ms, statement))
+        if not slow:
+            lines.append('No slow queries.')
+        lines.append('-' * 70)
+        return '\n'.join(lines)
+    
+    def display_scans(self):
+        """Return the statements that scan whole tables, with their plans."""
+        with self.lock:
+            scans = sorted(self.scans.items())
+        lines = [' Full Table Scans '.center(70, '-')]
+        if not self.explain:
+            lines.append('Query plans are not being checked (see DB_EXPLAIN_SCANS).')
+        for statement, plan in scans:
+            lines.append(statement)
+            lines.append('    ' + plan)
+        if self.explain and not scans:
+            lines.append('No statements have scanned a whole table.')
+        lines.append('-' * 70)
+        return '\n'.join(lines)
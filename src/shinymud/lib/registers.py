@@ -15,6 +15,10 @@ class ModelRegister(object):
         self.models = {}
 
     def register(self, model):
+        """Register model, and give it its own versions of the Model
+        methods that go through every column (see Model.compile_columns).
+        """
+        model.compile_columns()
         self.models[model.db_table_name] = model
     
     def values(self):
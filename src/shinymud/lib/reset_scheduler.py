@@ -0,0 +1,79 @@
+from collections import deque
+import heapq
+import itertools
+import time
+
+class ResetScheduler(object):
+    """Keeps track of when areas are due to be reset.
+    
+    Areas are kept in a priority queue (a heap) ordered by the time they are
+    next due to be reset, so the world only has to look at the front of the
+    queue each turn instead of checking every area it has.
+    
+    An area gets scheduled when it is first visited after a reset (see
+    Area.visit), and is due reset_interval seconds after its last reset.
+    Rescheduling or unscheduling an area doesn't dig its old entry out of the
+    heap; the old entry is just skipped when it gets to the front, since it no
+    longer matches the area's next_reset time.
+    """
+    def __init__(self):
+        self.queue = []
+        # Breaks ties between areas that are due at the same time, so we never
+        # end up comparing the areas themselves
+        self.counter = itertools.count()
+        # Areas that are part-way through an incremental reset
+        self.in_progress = deque()
+    
+    def __len__(self):
+        return len(self.queue)
+    
+    def schedule(self, area):
+        """Schedule area to be reset at the end of its reset interval."""
+        area.next_reset = area.time_of_last_reset + area.get_reset_interval()
+        heapq.heappush(self.queue, (area.next_reset, self.counter.next(), area))
+    
+    def unschedule(self, area):
+        """Make sure area doesn't get reset by the scheduler."""
+        area.next_reset = None
+    
+    def pop_due(self, now):
+        """Remove and return a list of the areas that are due to be reset by
+        time now.
+        """
+        due = []
+        while self.queue and self.queue[0][0] <= now:
+            deadline, _, area = heapq.heappop(self.queue)
+            # Skip entries that have been rescheduled or unscheduled since
+            # they were pushed
+            if area.next_reset == deadline:
+                area.next_reset = None
+                due.append(area)
+        return due
+    
+    def begin_reset(self, area, occupied='first'):
+        """Start resetting area a few rooms at a time (see run_resets), rather
+        than all at once.
+        occupied -- 'first' to reset rooms with players in them before the
+        empty ones, or 'last' to leave them until the end.
+        """
+        area.begin_reset(occupied)
+        if area not in self.in_progress:
+            self.in_progress.append(area)
+    
+    def run_resets(self, budget):
+        """Reset rooms from the areas that are part-way through an incremental
+        reset until budget seconds have passed (at least one room is always
+        reset, so that resets keep moving no matter how small the budget is).
+        Return a list of the areas that finished resetting.
+        """
+        finished = []
+        deadline = time.time() + budget
+        while self.in_progress:
+            area = self.in_progress[0]
+            if not area.reset_next_room():
+                self.in_progress.popleft()
+                finished.append(area)
+            if time.time() >= deadline:
+                break
+        return finished
+
@@ -27,6 +27,8 @@ def initialize_database():
         for col in mod.db_columns:
             if col.name not in EXISTING_TABLES[mod.db_table_name]:
                 add_column(mod, col.name)
+    for mod in model_list.values():
+        create_indexes(mod)
 
 def create_table(model):
     if model.db_table_name in EXISTING_TABLES:
@@ -81,3 +83,14 @@ def add_column(mod, col):
         cursor = World.get_world().db.conn.cursor()
         cursor.execute(alter_stmt)
         EXISTING_TABLES[mod.db_table_name].append(col)
+
+def create_indexes(model):
+    """Create an index for each of model's columns that is a foreign key or is
+    marked as indexed (unless it's already indexed because it's the primary key
+    or unique). Indexes that already exist are left alone.
+    """
+    cursor = World.get_world().db.conn.cursor()
+    for col in model.db_columns:
+        if (col.foreign_key or col.indexed) and not (col.primary_key or col.unique):
+            cursor.execute('CREATE INDEX IF NOT EXISTS %s_%s_index ON %s (%s)' %
+                           (model.db_table_name, col.name, model.db_table_name, col.name))
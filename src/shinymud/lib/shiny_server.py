@@ -2,31 +2,45 @@ from shinymud.lib.world import World
 # Initialize the World
 world = World()
 from shinymud.lib.setup import initialize_database
-from shinymud.models.area import Area
+from shinymud.models.area import Area, preload_areas
 from shinymud.data.config import *
 from shinymud.lib.connection_handlers import con_handlers
+from shinymud.lib.connection_handlers.reactor import Reactor
 
 import traceback
 import datetime
 
 initialize_database()
+if DB_WRITER_THREAD:
+    world.db.start_writer()
+world.db.start_checkpoints(DB_CHECKPOINT_INTERVAL)
+world.log.info(world.db.profile_report())
 world.db.delete('from game_item where (owner is null or owner=\'None\') and container is null')
 
 # load the entities in the world from the database
 # This should probably happen inside the world itself...
+# Everything in every area is fetched with a single query per table, rather
+# than a query (or several) per object
 for area in world.db.select("* from area"):
     world.area_add(Area.create(area))
-for area in world.areas.values():
-    area.load()
+try:
+    preload_areas(world.db)
+    for area in world.areas.values():
+        area.load(preloaded=True)
+finally:
+    world.db.clear_preloaded()
 
 world.default_location = world.get_location(DEFAULT_LOCATION[0],
                                             DEFAULT_LOCATION[1])
 
-# Start up all of our connection handlers
+# Start up all of our connection handlers, and hand their sockets to the
+# reactor
+reactor = Reactor(world)
 for port, conn_handler in CONNECTIONS:
     handler_class = getattr(con_handlers, conn_handler)
     handler_obj = handler_class(port, HOST, world)
-    handler_obj.start()
+    reactor.add(handler_obj)
+reactor.start()
 
 world.log.info('Started the connection handlers. Now listening for Players.')
 world.log.debug('The world is about to start turning.')
@@ -46,3 +60,10 @@ except:
     ]
     for player in world.player_list.values():
         player.conn.send(player_error)
+
+# Whether we crashed or not, make sure everything's been written before we go
+try:
+    world.db.stop_writer()
+    world.db.stop_checkpoints()
+except Exception as e:
+    world.log.critical('Could not write out unsaved changes: %s' % str(e))
@@ -1,9 +1,12 @@
-import threading
+import Queue
 import time
 import logging
 import logging.handlers
 
 from shinymud.lib.db import DB
+from shinymud.lib.profiler import TickProfiler
+from shinymud.lib.reset_scheduler import ResetScheduler
+from shinymud.lib.npc_scheduler import NpcScheduler
 from shinymud.data.config import *
 
 class World(object):
@@ -24,15 +27,25 @@ class World(object):
         self.player_delete = []
         self.battles = {}
         self.battles_delete = []
-        self.player_list_lock = threading.Lock()
+        # Players who have just connected (see new_player)
+        self.new_players = Queue.Queue()
         self.shutdown_flag = False
         self.areas = {}
-        self.db = DB(self.log, conn=conn)
+        self.db = DB(self.log, conn=conn, profile=DB_PROFILE)
+        self.db.write_behind = bool(WRITE_BEHIND_TURNS)
+        # Turns since the db was last flushed (kept apart from the profiler's
+        # turn count, which admins can reset)
+        self.unflushed_turns = 0
         self.default_location = None
         self.currency_name = CURRENCY
         self.login_greeting = ''
         self.uptime = time.time()
-        self.active_npcs = []
+        self.npc_scheduler = NpcScheduler(NPC_COMMAND_BUDGET)
+        # Lines of output thrown away because players couldn't keep up, by
+        # priority (see Player.update_output)
+        self.output_drops = {'low': 0, 'normal': 0}
+        self.profiler = TickProfiler(TICK_STATS_TURNS)
+        self.reset_scheduler = ResetScheduler()
         
         try:
             greet_file = open(ROOT_DIR + '/login_greeting.txt', 'r')
@@ -84,40 +97,62 @@ class World(object):
     def start_turning(self):
         while not self.shutdown_flag:
             start = time.time()
-            # Go through active npcs
-            for i in reversed(xrange(len(self.active_npcs))):
-                if not self.active_npcs[i].do_tick():
-                    del self.active_npcs[i]
+            # Let active npcs act
+            self.npc_scheduler.run()
+            mark = self.profiler.record('npcs', start)
             # Manage player list
-            self.player_list_lock.acquire()
+            self.add_new_players()
             list_keys = self.player_list.keys()
             for key in list_keys:
                 self.player_list[key].do_tick()
+            mark = self.profiler.record('players', mark)
             self.cleanup()
+            mark = self.profiler.record('cleanup', mark)
             list_keys = self.player_list.keys()
             for key in list_keys:
                 self.player_list[key].send_output()
-            self.player_list_lock.release()
+            mark = self.profiler.record('send_output', mark)
             
             # Perform round actions for active battles
             for key in self.battles.keys():
                 self.battles[key].perform_round()
+            mark = self.profiler.record('battles', mark)
             
             # Reset areas that have had activity
-            for area in self.areas.values():
-                if area.times_visited_since_reset > 0:
-                    now = time.time()
-                    if (now - area.time_of_last_reset) >= RESET_INTERVAL:
-                        area.reset()
-                        self.log.info('Area %s has been reset.' % area.name)
+            for area in self.reset_scheduler.pop_due(time.time()):
+                if RESET_TIME_BUDGET:
+                    self.reset_scheduler.begin_reset(area, RESET_OCCUPIED_ROOMS)
+                else:
+                    area.reset()
+                    self.log.info('Area %s has been reset.' % area.name)
+            if RESET_TIME_BUDGET:
+                for area in self.reset_scheduler.run_resets(RESET_TIME_BUDGET):
+                    self.log.info('Area %s has been reset.' % area.name)
+            mark = self.profiler.record('resets', mark)
             
+            # Write out the models that have been saved since the last flush
+            self.write_behind_turn()
+            self.profiler.record('db_flush', mark)
+            
+            self.profiler.end_turn(start)
             finish = time.time() - start
             if finish >= 1:
-                self.log.critical('WORLD: Turn took longer than a sec!')
+                self.log.critical('WORLD: Turn took longer than a sec!\n' +
+                                  self.profiler.dump())
             elif finish < 0.25:
                 time.sleep(0.25 - finish)
+        self.db.flush()
         self.listening = False
     
+    def write_behind_turn(self):
+        """Count a turn, and flush the database if it's in write-behind mode
+        and WRITE_BEHIND_TURNS turns have gone by since it was last flushed.
+        """
+        self.unflushed_turns += 1
+        if self.db.write_behind and self.unflushed_turns >= WRITE_BEHIND_TURNS:
+            self.db.flush()
+            self.unflushed_turns = 0
+    
     def has_location(self, area_name, room_id):
         """Check if a location (room) exists given an area name and a room id.
         Returns True if the room exists, false if it doesn't.
@@ -210,6 +245,7 @@ class World(object):
             self.log.debug(area.destroy_room(room))
         self.log.debug('Should have destroyed the rooms')
         area.destruct()
+        self.reset_scheduler.unschedule(area)
         del self.areas[area.name]
         area.name = None
         self.log.info('%s destroyed area %s.' % (playername, area_name))
@@ -218,10 +254,12 @@ class World(object):
 # ************************ Player Functions ************************
 # Here exist all the functions that the world uses to manage the players
 # it contains.
-    def tell_players(self, message, exclude_list=[], color=wecho_color):
+    def tell_players(self, message, exclude_list=[], color=wecho_color, priority='normal'):
         """Tell all available players in the world a message.
         A player is considered unavailable if the are on the exclude list,
-        or not in BuildMode or NormalMode."""
+        or not in BuildMode or NormalMode.
+        priority -- passed on to each player's update_output; only chatter
+            should be 'low' (see Player.update_output)."""
         message = color + message + clear_fcolor
         for player in self.player_list.values():
             if player.name in exclude_list:
@@ -229,7 +267,7 @@ class World(object):
             elif player.mode and player.mode.name != 'BuildMode':
                 pass
             else:
-                player.update_output(message)
+                player.update_output(message, priority=priority)
     
     def has_player(self, name):
         """Return true if the world has this player's name in its player list."""
@@ -256,6 +294,24 @@ class World(object):
             key = key.lower()
         self.player_list[key] = player
     
+    def new_player(self, player):
+        """Hand a player who has just connected over to the world. They get
+        added to the player list at the start of the next turn, by the world
+        thread, so connection handlers never have to wait for a turn to end.
+        """
+        self.new_players.put(player)
+    
+    def add_new_players(self):
+        """Add everyone who has connected since the last turn to the player
+        list.
+        """
+        while True:
+            try:
+                player = self.new_players.get_nowait()
+            except Queue.Empty:
+                return
+            self.player_add(player)
+    
     def player_remove(self, playername):
         """Add a player's name to the world's delete list so they get removed
         from the playerlist on the next turn."""
@@ -281,6 +337,6 @@ class World(object):
 # ********************** NPC Functions **********************
 # Here exist all the function that the world uses to manage active npcs
     def npc_subscribe(self, npc):
-        """Add an npc to the world's active_npcs list."""
-        self.active_npcs.append(npc)
+        """Give an npc a chance to act on its next turn (see NpcScheduler)."""
+        self.npc_scheduler.subscribe(npc)
     
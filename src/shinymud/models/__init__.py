@@ -1,9 +1,23 @@
 from shinymud.lib.world import World
 from shinymud.lib.registers import ModelRegister
 import json
+import re
 
 model_list = ModelRegister()
 
+# Attribute values of these types can't be changed without being reassigned,
+# so a model can tell whether they've changed just by comparing them with what
+# they were when it was last saved
+SCALAR_TYPES = (basestring, int, long, float)
+
+def unchanged(val):
+    """The default read and copy function for a column."""
+    return val
+
+def write_unicode(val):
+    """The default write function for a column."""
+    return None if val is None else unicode(val)
+
 class Column(object):
     """Columns are used by Models to handle how data will be stored and
     retrieved from the database. The main functions used here are 'read'
@@ -30,14 +44,16 @@ class Column(object):
         self.foreign_key = args.get('foreign_key') # (model, column)
         #Set if unique
         self.unique = args.get('unique', False)
+        #Set if this column should have an index (foreign keys always get one)
+        self.indexed = args.get('indexed', False)
         #How shall data be retrieved by the db? Default is string, other opitons
         #are in shiny_types.py
-        self.read = args.get('read', lambda x: x)
+        self.read = args.get('read', unchanged)
         #How shall this data be written to the db? Default is unicode string or None.
-        self.write = args.get('write', lambda x: None if x is None else unicode(x))
+        self.write = args.get('write', write_unicode)
         #Allows for ON UPDATE or ON DELETE cascading
         self.cascade = args.get('cascade')
-        self.copy = args.get('copy', lambda x: x)
+        self.copy = args.get('copy', unchanged)
     
     def __str__(self):
         """Packages all of the columns information so it is ready to be given to the
@@ -61,6 +77,128 @@ class Column(object):
         return unicode(" ".join(sql_string))
     
 
+def column_slots(columns, *attributes):
+    """Return the __slots__ for a model class with the given columns, so that
+    its instances can keep their column values (and saved_state, and any of
+    the other attributes given) without a dictionary each.
+    Instances still get a dictionary for anything else that's set on them,
+    but only if something is.
+    """
+    return tuple([col.name for col in columns] + ['saved_state'] + list(attributes))
+
+# Column names that can be written straight into generated code as attribute
+# names
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def compile_function(name, lines, namespace):
+    """Compile the source code in lines (a list of lines) and return the
+    function called name that it defines, with namespace as its globals.
+    """
+    namespace = dict(namespace)
+    exec compile('\n'.join(lines) + '\n', '<%s>' % name, 'exec') in namespace
+    return namespace[name]
+
+def read_lines(columns, namespace):
+    """Return the lines of code (for the body of a function with self and
+    get, args.get, defined) that set each of columns the way
+    Model.read_columns would, adding the functions and defaults they use to
+    namespace.
+    """
+    lines = []
+    for i, col in enumerate(columns):
+        namespace['read_%s' % i] = col.read
+        namespace['default_%s' % i] = col.default
+        lines.append('    val = get(%r)' % col.name)
+        lines.append('    if val:')
+        if col.read is unchanged:
+            lines.append('        self.%s = val' % col.name)
+        else:
+            lines.append('        self.%s = read_%s(val)' % (col.name, i))
+        lines.append('    else:')
+        if hasattr(col.default, '__call__'):
+            lines.append('        self.%s = default_%s()' % (col.name, i))
+        else:
+            lines.append('        self.%s = default_%s' % (col.name, i))
+    return lines
+
+def column_reader(columns):
+    """Return a function(self, args) that does the same as
+    Model.read_columns(self, args, columns), but written out for columns.
+    """
+    if [col for col in columns if not IDENTIFIER.match(col.name)]:
+        return lambda self, args: Model.read_columns(self, args, columns)
+    namespace = {}
+    lines = ['def read_columns(self, args):',
+             '    get = args.get']
+    lines.extend(read_lines(columns, namespace))
+    return compile_function('read_columns', lines, namespace)
+
+def write_code(col, i):
+    """Return the code that runs val through col (the i'th column)'s write
+    function, for the functions column_functions writes.
+    """
+    if col.write is unchanged:
+        return 'val'
+    elif col.write is write_unicode:
+        # val is never None when it gets written
+        return 'unicode(val)'
+    return 'write_%s(val)' % i
+
+def column_functions(columns):
+    """Return a dictionary of name:function of the Model methods that loop
+    over db_columns (load_columns, copy_save_attrs and create_save_dict),
+    written out for columns instead, with a line or two for each column.
+    They do exactly what Model's versions do. If any of the column names
+    can't be used as attribute names in code, the dictionary is empty.
+    """
+    if [col for col in columns if not IDENTIFIER.match(col.name)]:
+        return {}
+    functions = {}
+    names = [col.name for col in columns]
+    namespace = {'SCALAR_TYPES': SCALAR_TYPES}
+    for i, col in enumerate(columns):
+        namespace['copy_%s' % i] = col.copy
+        namespace['write_%s' % i] = col.write
+    
+    lines = ['def load_columns(self, args):',
+             '    get = args.get']
+    lines.extend(read_lines(columns, namespace))
+    lines.append('    self.saved_state = None')
+    if 'dbid' in names:
+        lines.append('    if self.dbid:')
+    else:
+        lines.append('    if getattr(self, "dbid", None):')
+    lines.append('        saved = {}')
+    for i, col in enumerate(columns):
+        lines.append('        val = self.%s' % col.name)
+        lines.append('        if val is None or isinstance(val, SCALAR_TYPES):')
+        lines.append('            saved[%r] = (type(val), val)' % col.name)
+        lines.append('        else:')
+        lines.append('            saved[%r] = (None, %s if val else None)' %
+                     (col.name, write_code(col, i)))
+    lines.append('        self.saved_state = saved')
+    functions['load_columns'] = compile_function('load_columns', lines, namespace)
+    
+    for method, kind, default in (('copy_save_attrs', 'copy', unchanged),
+                                  ('create_save_dict', 'write', write_unicode)):
+        lines = ['def %s(self):' % method,
+                 '    result = {}']
+        for i, col in enumerate(columns):
+            lines.append('    try:')
+            lines.append('        val = self.%s' % col.name)
+            lines.append('    except AttributeError:')
+            lines.append('        val = default_%s' % i)
+            if kind == 'write':
+                value = write_code(col, i)
+            elif col.copy is unchanged:
+                value = 'val'
+            else:
+                value = 'copy_%s(val)' % i
+            lines.append('    result[%r] = %s if val else None' % (col.name, value))
+        lines.append('    return result')
+        functions[method] = compile_function(method, lines, namespace)
+    return functions
+
 class Model(object):
     """Models are used for saving and loading in-game objects. 
     
@@ -111,12 +249,59 @@ class Model(object):
         )
     ]
     db_extras = []
+    # Models that don't call Model.__init__ start out with nothing saved
+    saved_state = None
     def __init__(self, args={}):
         """Go through each of the columns in our decendent model, and set them as real
         attributes in our class. If a column doesn't have a name, check if it has default
         data or a default function. Lastly, if it was loaded (has dbid), load the extras.
         """
-        for col in self.db_columns:
+        self.load_columns(args)
+        if self.saved_state is not None:
+            self.load_extras()
+    
+    @classmethod
+    def compile_columns(cls):
+        """Replace load_columns, copy_save_attrs and create_save_dict with
+        versions written out for this model's columns, so that they don't
+        have to loop over db_columns every time they're called (see
+        column_functions). This gets done when the model is registered, so
+        a model with columns of its own should be registered before any are
+        made. A model that writes its own version of one of these methods (or
+        inherits one from a model that does) keeps it.
+        """
+        for name, func in column_functions(cls.db_columns).items():
+            for klass in cls.__mro__:
+                if name in klass.__dict__:
+                    break
+            if klass is Model or getattr(klass.__dict__[name], 'compiled', False):
+                func.compiled = True
+                setattr(cls, name, func)
+    
+    def load_columns(self, args):
+        """Set our column attributes from args (see read_columns), and
+        remember their saved state if we were loaded from the database.
+        """
+        self.read_columns(args, self.db_columns)
+        # column-name:state for every column as it is in the database (see
+        # changed_columns), once there's something in the database
+        self.saved_state = None
+        if hasattr(self, 'dbid'):
+            if self.dbid:
+                self.saved_state = {}
+                for col in self.db_columns:
+                    val = getattr(self, col.name)
+                    if val is None or isinstance(val, SCALAR_TYPES):
+                        self.saved_state[col.name] = (type(val), val)
+                    else:
+                        self.saved_state[col.name] = (None, col.write(val) if val else None)
+    
+    def read_columns(self, args, columns):
+        """Set an attribute for each of columns from its value in args (run
+        through the column's read function), or its default if args doesn't
+        have one.
+        """
+        for col in columns:
             if args.get(col.name):
                 setattr(self, col.name, col.read(args[col.name]))
             else:
@@ -124,9 +309,6 @@ class Model(object):
                     setattr(self, col.name, col.default())
                 else:
                     setattr(self, col.name, col.default)
-        if hasattr(self, 'dbid'):
-            if self.dbid:
-                self.load_extras()
     
     def load_extras(self):
         """(For decendent Model) If a Model has anything it needs to load after the columns,
@@ -154,18 +336,84 @@ class Model(object):
             save_dict[col.name] = col.write(val) if val else None
         return save_dict
     
+    def changed_columns(self):
+        """Return a dictionary of column-name:(state, written) for each column
+        whose value has changed since the model was loaded or last saved, where
+        written is the value ready to be written to the database.
+        
+        Simple values (strings and numbers) are compared as they are, so they
+        only get run through their column's write function if they've changed.
+        Anything else (lists, dictionaries, other models...) could have been
+        changed in place, so it gets written and compared with what was written
+        last time.
+        """
+        changes = {}
+        saved = self.saved_state or {}
+        for col in self.db_columns:
+            val = getattr(self, col.name, col.default)
+            if val is None or isinstance(val, SCALAR_TYPES):
+                state = (type(val), val)
+                if saved.get(col.name) != state:
+                    changes[col.name] = (state, col.write(val) if val else None)
+            else:
+                written = col.write(val) if val else None
+                state = (None, written)
+                if saved.get(col.name) != state:
+                    changes[col.name] = (state, written)
+        return changes
+    
+    def changed_save_dict(self):
+        """Like create_save_dict, but only for the columns that have changed
+        since the model was last saved (plus dbid).
+        Returns a tuple of (save_dict, changes), where changes should be handed
+        to mark_saved once save_dict has been written, or (None, None) if
+        nothing has changed.
+        """
+        changes = self.changed_columns()
+        if not changes:
+            return None, None
+        save_dict = dict([(name, written) for name, (_, written) in changes.items()])
+        save_dict['dbid'] = self.dbid
+        return save_dict, changes
+    
+    def mark_saved(self, changes):
+        """Remember that the given changes (from changed_columns) have been
+        written to the database.
+        """
+        if self.saved_state is None:
+            self.saved_state = {}
+        for name, (state, _) in changes.items():
+            self.saved_state[name] = state
+    
     def save(self):
         """Save model data to the database. This function should be freely used by decendent
-        models to save changes."""
-        save_dict = self.create_save_dict()
+        models to save changes.
+        Only the columns that have changed are written, and nothing is
+        written at all if nothing has changed.
+        New models are inserted straight away (so they get their dbid), but if
+        the database is in write-behind mode, changes to models that already
+        have a row are only written the next time the database is flushed
+        (see DB.flush).
+        """
         if self.dbid:
-                self.world.db.update_from_dict(self.db_table_name, save_dict)
+            if self.world.db.write_behind:
+                self.world.db.mark_dirty(self)
+            else:
+                save_dict, changes = self.changed_save_dict()
+                if save_dict:
+                    self.world.db.update_from_dict(self.db_table_name, save_dict)
+                    self.mark_saved(changes)
         else:
+            changes = self.changed_columns()
+            save_dict = dict([(name, written) for name, (_, written) in changes.items()])
             if 'dbid' in save_dict:
                 del save_dict['dbid']
             self.dbid = self.world.db.insert_from_dict(self.db_table_name, save_dict)
+            self.mark_saved(changes)
+            self.saved_state['dbid'] = (type(self.dbid), self.dbid)
     
     def destruct(self):
         if self.dbid:
+            self.world.db.discard(self)
             self.world.db.delete('FROM %s WHERE dbid=?' % self.db_table_name, [self.dbid])
     
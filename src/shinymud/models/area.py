@@ -4,10 +4,19 @@ from shinymud.models.room import Room
 from shinymud.models.item import BuildItem
 from shinymud.models.npc import Npc
 from shinymud.models.script import Script
+from shinymud.models.item_types import ITEM_TYPES
+from shinymud.models.npc_ai_packs import NPC_AI_PACKS
 from shinymud.modes.text_edit_mode import TextEditMode
 from shinymud.lib.world import World
+from shinymud.data.config import RESET_INTERVAL
+from collections import deque
 import time
 
+# The types of objects get_id hands out ids for, and the attribute an area
+# keeps them in
+ID_TYPES = {'room': 'rooms', 'build_item': 'items', 'npc': 'npcs',
+            'script': 'scripts'}
+
 class Area(Model):
     db_table_name = 'area'
     db_columns = Model.db_columns + [
@@ -17,7 +26,7 @@ class Area(Model):
                write=write_list, copy=copy_list, default=[]),
         Column('level_range', default='All'),
         Column('description', default='No Description'),
-        
+        Column('reset_interval', type="INTEGER", read=read_int, write=int),
     ]
     def __init__(self, args={}):
         Model.__init__(self, args)
@@ -27,28 +36,45 @@ class Area(Model):
         self.scripts = {}
         self.time_of_last_reset = 0
         self.times_visited_since_reset = 0
+        self.next_reset = None
+        # Rooms still waiting to be reset by an incremental reset
+        self.rooms_to_reset = deque()
+        # id-type:the last id handed out by get_id
+        self.last_ids = {}
     
-    def load(self):
-        """Load all of this area's objects from the database."""
+    def load(self, preloaded=False):
+        """Load all of this area's objects from the database.
+        Unless preloaded is True (meaning preload_areas has already been
+        called for this area), the rows for all of the area's objects are
+        fetched up front with one query per table.
+        """
         if self.dbid:
-            items = self.world.db.select("* from build_item where area=?", [self.name])
-            for item in items:
-                item['area'] = self
-                self.items[str(item['id'])] = BuildItem(item)
-            scripts = self.world.db.select("* from script where area=?", [self.name])
-            for script in scripts:
-                script['area'] = self
-                self.scripts[str(script['id'])] = Script(script)
-            npcs = self.world.db.select("* from npc where area=?", [self.name])
-            for npc in npcs:
-                npc['area'] = self
-                self.npcs[str(npc['id'])] = Npc(npc)
-            rooms = self.world.db.select("* from room where area=?", [self.name])
-            for room in rooms:
-                room['area'] = self
-                new_room = Room(room)
-                new_room.reset()
-                self.rooms[str(room['id'])] = new_room
+            db = self.world.db
+            try:
+                if not preloaded:
+                    preload_areas(db, self.name)
+                items = db.select_related('build_item', 'area', self.name)
+                for item in items:
+                    item['area'] = self
+                    self.items[str(item['id'])] = BuildItem(item)
+                scripts = db.select_related('script', 'area', self.name)
+                for script in scripts:
+                    script['area'] = self
+                    self.scripts[str(script['id'])] = Script(script)
+                npcs = db.select_related('npc', 'area', self.name)
+                for npc in npcs:
+                    npc['area'] = self
+                    self.npcs[str(npc['id'])] = Npc(npc)
+                rooms = db.select_related('room', 'area', self.name)
+                for room in rooms:
+                    room['area'] = self
+                    new_room = Room(room)
+                    new_room.reset()
+                    self.rooms[str(room['id'])] = new_room
+            finally:
+                # Don't leave anything preloaded for other loads to trip over
+                if not preloaded:
+                    db.clear_preloaded()
             
             self.time_of_last_reset = time.time()
     
@@ -61,6 +87,7 @@ class Area(Model):
 Name: %s (not changeable)
 Title: %s
 Level Range: %s
+Reset Interval: %s seconds
 Builders: %s
 Number of rooms: %s
 Number of items: %s
@@ -69,6 +96,7 @@ Number of scripts: %s
 Description: \n    %s""" % (self.name, 
                             self.title,
                             self.level_range, 
+                            self.get_reset_interval(),
                             builders.capitalize(),
                             str(len(self.rooms.keys())),
                             str(len(self.items.keys())),
@@ -79,21 +107,84 @@ Description: \n    %s""" % (self.name,
         return area_list
     
     def get_id(self, id_type):
-        """Generate a new id for an item, npc, or room associated with this area."""
-        if id_type in ['room', 'build_item', 'npc', 'script']:
-            rows = self.world.db.select("max(CAST(id AS INT)) as id from " + id_type +" where area=?", [self.name])
-            max_id = rows[0]['id']
-            if max_id:
-                your_id = int(max_id) + 1
-            else:
-                your_id = 1
-            return str(your_id)
+        """Generate a new id for an item, npc, room or script associated with
+        this area.
+        Each type has a counter that starts out at the highest id the area
+        already has for it, so ids keep going up (even if the newest room,
+        say, gets destroyed) and making a new one doesn't mean asking the
+        database what the highest id is.
+        """
+        if id_type in ID_TYPES:
+            if id_type not in self.last_ids:
+                self.last_ids[id_type] = highest_id(getattr(self, ID_TYPES[id_type]))
+            self.last_ids[id_type] += 1
+            return str(self.last_ids[id_type])
+    
+    def claim_id(self, id_type, obj_id):
+        """Make sure get_id never hands out obj_id, which was given to a new
+        object of type id_type from somewhere else (like an imported area).
+        """
+        if id_type in self.last_ids:
+            self.last_ids[id_type] = max(self.last_ids[id_type], highest_id([obj_id]))
     
     def reset(self):
         """Tell all of this area's rooms to reset."""
         for room in self.rooms.values():
             room.reset()
+        self.rooms_to_reset.clear()
         self.time_of_last_reset = time.time()
+        self.times_visited_since_reset = 0
+        self.world.reset_scheduler.unschedule(self)
+    
+    def begin_reset(self, occupied='first'):
+        """Start an incremental reset of this area: queue up all of its rooms
+        to be reset one at a time by reset_next_room, so that a big area can be
+        reset over several turns instead of all at once.
+        occupied -- 'first' to reset rooms with players in them before the
+        empty ones, or 'last' to leave them until the end.
+        """
+        occupied_rooms = []
+        empty_rooms = []
+        for room in self.rooms.values():
+            if room.players:
+                occupied_rooms.append(room)
+            else:
+                empty_rooms.append(room)
+        if occupied == 'last':
+            self.rooms_to_reset = deque(empty_rooms + occupied_rooms)
+        else:
+            self.rooms_to_reset = deque(occupied_rooms + empty_rooms)
+        # Count the reset as happening now, so that players who visit while
+        # the reset is still going schedule the next one
+        self.time_of_last_reset = time.time()
+        self.times_visited_since_reset = 0
+        self.world.reset_scheduler.unschedule(self)
+    
+    def reset_next_room(self):
+        """Reset the next room waiting in an incremental reset.
+        Return True if there are still more rooms waiting, False if the reset
+        is finished.
+        """
+        if self.rooms_to_reset:
+            room = self.rooms_to_reset.popleft()
+            # Don't reset rooms that were destroyed after the reset started
+            if self.rooms.get(room.id) is room:
+                room.reset()
+        return len(self.rooms_to_reset) > 0
+    
+    def visit(self):
+        """Let the area know that a player has entered one of its rooms.
+        The first visit since the area's last reset schedules its next one.
+        """
+        self.times_visited_since_reset += 1
+        if self.times_visited_since_reset == 1:
+            self.world.reset_scheduler.schedule(self)
+    
+    def get_reset_interval(self):
+        """Return the number of seconds that should pass before this area
+        resets (the default is RESET_INTERVAL in the config file).
+        """
+        return self.reset_interval or RESET_INTERVAL
     
 # ***** BuildMode Accessor Functions *****
     @classmethod
@@ -130,6 +221,26 @@ Description: \n    %s""" % (self.name,
         self.save()
         return 'Area title set.'
     
+    def build_set_resetinterval(self, interval, player=None):
+        """Set the number of seconds between this area's resets."""
+        if not interval:
+            return 'Try "set resetinterval <seconds>", or see "help area".'
+        if interval.strip().lower() == 'default':
+            self.reset_interval = None
+        else:
+            try:
+                interval = int(interval)
+            except ValueError:
+                return 'The reset interval must be a number of seconds.'
+            if interval < 1:
+                return 'The reset interval must be at least 1 second.'
+            self.reset_interval = interval
+        self.save()
+        if self.next_reset is not None:
+            # Move the next reset to match the new interval
+            self.world.reset_scheduler.schedule(self)
+        return 'Area reset interval set to %s seconds.' % self.get_reset_interval()
+    
     def build_add_builder(self, playername, player=None):
         """Add a player to the builder's list."""
         self.builders.append(playername)
@@ -168,6 +279,7 @@ Description: \n    %s""" % (self.name,
             # Create a new 'blank' room
             new_room = Room.create(self, self.get_id('room'))
         new_room.save()
+        self.claim_id('room', new_room.id)
         self.rooms[str(new_room.id)] = new_room
         return new_room
     
@@ -218,6 +330,7 @@ Description: \n    %s""" % (self.name,
         else:
             new_npc = Npc.create(self, self.get_id('npc'))
         new_npc.save()
+        self.claim_id('npc', new_npc.id)
         self.npcs[str(new_npc.id)] = new_npc
         return new_npc
     
@@ -265,6 +378,7 @@ Description: \n    %s""" % (self.name,
         else:
             new_item = BuildItem.create(self, self.get_id('build_item'))
         new_item.save()
+        self.claim_id('build_item', new_item.id)
         self.items[str(new_item.id)] = new_item
         return new_item
     
@@ -310,6 +424,7 @@ Description: \n    %s""" % (self.name,
         else:
             new_script = Script({'area': self, 'id': self.get_id('script')})
         new_script.save()
+        self.claim_id('script', new_script.id)
         self.scripts[str(new_script.id)] = new_script
         return new_script
     
@@ -330,3 +445,33 @@ Description: \n    %s""" % (self.name,
     
 
 model_list.register(Area)
+
+
+def preload_areas(db, area_name=None):
+    """Fetch the rows for everything that belongs to an area (or to every
+    area, if area_name is None) -- items and their item types, scripts, npcs
+    and their events and ai packs, rooms and their exits and spawns -- with a
+    single query per table, so that Area.load doesn't need a query per object.
+    Call db.clear_preloaded() once the areas have been loaded.
+    """
+    def preload(table, column, owner, join=''):
+        # owner is the table that has the area column
+        query = '%s.* FROM %s %s' % (table, table, join)
+        if area_name is None:
+            db.preload(table, column, query)
+        else:
+            db.preload(table, column, query + ' WHERE %s.area=?' % owner, [area_name])
+    
+    for table in ['build_item', 'script', 'npc', 'room']:
+        preload(table, 'area', table)
+    for table in ['room_exit', 'room_spawns']:
+        preload(table, 'room', 'room', 'JOIN room ON %s.room=room.dbid' % table)
+    for table in ITEM_TYPES:
+        preload(table, 'build_item', 'build_item',
+                'JOIN build_item ON %s.build_item=build_item.dbid' % table)
+    preload('npc_event', 'prototype', 'npc', 'JOIN npc ON npc_event.prototype=npc.dbid')
+    for table in NPC_AI_PACKS:
+        preload(table, 'npc', 'npc', 'JOIN npc ON %s.npc=npc.dbid' % table)
+    preload('merchandise_list', 'merchant', 'npc',
+            'JOIN merchant ON merchandise_list.merchant=merchant.dbid '
+            'JOIN npc ON merchant.npc=npc.dbid')
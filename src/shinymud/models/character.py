@@ -4,6 +4,22 @@ from shinymud.lib.registers import IntRegister, DictRegister, DamageRegister
 from shinymud.models import Model, Column, model_list
 from shinymud.models.shiny_types import *
 from random import randint
+
+def lazy_register(name, register_class):
+    """Return a property for a register (like a character's hit or absorb)
+    that isn't created until something uses it, since most npcs never fight
+    or equip anything. It's kept in the attribute _<name>.
+    """
+    attr = '_' + name
+    def get_register(self):
+        register = getattr(self, attr, None)
+        if register is None:
+            register = register_class()
+            setattr(self, attr, register)
+        return register
+    def set_register(self, register):
+        setattr(self, attr, register)
+    return property(get_register, set_register)
     
 class Character(Model):
     """The basic functionality that both player characters (players) and 
@@ -29,13 +45,14 @@ class Character(Model):
             self.equipped[i] = ''
         self.isequipped = [] #Is a list of the currently equipped items
         self._attack_queue = []
-        self.hit = IntRegister()
-        self.evade = IntRegister()
-        self.absorb = DictRegister()
-        self.damage = DamageRegister()
         self.effects = {}
         self.position = ('standing', None)
     
+    hit = lazy_register('hit', IntRegister)
+    evade = lazy_register('evade', IntRegister)
+    absorb = lazy_register('absorb', DictRegister)
+    damage = lazy_register('damage', DamageRegister)
+    
     def __str__(self):
         return self.fancy_name()
     
@@ -124,14 +141,15 @@ class Character(Model):
     
     # Battle specific commands
     def _get_battle_target(self):
-        if self in self.battle.teamA:
-            other_team = self.battle.teamB
-        else:
-            other_team = self.battle.teamA
         if self._battle_target:
-            if not self._battle_target in other_team:
-                self._battle_target = other_team[0]
-            self.world.log.debug("%s attack target: %s" % (self.fancy_name(), self._battle_target.fancy_name()))
+            battle = self.battle
+            team = battle.team_of(self._battle_target)
+            if team is None or team == battle.team_of(self):
+                # Nobody's left to fight if we've left the battle ourselves
+                opponents = battle.opponents(self)
+                self._battle_target = opponents[0] if opponents else None
+            if self._battle_target:
+                self.world.log.debug("%s attack target: %s" % (self.fancy_name(), self._battle_target.fancy_name()))
             return self._battle_target
     
     def _set_battle_target(self, target):
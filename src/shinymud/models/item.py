@@ -1,5 +1,5 @@
 from shinymud.modes.text_edit_mode import TextEditMode
-from shinymud.models import Model, Column, model_list
+from shinymud.models import Model, Column, model_list, column_slots, column_reader
 from shinymud.models.shiny_types import *
 from shinymud.models.item_types import ITEM_TYPES
 from shinymud.lib.world import World
@@ -7,6 +7,9 @@ from shinymud.lib.world import World
 import types
 import re
 
+# The most parameters SQLite allows in a single statement (by default)
+MAX_PARAMS = 999
+
 class Item(Model):
     """The base class that both BuildItem and GameItem should inherit from."""
     db_columns = Model.db_columns + [
@@ -51,6 +54,35 @@ class Item(Model):
         self.item_types.clear()
     
 
+# The columns a GameItem shares with the BuildItem it was loaded from
+SHARED_COLUMNS = frozenset([col.name for col in Item.db_columns if col.name != 'dbid'])
+
+class SharedColumn(object):
+    """A column of a GameItem whose value comes from the item's prototype
+    (see BuildItem.shared_attrs) until it's set on the item itself, so that
+    items that are never changed don't each carry their own copy.
+    Shared values must be replaced, not changed in place (shared lists are
+    kept as tuples, so that they can't be).
+    """
+    def __init__(self, name, slot):
+        self.name = name
+        # The slot that holds the item's own value, once it has one
+        self.slot = slot
+    
+    def __get__(self, item, cls):
+        if item is None:
+            return self
+        try:
+            return self.slot.__get__(item, cls)
+        except AttributeError:
+            if item.shared is None:
+                raise AttributeError(self.name)
+            return item.shared[self.name]
+    
+    def __set__(self, item, value):
+        self.slot.__set__(item, value)
+    
+
 class BuildItem(Item):
     """BuildItem represents a prototype item created in BuildMode.
      
@@ -67,13 +99,43 @@ class BuildItem(Item):
     ]
     db_extras = [
         "UNIQUE (area, id)"]
+    # The values of our shared columns that the GameItems we load share (see
+    # shared_attrs)
+    shared = None
     def __init__(self, args={}):
         Item.__init__(self, args)
     
+    def __setattr__(self, name, value):
+        if name in SHARED_COLUMNS:
+            # Items loaded from now on need to see the change, but the ones
+            # already loaded shouldn't
+            self.__dict__['shared'] = None
+        Item.__setattr__(self, name, value)
+    
+    def shared_attrs(self):
+        """Return a dictionary of the values that every GameItem loaded from
+        this prototype (until it's changed) should share.
+        """
+        if self.shared is None:
+            # Build them exactly the way a GameItem would from a copy of our
+            # attributes
+            args = self.copy_save_attrs()
+            args['dbid'] = None
+            item = GameItem(args)
+            shared = {}
+            for name in SHARED_COLUMNS:
+                value = getattr(item, name)
+                if isinstance(value, list):
+                    # Every item loaded from us gets this same value, so
+                    # none of them can be allowed to change it in place
+                    value = tuple(value)
+                shared[name] = value
+            self.shared = shared
+        return self.shared
+    
     def load_extras(self):
         for key, value in ITEM_TYPES.items():
-            row = self.world.db.select('* FROM %s WHERE build_item=?' % key,
-                                       [self.dbid])
+            row = self.world.db.select_related(key, 'build_item', self.dbid)
             if row:
                 row[0]['build_item'] = self
                 self.item_types[key] = value(row[0])
@@ -225,9 +287,7 @@ class BuildItem(Item):
         spawn_id -- The id of the spawn that is loading this item into a room,
         or None if this item is not being loaded by a spawn
         """
-        item = GameItem(self.copy_save_attrs(), spawn_id=spawn_id)
-        # Clear the prototype's dbid so we don't accidentally overwrite it in the db
-        item.dbid = None
+        item = GameItem(spawn_id=spawn_id, shared=self.shared_attrs())
         item.build_area = self.area.name
         item.build_id = self.id
         for key, value in self.item_types.items():
@@ -248,18 +308,63 @@ class GameItem(Item):
         Column('container', type="INTEGER", write=write_model, foreign_key=(db_table_name, 'dbid'), cascade="ON DELETE"),
         Column('owner', type="INTEGER", write=write_model, foreign_key=('player', 'dbid'), cascade='ON DELETE')
     ]
-    def __init__(self, args={}, spawn_id=None):
+    # The columns that aren't shared with a prototype
+    own_columns = [col for col in db_columns if col.name not in SHARED_COLUMNS]
+    # There can be a great many game items, so they don't get a dictionary
+    # each. The shared columns are kept in _<column-name> (see SharedColumn).
+    __slots__ = column_slots(own_columns, 'spawn_id', 'shared', 'item_types',
+                             *['_' + name for name in sorted(SHARED_COLUMNS)])
+    read_own_columns = column_reader(own_columns)
+    def __init__(self, args={}, spawn_id=None, shared=None):
+        """shared -- the shared_attrs of the BuildItem this item is being
+        loaded from (the values shared with our prototype); only the columns
+        that aren't shared are read from args.
+        """
         self.spawn_id = spawn_id
-        Item.__init__(self, args)
+        self.shared = shared
+        if shared is None:
+            Item.__init__(self, args)
+        else:
+            self.item_types = {}
+            self.read_own_columns(args)
+            self.saved_state = None
     
     def load_extras(self):
         for key, value in ITEM_TYPES.items():
-            row = self.world.db.select('* FROM %s WHERE game_item=?' % key,
-                                       [self.dbid])
+            row = self.world.db.select_related(key, 'game_item', self.dbid)
             if row:
                 row[0]['game_item'] = self
                 self.item_types[key] = value(row[0])
     
 
+for name in SHARED_COLUMNS:
+    setattr(GameItem, name, SharedColumn(name, GameItem.__dict__['_' + name]))
+
+def preload_inventory(db, owner):
+    """Fetch the rows for every game item owned by owner (a player's dbid),
+    everything inside those items (however deeply their containers are
+    nested), and all of their item types, with a single query per table, so
+    that loading the inventory doesn't need a query per item.
+    Call db.clear_preloaded() once the inventory has been loaded.
+    """
+    # Find the dbids of the whole item tree once, and then bind them into
+    # each table's select (in batches, since SQLite limits how many
+    # parameters a statement can have)
+    rows = db.select('dbid FROM (WITH RECURSIVE tree(dbid) AS ('
+                     'SELECT dbid FROM game_item WHERE owner=? '
+                     'UNION SELECT game_item.dbid FROM game_item '
+                     'JOIN tree ON game_item.container=tree.dbid) '
+                     'SELECT dbid FROM tree)', [owner])
+    dbids = [row['dbid'] for row in rows]
+    for start in range(0, len(dbids), MAX_PARAMS):
+        batch = dbids[start:start + MAX_PARAMS]
+        marks = ','.join(['?'] * len(batch))
+        db.preload('game_item', ['owner', 'container'],
+                   '* FROM game_item WHERE dbid IN (%s)' % marks, batch)
+        for table in ITEM_TYPES:
+            db.preload(table, 'game_item',
+                       '* FROM %s WHERE game_item IN (%s)' % (table, marks), batch)
+    
+
 model_list.register(BuildItem)
 model_list.register(GameItem)
\ No newline at end of file
@@ -224,10 +224,13 @@ class Equippable(ItemType):
         return string
     
     def load(self, game_item):
-        e = Equippable(self.copy_save_attrs())
-        e.build_item = None
-        e.game_item = game_item
-        return e
+        d = self.copy_save_attrs()
+        if 'dbid' in d:
+            del d['dbid']
+        if 'build_item' in d:
+            del d['build_item']
+        d['game_item'] = game_item
+        return Equippable(d)
     
     def on_equip(self):
         #only Inventory items can be equipped, so make sure
@@ -556,7 +559,7 @@ class Container(ItemType):
         if not self.game_item:
             return
         from shinymud.models.item import GameItem
-        rows = self.world.db.select('* from game_item where container=?', [self.game_item.dbid])
+        rows = self.world.db.select_related('game_item', 'container', self.game_item.dbid)
         for row in rows:
             new_item = GameItem(row)
             self.inventory.append(new_item)
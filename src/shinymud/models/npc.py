@@ -1,6 +1,6 @@
 from shinymud.models.character import Character
 from shinymud.modes.text_edit_mode import TextEditMode
-from shinymud.models import Model, Column, model_list
+from shinymud.models import Model, Column, model_list, column_slots, compile_function
 from shinymud.models.shiny_types import *
 from shinymud.lib.event_handler import EVENTS
 from shinymud.commands import get_permission_names, PERMS
@@ -26,8 +26,20 @@ class Npc(Character):
         Column('permissions', type="INTEGER", read=int, write=int, default=5)
         
     ]
+    # Spawned npcs can be numerous, so they don't get a dictionary each
+    __slots__ = column_slots(db_columns,
+                             # See Character.characterize
+                             'atk', 'battle', '_battle_target', 'inventory', 'equipped',
+                             'isequipped', '_attack_queue', '_hit', '_evade', '_absorb',
+                             '_damage', 'effects', 'position',
+                             # See load
+                             'spawn_id', 'events', 'ai_packs', 'location', 'actionq',
+                             'cmdq', 'remember',
+                             # See spawn_template
+                             'template')
     def __init__(self, args={}):
         self.spawn_id = None
+        self.template = None
         self.events = {}
         self.ai_packs = {}
         self.characterize(args)
@@ -79,20 +91,56 @@ description:
     def load(self, spawn_id=None):
         """Create a copy of this npc, then add the necessary attributes for the
         npc to survive in the game-environment.
+        Copies are cloned by our spawn_template, so only the things each copy
+        needs its own of get made for every npc that's spawned.
         """
-        args = self.copy_save_attrs()
-        args['dbid'] = None
-        new_npc = Npc(args)
-        new_npc.spawn_id = spawn_id
-        new_npc.events = self.events
-        new_npc.ai_packs = self.ai_packs
-        new_npc.permissions = self.permissions
-        new_npc.location = None
-        new_npc.inventory = []
-        new_npc.actionq = []
-        new_npc.cmdq = []
-        new_npc.remember = []
-        return new_npc
+        return self.spawn_template()(self, spawn_id)
+    
+    def spawn_template(self):
+        """Return a function(prototype, spawn_id) that clones a copy of this
+        npc, with the attributes of a copy made the slow way (through Npc's
+        constructor). The values that can be shared are shared by every
+        clone, and the lists and dictionaries (which get changed in place)
+        are copied. The function is built once, and thrown away whenever
+        we're saved - every change a builder makes to an npc gets saved.
+        """
+        if self.template is None:
+            args = self.copy_save_attrs()
+            args['dbid'] = None
+            npc = Npc(args)
+            npc.location = None
+            npc.inventory = []
+            npc.actionq = []
+            npc.cmdq = []
+            npc.remember = []
+            # These come from the prototype itself
+            cloned = ['spawn_id', 'events', 'ai_packs', 'permissions']
+            namespace = {'new': Npc.__new__, 'Npc': Npc}
+            lines = ['def clone(prototype, spawn_id):',
+                     '    npc = new(Npc)',
+                     '    npc.spawn_id = spawn_id',
+                     '    npc.events = prototype.events',
+                     '    npc.ai_packs = prototype.ai_packs',
+                     '    npc.permissions = prototype.permissions']
+            for i, name in enumerate(Npc.__slots__):
+                # Lazy registers don't exist until they're used
+                if name in cloned or not hasattr(npc, name):
+                    continue
+                value = getattr(npc, name)
+                namespace['value_%s' % i] = value
+                if isinstance(value, list):
+                    lines.append('    npc.%s = value_%s[:]' % (name, i))
+                elif isinstance(value, dict):
+                    lines.append('    npc.%s = value_%s.copy()' % (name, i))
+                else:
+                    lines.append('    npc.%s = value_%s' % (name, i))
+            lines.append('    return npc')
+            self.template = compile_function('clone', lines, namespace)
+        return self.template
+    
+    def save(self):
+        self.template = None
+        Character.save(self)
     
     def set_mode(self, mode):
         pass
@@ -195,7 +243,7 @@ description:
 # ***** Event functions *****
     def load_events(self):
         """Load the events associated with this NPC."""
-        events = self.world.db.select('* FROM npc_event WHERE prototype=?', [self.dbid])
+        events = self.world.db.select_related('npc_event', 'prototype', self.dbid)
         self.world.log.debug(events)
         for event in events:
             self.new_event(event)
@@ -307,8 +355,7 @@ description:
 # ***** ai pack functions *****
     def load_ai_packs(self):
         for key, value in NPC_AI_PACKS.items():
-            row = self.world.db.select('* FROM %s WHERE npc=?' % key,
-                                       [self.dbid])
+            row = self.world.db.select_related(key, 'npc', self.dbid)
             if row:
                 row[0]['npc'] = self
                 self.ai_packs[key] = value(row[0])
@@ -8,7 +8,7 @@ from shinymud.modes.text_edit_mode import TextEditMode
 from shinymud.modes.passchange_mode import PassChangeMode
 from shinymud.models import Model, Column, model_list
 from shinymud.models.shiny_types import *
-from shinymud.models.item import GameItem
+from shinymud.models.item import GameItem, preload_inventory
 from shinymud.models.character import Character
 
 import re
@@ -37,6 +37,13 @@ class Player(Character):
         self.name = self.conn
         self.inq = []
         self.outq = []
+        # Set when the player's connection can't keep up with their output
+        # (see send_output)
+        self.output_stalled = False
+        # How many lines of output have been thrown away for this player, by
+        # priority, and how many they haven't been told about yet
+        self.dropped_output = {'low': 0, 'normal': 0}
+        self.unreported_drops = 0
         self.quit_flag = False
         self.mode = InitMode(self)
         self.last_mode = None
@@ -52,28 +59,53 @@ class Player(Character):
         self.load_inventory()
     
     def load_inventory(self):
-        rows = self.world.db.select('* FROM game_item WHERE owner=?', [self.dbid])
-        if rows:
-            for row in rows:
-                item = GameItem(row)
-                item.owner = self
-                if item.has_type('equippable'):
-                    equip_type = item.item_types['equippable']
-                    if equip_type.is_equipped:
-                        self.equipped[equip_type.equip_slot] = item
-                        self.isequipped.append(item)
-                        equip_type.on_equip()
-                if item.has_type('container'):
-                    item.item_types['container'].load_inventory()
-                self.inventory.append(item)
+        if not self.dbid:
+            return
+        # Fetch the player's whole item tree up front, instead of a query per
+        # item (and per item type, and per container)
+        try:
+            preload_inventory(self.world.db, self.dbid)
+            rows = self.world.db.select_related('game_item', 'owner', self.dbid)
+            if rows:
+                for row in rows:
+                    item = GameItem(row)
+                    item.owner = self
+                    if item.has_type('equippable'):
+                        equip_type = item.item_types['equippable']
+                        if equip_type.is_equipped:
+                            self.equipped[equip_type.equip_slot] = item
+                            self.isequipped.append(item)
+                            equip_type.on_equip()
+                    if item.has_type('container'):
+                        item.item_types['container'].load_inventory()
+                    self.inventory.append(item)
+        finally:
+            # Don't leave anything preloaded for other loads to trip over
+            self.world.db.clear_preloaded()
     
-    def update_output(self, data):
-        """Helpfully inserts data into the player's output queue."""
+    def update_output(self, data, priority='normal'):
+        """Helpfully inserts data into the player's output queue.
+        priority -- 'low' for chatter (chat, emotes, room echoes) that can be
+            thrown away once the player has OUTPUT_HIGH_WATER lines waiting (or
+            their connection has stalled), 'normal' for everything else. Even
+            normal output is thrown away past OUTPUT_MAX_LINES.
+        """
         if isinstance(data, basestring):
-            self.outq.append(data)
-        
-        elif isinstance(data, list):
-            self.outq += data
+            data = [data]
+        elif not isinstance(data, list):
+            return
+        if priority == 'low':
+            limit = 0 if self.output_stalled else OUTPUT_HIGH_WATER
+        else:
+            limit = OUTPUT_MAX_LINES
+        room = max(limit - len(self.outq), 0)
+        if len(data) > room:
+            dropped = len(data) - room
+            self.dropped_output[priority] += dropped
+            self.world.output_drops[priority] += dropped
+            self.unreported_drops += dropped
+            data = data[:room]
+        self.outq += data
     
     def get_input(self):
         """Gets raw input from the player and queues it for later processing."""
@@ -90,7 +122,17 @@ class Player(Character):
     
     def send_output(self):
         """Sends all data from the player's output queue to the player."""
+        # If the connection still has more than SEND_BUFFER_HIGH_WATER bytes
+        # from earlier turns that the client hasn't taken yet, hold on to the
+        # output until they catch up (update_output drops chatter meanwhile)
+        self.output_stalled = self.conn.backlog() > SEND_BUFFER_HIGH_WATER
+        if self.output_stalled:
+            return
         if (len(self.outq) > 0):
+            if self.unreported_drops:
+                self.outq.append('[%s messages were dropped because your '
+                                 'connection is falling behind.]' % self.unreported_drops)
+                self.unreported_drops = 0
             self.enqueue_prompt()
             alive = self.conn.send(self.outq)
         
@@ -169,6 +211,8 @@ class Player(Character):
         # process. Don't save the incomplete data.
         if self.dbid:
             self.save()
+            # Don't leave the player's changes waiting on the next flush
+            self.world.db.flush()
             
             if not broken_pipe:
                 self.world.play_log.info('%s has exited.' % self.fancy_name())
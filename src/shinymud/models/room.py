@@ -1,7 +1,7 @@
 from shinymud.models.room_exit import RoomExit
 from shinymud.models.spawn import Spawn
 from shinymud.modes.text_edit_mode import TextEditMode
-from shinymud.models import Model, Column, model_list
+from shinymud.models import Model, Column, model_list, column_slots
 from shinymud.models.shiny_types import *
 import re
 
@@ -9,6 +9,54 @@ dir_opposites = {'north': 'south', 'south': 'north',
                  'east': 'west', 'west': 'east',
                  'up': 'down', 'down': 'up'}
 
+# The directions a room can have exits in, in the order a dictionary of them
+# has always listed them
+DIRECTIONS = ('north', 'west', 'up', 'down', 'east', 'south')
+
+class Exits(object):
+    """A room's exits: works like a dictionary of direction:exit (None if
+    there isn't an exit that way) with a key for every direction, but keeps
+    them in slots instead of a hash table.
+    """
+    __slots__ = DIRECTIONS
+    def __init__(self):
+        for direction in DIRECTIONS:
+            setattr(self, direction, None)
+    
+    def __getitem__(self, direction):
+        if direction not in dir_opposites:
+            raise KeyError(direction)
+        return getattr(self, direction)
+    
+    def __setitem__(self, direction, exit):
+        if direction not in dir_opposites:
+            raise KeyError(direction)
+        setattr(self, direction, exit)
+    
+    def __contains__(self, direction):
+        return direction in dir_opposites
+    
+    def __iter__(self):
+        return iter(DIRECTIONS)
+    
+    def __len__(self):
+        return len(DIRECTIONS)
+    
+    def get(self, direction, default=None):
+        if direction not in dir_opposites:
+            return default
+        return getattr(self, direction)
+    
+    def keys(self):
+        return list(DIRECTIONS)
+    
+    def values(self):
+        return [getattr(self, direction) for direction in DIRECTIONS]
+    
+    def items(self):
+        return [(direction, getattr(self, direction)) for direction in DIRECTIONS]
+    
+
 class Room(Model):
     db_table_name = 'room'
     db_columns = Model.db_columns + [
@@ -19,17 +67,20 @@ class Room(Model):
         Column('description', default='This is a shiny new room!')
     ]
     db_extras = Model.db_extras + ['UNIQUE (area, id)']
+    # Big worlds have a lot of rooms, so they don't get a dictionary each
+    __slots__ = column_slots(db_columns, 'items', 'exits', 'npcs', 'spawns',
+                             'last_spawn_id', 'players')
     def __init__(self, args={}):
-        self.items = []
-        self.exits = {'north': None,
-                      'south': None,
-                      'east': None,
-                      'west': None,
-                      'up': None,
-                      'down': None}
-        self.npcs = []
-        self.spawns = {}
-        self.players = {}
+        # Most rooms are empty most of the time, so they all share the same
+        # empty lists and dictionaries until they have something to put in
+        # them (see item_add, add_char and new_spawn)
+        self.items = EMPTY_LIST
+        self.exits = Exits()
+        self.npcs = EMPTY_LIST
+        self.spawns = EMPTY_DICT
+        # The last id handed out by get_spawn_id
+        self.last_spawn_id = None
+        self.players = EMPTY_DICT
         Model.__init__(self, args)
     
     def load_extras(self):
@@ -203,7 +254,7 @@ spawns: %s""" % (self.name, self.description, nice_exits, spawns)
         self.exits[exit_dict['direction']] = new_exit
     
     def load_exits(self):
-        rows = self.world.db.select("* from room_exit where room=?", [self.dbid])
+        rows = self.world.db.select_related('room_exit', 'room', self.dbid)
         for row in rows:
             row['room'] = self
             self.exits[row['direction']] = RoomExit(row)
@@ -264,17 +315,19 @@ spawns: %s""" % (self.name, self.description, nice_exits, spawns)
         spawn = Spawn(spawn_dict)
         if not spawn.dbid:
             spawn.save()
+        if not self.spawns:
+            self.spawns = {}
         self.spawns[spawn.id] = spawn
+        if self.last_spawn_id is not None:
+            self.last_spawn_id = max(self.last_spawn_id, highest_id([spawn.id]))
         return spawn
     
     def get_spawn_id(self):
-        rows = self.world.db.select("max(id) as id from room_spawns where room=?", [self.dbid])
-        max_id = rows[0]['id']
-        if max_id:
-            your_id = int(max_id) + 1
-        else:
-            your_id = 1
-        return str(your_id)
+        """Generate an id for a new spawn in this room (like Area.get_id)."""
+        if self.last_spawn_id is None:
+            self.last_spawn_id = highest_id(self.spawns)
+        self.last_spawn_id += 1
+        return str(self.last_spawn_id)
     
     def load_spawns(self, spawn_list=None):
         """
@@ -282,7 +335,7 @@ spawns: %s""" % (self.name, self.description, nice_exits, spawns)
         or the database.
         """
         if not spawn_list:
-            spawn_list = self.world.db.select('* FROM room_spawns WHERE room=?', [self.dbid])
+            spawn_list = self.world.db.select_related('room_spawns', 'room', self.dbid)
         self.world.log.debug(spawn_list) 
         #Build a dictionary of what spawns where (room, another item, an npc) which we will
         #call the dependencies. We need to build this list since self.new_spawn() needs 
@@ -360,8 +413,12 @@ spawns: %s""" % (self.name, self.description, nice_exits, spawns)
                 if spawn.spawn_type == 'npc':
                     npc = spawn.spawn()
                     npc.location = self
+                    if not self.npcs:
+                        self.npcs = []
                     self.npcs.append(npc)
                 else:
+                    if not self.items:
+                        self.items = []
                     self.items.append(spawn.spawn())
     
 #************** Character Management **************
@@ -372,10 +429,14 @@ spawns: %s""" % (self.name, self.description, nice_exits, spawns)
             this room; should be a string in the format '<room-id>_<area-name>'
         """
         if char.is_npc():
+            if not self.npcs:
+                self.npcs = []
             self.npcs.append(char)
         else:
+            if not self.players:
+                self.players = {}
             self.players[char.name] = char
-            self.area.times_visited_since_reset += 1
+            self.area.visit()
             self.fire_event('pc_enter', {'player': char, 'from': prev_room})
     
     def remove_char(self, char):
@@ -411,12 +472,14 @@ spawns: %s""" % (self.name, self.description, nice_exits, spawns)
         """Echo something to everyone in the room, except the people on the exclude list."""
         for person in self.players.values():
             if (person.name not in exclude_list) and (person.position[0] != 'sleeping'):
-                person.update_output(message)
+                person.update_output(message, priority='low')
         self.fire_event('hears', {'string': message, 'teller': teller})
     
 #************** Item Management **************
     def item_add(self, item):
         """Add an item to this room."""
+        if not self.items:
+            self.items = []
         self.items.append(item)
     
     def item_remove(self, item):
@@ -1,4 +1,4 @@
-from shinymud.models import Model, Column, model_list
+from shinymud.models import Model, Column, model_list, column_slots
 from shinymud.models.shiny_types import *
 from shinymud.data.config import *
 import re
@@ -11,7 +11,7 @@ class RoomExit(Model):
         # I always expect room to be passed in by the function calling this class'
         # constructor. For this reason, I'm not bothering with a more elaborate
         # read function for room_id.
-        Column('room', null=False, write=write_model),
+        Column('room', null=False, write=write_model, indexed=True),
         Column('direction', null=False),
         Column('linked_exit'),
         Column('openable', read=to_bool),
@@ -22,6 +22,7 @@ class RoomExit(Model):
         Column('key_id')
     ]
     db_extras = Model.db_extras + ['UNIQUE (room, direction)']
+    __slots__ = column_slots(db_columns, '_closed', '_locked', '_to_room', '_key')
     
     def __init__(self, args={}):
         Model.__init__(self, args)
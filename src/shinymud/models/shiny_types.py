@@ -31,6 +31,8 @@ def copy_dict(val):
 def read_list(val):
     if isinstance(val, list):
         return val
+    if isinstance(val, tuple):
+        return list(val)
     if not val:
         return []
     return val.split(',')
@@ -130,3 +132,29 @@ def read_float(val):
     except ValueError:
         r = 0.0
     return r
+
+def highest_id(ids):
+    """Return the highest of a collection of string ids (like the keys of an
+    area's rooms dictionary) as an int, or 0 if there aren't any numeric ones.
+    """
+    return max([int(i) for i in ids if str(i).isdigit()] or [0])
+
+class EmptyList(list):
+    """An empty list that can't be changed, so that a single one can be
+    shared by every object that hasn't got anything to put in its list yet.
+    Replace it with a real list before adding to it.
+    """
+    def _shared(self, *args, **kwargs):
+        raise TypeError('This empty list is shared; replace it before changing it.')
+    append = extend = insert = remove = pop = sort = reverse = _shared
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _shared
+    __iadd__ = __imul__ = _shared
+
+class EmptyDict(dict):
+    """An empty dictionary that can't be changed (see EmptyList)."""
+    def _shared(self, *args, **kwargs):
+        raise TypeError('This empty dictionary is shared; replace it before changing it.')
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _shared
+
+EMPTY_LIST = EmptyList()
+EMPTY_DICT = EmptyDict()
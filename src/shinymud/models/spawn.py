@@ -1,4 +1,4 @@
-from shinymud.models import Model, Column, model_list
+from shinymud.models import Model, Column, model_list, column_slots
 from shinymud.models.shiny_types import *
 
 class Spawn(Model):
@@ -12,10 +12,12 @@ class Spawn(Model):
         Column('spawn_object_area', null=False),
         Column('container', write=lambda container: container.id)
     ]
+    __slots__ = column_slots(db_columns, '_spawn_obj', 'nested_spawns')
     def __init__(self, args={}):
         Model.__init__(self, args)
         self.spawn_object = args.get('obj')
-        self.nested_spawns = []
+        # Shared until something is nested in this spawn
+        self.nested_spawns = EMPTY_LIST
     
     def __str__(self):
         string = ('%s - %s (%s:%s) - spawns %s' % (self.spawn_type.capitalize(), 
@@ -57,6 +59,8 @@ class Spawn(Model):
     spawn_object = property(_get_spawn_obj, _set_spawn_obj)
     def add_nested_spawn(self, spawn):
         """Add another item to this object's "containee list"."""
+        if not self.nested_spawns:
+            self.nested_spawns = []
         self.nested_spawns.append(spawn)
     
     def remove_nested_spawn(self, spawn):
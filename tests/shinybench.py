@@ -0,0 +1,708 @@
+#!/usr/bin/env python
+"""shinybench.py
+
+Benchmarks for the parts of ShinyMUD that get hammered when the game is under
+load. These aren't unit tests (they don't pass or fail), they just print
+timings so we can compare approaches and catch regressions.
+
+Run them from the tests directory, the same way as the unit tests:
+    PYTHONPATH=../src python shinybench.py [benchmark-name ...]
+If no benchmark names are given, all of them are run.
+"""
+import sys
+import time
+
+BENCHMARKS = []
+
+def benchmark(func):
+    """Register a function as a benchmark."""
+    BENCHMARKS.append(func)
+    return func
+
+def make_world():
+    """Create a fresh world with an in-memory database (just like
+    ShinyTestCase does).
+    """
+    remove = [m for m in sys.modules.keys() if 'shinymud' in m]
+    for r in remove:
+        del sys.modules[r]
+    from shinymud.lib.world import World
+    World._instance = None
+    world = World(':memory:')
+    from shinymud.lib.setup import initialize_database
+    initialize_database()
+    return world
+
+def timed(func, repeat=5):
+    """Run func repeat times and return the average time it took (in
+    seconds).
+    """
+    start = time.time()
+    for _ in xrange(repeat):
+        func()
+    return (time.time() - start) / repeat
+
+def report(label, seconds):
+    print '  %-50s %10.3f ms' % (label, seconds * 1000)
+
+def raise_file_limit(wanted):
+    """Try to raise our open file limit to wanted, return the actual limit."""
+    try:
+        import resource
+    except ImportError:
+        return wanted
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < wanted:
+        if hard != resource.RLIM_INFINITY:
+            wanted = min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+        except (ValueError, resource.error):
+            return soft
+        return wanted
+    return soft
+
+def deep_size(roots, exclude=(), stop=()):
+    """Return the number of bytes used by roots and everything they refer to
+    (models, their slots and attribute dictionaries, and any lists,
+    dictionaries and strings in them), not counting anything that can be
+    reached from exclude, or the objects in stop (or classes, functions or
+    modules).
+    """
+    import gc
+    import types
+    skip = (type, types.ClassType, types.FunctionType, types.MethodType,
+            types.ModuleType, types.BuiltinFunctionType)
+    # The kinds of objects a model's data is made of
+    data_modules = ('shinymud.models', 'shinymud.lib.registers', 'shinymud.lib.battle')
+    seen = set([id(obj) for obj in stop])
+    def walk(obj, count):
+        total = 0
+        stack = [obj]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in seen or isinstance(obj, skip):
+                continue
+            seen.add(id(obj))
+            if count:
+                total += sys.getsizeof(obj)
+            if isinstance(obj, dict):
+                stack.extend(obj.keys())
+                stack.extend(obj.values())
+            elif isinstance(obj, (list, tuple, set, frozenset)):
+                stack.extend(obj)
+            elif type(obj).__module__.startswith(data_modules):
+                # This finds the values in an object's slots, and its
+                # dictionary (without creating one if it doesn't have one);
+                # anything else (the world, loggers and so on) is left alone
+                stack.extend(gc.get_referents(obj))
+        return total
+    walk(list(exclude), False)
+    return walk(list(roots), True)
+
+@benchmark
+def tick():
+    """Input polling cost per turn with idle connections: a failing recv per
+    player (the old way) vs. waiting on the Reactor.
+    """
+    import socket
+    from socket import error as socket_error
+    world = make_world()
+    from shinymud.lib.connection_handlers.reactor import Reactor
+    from shinymud.lib.connection_handlers.shiny_connections import ShinyConnection
+    limit = raise_file_limit(2 * 5000 + 100)
+    for count in (100, 1000, 5000):
+        if 2 * count + 50 > limit:
+            print '  skipping %s connections (open file limit is %s)' % (count, limit)
+            continue
+        pairs = [socket.socketpair() for _ in xrange(count)]
+        servers = [server for client, server in pairs]
+        for server in servers:
+            server.setblocking(0)
+        
+        def poll_every_connection():
+            for server in servers:
+                try:
+                    server.recv(256)
+                except socket_error:
+                    pass
+        
+        reactor = Reactor(world)
+        conns = [ShinyConnection((server, 'bench'), world.log) for server in servers]
+        for conn in conns:
+            reactor.add(conn)
+        
+        def wait_on_reactor():
+            reactor.poll(0)
+            for conn in conns:
+                conn.recv()
+        
+        report('%s idle connections, recv per connection' % count,
+               timed(poll_every_connection))
+        report('%s idle connections, reactor' % count, timed(wait_on_reactor))
+        for client, server in pairs:
+            client.close()
+            server.close()
+
+@benchmark
+def resets():
+    """Per-turn cost of deciding which areas need to reset with 10,000 areas
+    in the world: scanning every area (the old way) vs. the reset scheduler.
+    """
+    world = make_world()
+    from shinymud.models.area import Area
+    from shinymud.data.config import RESET_INTERVAL
+    for i in xrange(10000):
+        world.area_add(Area({'name': 'area%s' % i}))
+    now = time.time()
+    for area in world.areas.values():
+        area.time_of_last_reset = now
+    # A hundred areas have had visitors
+    for area in world.areas.values()[:100]:
+        area.visit()
+    
+    def scan_every_area():
+        for area in world.areas.values():
+            if area.times_visited_since_reset > 0:
+                now = time.time()
+                if (now - area.time_of_last_reset) >= RESET_INTERVAL:
+                    area.reset()
+    
+    def ask_scheduler():
+        for area in world.reset_scheduler.pop_due(time.time()):
+            area.reset()
+    
+    report('10000 areas (100 visited), scan every area', timed(scan_every_area, 20))
+    report('10000 areas (100 visited), reset scheduler', timed(ask_scheduler, 20))
+    start = time.time()
+    for area in world.areas.values():
+        area.times_visited_since_reset = 0
+        area.visit()
+    report('schedule all 10000 areas', time.time() - start)
+    start = time.time()
+    due = world.reset_scheduler.pop_due(now + RESET_INTERVAL)
+    report('pop all %s due areas' % len(due), time.time() - start)
+
+@benchmark
+def battles():
+    """Rounds per second for 2v2, 20v20 and 200v200 battles between npcs
+    that are too tough to die.
+    """
+    world = make_world()
+    import logging
+    # Battles log a lot at debug level; don't time the logging
+    world.log.setLevel(logging.WARNING)
+    from shinymud.models.area import Area
+    from shinymud.lib.battle import Battle
+    area = Area.create({'name': 'arena'})
+    room = area.new_room()
+    prototype = area.new_npc()
+    for size in (2, 20, 200):
+        battle = Battle()
+        for team in ('A', 'B'):
+            for i in xrange(size):
+                npc = prototype.load()
+                npc.name = '%s%s' % (team, i)
+                npc.hp = 10 ** 9
+                npc.location = room
+                battle.add_character(npc, team)
+        # Spread the attacks out over the other team
+        for i, npc in enumerate(battle.teamA + battle.teamB):
+            npc.battle_target = battle.opponents(npc)[i % size]
+        rounds = 50
+        seconds = timed(battle.perform_round, rounds)
+        report('%sv%s, per round' % (size, size), seconds)
+        print '  %-50s %10.1f' % ('%sv%s, rounds per second' % (size, size),
+                                  1 / seconds)
+
+@benchmark
+def mccp():
+    """MCCP2 compression of a player walking through every room of the
+    builtin areas (one room description per turn), at a few zlib levels.
+    """
+    world = make_world()
+    import socket
+    import zlib
+    from shinymud.lib.sport import inport_dir
+    from shinymud.data.config import ROOT_DIR
+    from shinymud.models.player import Player
+    from shinymud.lib.connection_handlers.shiny_connections import TelnetConnection
+    inport_dir('area', source_path=ROOT_DIR + '/areas/builtin')
+    rooms = []
+    for area in world.areas.values():
+        rooms.extend(area.rooms.values())
+    bob = Player(('bob', 'bar'))
+    bob.mode = None
+    bob.playerize({'name': 'bob', 'password': 'pork'})
+    views = []
+    for room in rooms:
+        bob.location = room
+        views.append([bob.look_at_room(), '<HP:20/20 MP:5/5> '])
+    for level in (0, 1, 6, 9):
+        client, server = socket.socketpair()
+        conn = TelnetConnection((server, 'bench'), world.log)
+        client.setblocking(0)
+        if level:
+            conn.compressor = zlib.compressobj(level)
+        for view in views:
+            conn.send(list(view))
+            # Keep the client reading so the socket doesn't fill up
+            while True:
+                try:
+                    client.recv(65536)
+                except socket.error:
+                    break
+        stats = conn.output_stats()
+        label = 'level %s' % level if level else 'uncompressed'
+        print '  %-20s %4s rooms %9s bytes -> %9s bytes (%.2fx), %7.2f ms zlib' % (
+            label, len(views), stats['output_bytes'], stats['wire_bytes'],
+            stats['ratio'], stats['compress_ms'])
+        conn.close()
+        client.close()
+
+@benchmark
+def boot():
+    """Loading a generated world of 10 areas, each with 200 rooms, 100 items
+    and 50 npcs: a query per object (the old way) vs. preloading each table
+    with one query for the whole world.
+    """
+    world = make_world()
+    import logging
+    world.log.setLevel(logging.WARNING)
+    from shinymud.models.area import Area, preload_areas
+    for a in xrange(10):
+        area = Area.create({'name': 'area%s' % a})
+        for i in xrange(100):
+            item = area.new_item()
+            if i % 2:
+                item.build_add_type('container')
+        for i in xrange(50):
+            area.new_npc()
+        for i in xrange(200):
+            room = area.new_room()
+            if i:
+                room.build_add_exit('north to %s' % i)
+            room.build_add_spawn('item %s' % (i % 100 + 1))
+            room.build_add_spawn('npc %s' % (i % 50 + 1))
+    db = world.db
+    select = db.select
+    queries = []
+    def counted_select(query, params=None):
+        queries.append(query)
+        return select(query, params)
+    db.select = counted_select
+    
+    def boot_areas(preload):
+        del queries[:]
+        start = time.time()
+        areas = [Area(row) for row in db.select('* FROM area')]
+        if preload:
+            preload_areas(db)
+        for area in areas:
+            # Without preloading, every object selects its own rows
+            area.load(preloaded=True)
+        db.clear_preloaded()
+        report('%s, %s queries' % ('preloaded' if preload else 'query per object',
+                                   len(queries)), time.time() - start)
+    
+    boot_areas(False)
+    boot_areas(True)
+
+@benchmark
+def indexes():
+    """Looking up a player's inventory and a container's contents in a
+    database with 1,000,000 game items, without indexes (the old way) and with
+    the ones initialize_database creates for foreign keys.
+    """
+    world = make_world()
+    conn = world.db.conn
+    conn.execute('PRAGMA foreign_keys = false')
+    players = 10000
+    conn.executemany('INSERT INTO game_item (name, owner, container) VALUES (?,?,?)',
+                     (('item%s' % i, i % players + 1, (i // 10) or None if i % 10 else None)
+                      for i in xrange(1000000)))
+    conn.commit()
+    index_names = ['game_item_owner_index', 'game_item_container_index']
+    sql = [row[0] for row in conn.execute("SELECT sql FROM sqlite_master WHERE name IN (?,?)",
+                                          index_names)]
+    
+    def lookups():
+        for i in xrange(1, 101):
+            world.db.select('* FROM game_item WHERE owner=?', [i])
+            world.db.select('* FROM game_item WHERE container=?', [i * 10])
+    
+    for name in index_names:
+        conn.execute('DROP INDEX %s' % name)
+    report('100 inventories + 100 containers, no indexes', timed(lookups, 1))
+    start = time.time()
+    for statement in sql:
+        conn.execute(statement)
+    report('create both indexes', time.time() - start)
+    report('100 inventories + 100 containers, indexed', timed(lookups, 5))
+
+@benchmark
+def ids():
+    """Creating 50,000 rooms in one area, timed in batches of 10,000, with
+    ids from the area's in-memory counter (the old way asked the database for
+    the highest id every time, which is shown for comparison).
+    """
+    world = make_world()
+    import logging
+    world.log.setLevel(logging.WARNING)
+    from shinymud.models.area import Area
+    area = Area.create({'name': 'big'})
+    for batch in xrange(5):
+        start = time.time()
+        for _ in xrange(10000):
+            area.new_room()
+        report('rooms %s-%s' % (batch * 10000 + 1, (batch + 1) * 10000),
+               time.time() - start)
+    def select_max():
+        world.db.select("max(CAST(id AS INT)) as id from room where area=?", ['big'])
+    report('one SELECT max(id) with 50000 rooms (old get_id)', timed(select_max, 20))
+
+@benchmark
+def profiles():
+    """Commit latency on a file database under each storage profile, while
+    another thread keeps reading from its own connection (the way a
+    connection-handler or import thread would).
+    """
+    import os
+    import tempfile
+    import threading
+    import sqlite3
+    import logging
+    from shinymud.lib.db import DB
+    log = logging.getLogger('bench')
+    profiles = [
+        ('rollback journal, synchronous FULL', {'journal_mode': 'DELETE', 'synchronous': 'FULL'}),
+        ('WAL, synchronous FULL', {'journal_mode': 'WAL', 'synchronous': 'FULL'}),
+        ('WAL, synchronous NORMAL', {'journal_mode': 'WAL', 'synchronous': 'NORMAL'}),
+        ('WAL, NORMAL, cache/mmap/temp_store', {'journal_mode': 'WAL', 'synchronous': 'NORMAL',
+                                                'cache_size': -16000,
+                                                'mmap_size': 64 * 1024 * 1024,
+                                                'temp_store': 'MEMORY'}),
+    ]
+    for label, profile in profiles:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        db = DB(log, conn=path, profile=profile)
+        db.conn.execute('CREATE TABLE foo (id INTEGER PRIMARY KEY, val INTEGER)')
+        db.conn.executemany('INSERT INTO foo (val) VALUES (?)', ((i,) for i in xrange(10000)))
+        db.conn.commit()
+        done = threading.Event()
+        counts = {'reads': 0, 'locked': 0}
+        def read():
+            conn = sqlite3.Connection(path, timeout=0)
+            while not done.is_set():
+                try:
+                    conn.execute('SELECT count(*), sum(val) FROM foo WHERE val < 5000').fetchone()
+                    counts['reads'] += 1
+                except sqlite3.OperationalError:
+                    counts['locked'] += 1
+            conn.close()
+        reader = threading.Thread(target=read)
+        reader.start()
+        # Commit as fast as we can for a couple of seconds
+        latencies = []
+        end = time.time() + 2
+        i = 0
+        while time.time() < end:
+            began = time.time()
+            db.update('foo SET val=? WHERE id=?', [i, i % 10000 + 1])
+            latencies.append(time.time() - began)
+            i += 1
+        commits = len(latencies)
+        done.set()
+        reader.join()
+        latencies.sort()
+        print '  %s' % label
+        print '  %-50s %10d' % ('    commits in 2 seconds', commits)
+        report('    mean commit', sum(latencies) / commits)
+        report('    99th percentile commit', latencies[int(commits * 0.99)])
+        print '  %-50s %10d reads, %d locked out' % ('    concurrent reader',
+                                                     counts['reads'], counts['locked'])
+        db.conn.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+@benchmark
+def select():
+    """Selecting 100,000 game items, building each row's dictionary with a
+    python comprehension over unicode parameters (the old way) vs. DB.select.
+    """
+    world = make_world()
+    conn = world.db.conn
+    conn.execute('PRAGMA foreign_keys = false')
+    conn.executemany('INSERT INTO game_item (name, title, description, keywords, owner) '
+                     'VALUES (?,?,?,?,?)',
+                     (('item%s' % i, 'A shiny item', 'This is a shiny item', 'shiny,item',
+                       i % 10 + 1) for i in xrange(100000)))
+    conn.commit()
+    def old_select(query, params=None):
+        cursor = conn.cursor()
+        if params:
+            cursor.execute(u"select " + unicode(query), [unicode(p) for p in params])
+        else:
+            cursor.execute("select " + query)
+        results = cursor.fetchall()
+        keys = [_[0] for _ in cursor.description]
+        return [dict([(keys[i], vals[i]) for i in range(len(keys))]) for vals in results]
+    def raw():
+        conn.execute('select * from game_item').fetchall()
+    report('100000 rows as tuples (no dictionaries)', timed(raw))
+    report('100000 rows, old select', timed(lambda: old_select('* from game_item')))
+    report('100000 rows, DB.select', timed(lambda: world.db.select('* from game_item')))
+    def owners(select):
+        for i in xrange(1, 11):
+            select('* from game_item where owner=?', [i])
+    report('10 inventories of 10000, old select', timed(lambda: owners(old_select)))
+    report('10 inventories of 10000, DB.select', timed(lambda: owners(world.db.select)))
+
+@benchmark
+def logins():
+    """Loading a player's inventory at login, by inventory size, with a query
+    per item, item type and container (the old way) vs. preloading the whole
+    item tree with a query per table. A third of the items are bags, nested
+    ten deep, and the rest are spread among them.
+    """
+    world = make_world()
+    import logging
+    world.log.setLevel(logging.WARNING)
+    world.db.write_behind = False
+    from shinymud.models.area import Area
+    from shinymud.models.player import Player
+    import shinymud.models.player as player_module
+    area = Area.create({'name': 'bench'})
+    bag = area.new_item()
+    bag.build_add_type('container')
+    sword = area.new_item()
+    sword.build_add_type('equippable')
+    preload_inventory = player_module.preload_inventory
+    stats = world.db.query_stats
+    for count in (10, 100, 300, 1000):
+        hoarder = Player(('hoarder', 'bar'))
+        hoarder.playerize({'name': 'hoarder%s' % count, 'password': 'pork'})
+        hoarder.save()
+        bags = []
+        for i in xrange(count // 3):
+            item = bag.load()
+            if i % 10 == 0:
+                hoarder.item_add(item)
+            else:
+                item.save()
+                bags[-1].item_types['container'].item_add(item)
+            bags.append(item)
+        for i in xrange(count - len(bags)):
+            bags[i % len(bags)].item_types['container'].item_add(sword.load())
+        row = world.db.select('* FROM player WHERE dbid=?', [hoarder.dbid])[0]
+        def login():
+            player = Player(('hoarder', 'bar'))
+            player.playerize(dict(row))
+        for label, preload in (('old', lambda db, owner: None), ('preloaded', preload_inventory)):
+            player_module.preload_inventory = preload
+            stats.reset()
+            login()
+            queries = sum([s['calls'] for s in stats.stats()])
+            report('%s items, %s (%s queries)' % (count, label, queries), timed(login, 3))
+        def preload():
+            preload_inventory(world.db, hoarder.dbid)
+            world.db.clear_preloaded()
+        report('%s items, just the preload queries' % count, timed(preload, 20))
+    player_module.preload_inventory = preload_inventory
+
+@benchmark
+def items():
+    """Memory used by 100,000 items loaded from one prototype (a dagger with
+    a description, keywords and an equippable type), with every item holding
+    its own copy of the prototype's attributes (the old way) vs. sharing them
+    until they're changed.
+    """
+    world = make_world()
+    from shinymud.models.area import Area
+    from shinymud.models.item import GameItem
+    area = Area.create({'name': 'bench'})
+    dagger = area.new_item()
+    dagger.build_set_name('rusty dagger')
+    dagger.build_set_title('A rusty dagger lies here, forgotten.')
+    dagger.description = 'The blade of this dagger is pitted and brown with rust.'
+    dagger.build_set_keywords('rusty, dagger, knife')
+    dagger.build_add_type('equippable')
+    def old_load():
+        args = dagger.copy_save_attrs()
+        args['dbid'] = None
+        item = GameItem(args)
+        item.build_area = dagger.area.name
+        item.build_id = dagger.id
+        for key, value in dagger.item_types.items():
+            item.item_types[key] = value.load(item)
+        return item
+    count = 100000
+    for label, load in (('copied', old_load), ('shared', dagger.load)):
+        start = time.time()
+        items = [load() for _ in xrange(count)]
+        elapsed = time.time() - start
+        size = deep_size(items, exclude=[dagger, dagger.shared_attrs()])
+        print '  %-50s %10d bytes' % ('%s: bytes per item' % label, size // count)
+        report('%s: loading %s items' % (label, count), elapsed)
+        del items
+
+@benchmark
+def rooms():
+    """Memory used by a world of 100,000 rooms, each with exits to its
+    neighbours and a spawn, with an npc in every tenth room and an item in
+    every fifth (all loaded from one prototype each).
+    """
+    import resource
+    world = make_world()
+    from shinymud.models.area import Area
+    from shinymud.models.room import Room
+    from shinymud.models.room_exit import RoomExit
+    from shinymud.models.spawn import Spawn
+    area = Area.create({'name': 'bench'})
+    prototype = area.new_npc()
+    dagger = area.new_item()
+    dagger.build_add_type('equippable')
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    count = 100000
+    rooms = [Room({'area': 'bench', 'id': str(i)}) for i in xrange(count)]
+    exits = []
+    spawns = []
+    npcs = []
+    items = []
+    for i, room in enumerate(rooms):
+        for direction, other in (('north', i - 1), ('south', i + 1)):
+            if 0 <= other < count:
+                exit = RoomExit({'direction': direction, 'room': room,
+                                 'to_room': rooms[other]})
+                room.exits[direction] = exit
+                exits.append(exit)
+        spawn = Spawn({'id': '1', 'room': room, 'spawn_type': 'npc', 'obj': prototype})
+        spawns.append(spawn)
+        if i % 10 == 0:
+            npc = prototype.load()
+            npc.location = room
+            room.add_char(npc)
+            npcs.append(npc)
+        if i % 5 == 0:
+            item = dagger.load()
+            room.item_add(item)
+            items.append(item)
+    elapsed = time.time() - start
+    grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+    prototypes = [area, prototype, dagger, dagger.shared_attrs()]
+    everything = rooms + exits + spawns + npcs + items
+    sizes = [('rooms', rooms, count),
+             ('exits', exits, len(exits)),
+             ('spawns', spawns, len(spawns)),
+             ('npcs', npcs, len(npcs)),
+             ('items', items, len(items))]
+    for label, objects, n in sizes:
+        # Count each kind of object without following references into the
+        # others
+        ids = set([id(obj) for obj in objects])
+        others = [obj for obj in everything if id(obj) not in ids]
+        size = deep_size(objects, exclude=prototypes, stop=others)
+        print '  %-50s %10d bytes' % ('%s %s, each' % (n, label), size // n)
+    total = deep_size(everything, exclude=prototypes)
+    print '  %-50s %10.1f MB' % ('whole world', total / 1024.0 / 1024)
+    print '  %-50s %10.1f MB' % ('peak resident memory grew by', grown / 1024.0)
+    report('building the world', elapsed)
+
+@benchmark
+def columns():
+    """Loading (Model.__init__'s column work), create_save_dict and
+    copy_save_attrs for each registered model, with Model's generic loops over
+    db_columns vs. the versions compiled for each model when it's registered.
+    """
+    world = make_world()
+    from shinymud.models import Model, model_list
+    # Make sure every model has been imported and registered
+    import shinymud.models.area
+    import shinymud.models.player
+    import shinymud.models.npc_event
+    import shinymud.models.script
+    import shinymud.models.npc_ai_packs
+    count = 10000
+    for model in sorted(model_list.values(), key=lambda m: m.db_table_name):
+        obj = model.__new__(model)
+        Model.load_columns(obj, {})
+        # A row the way it would come out of the database
+        args = Model.create_save_dict(obj)
+        args['dbid'] = 1
+        obj = model.__new__(model)
+        Model.load_columns(obj, args)
+        runs = (('load', Model.load_columns, model.load_columns, (obj, args)),
+                ('save dict', Model.create_save_dict, model.create_save_dict, (obj,)),
+                ('copy', Model.copy_save_attrs, model.copy_save_attrs, (obj,)))
+        for label, generic, compiled, call_args in runs:
+            def run(func):
+                def repeat():
+                    for _ in xrange(count):
+                        func(*call_args)
+                return timed(repeat, 3) / count
+            slow = run(generic)
+            fast = run(compiled)
+            print '  %-50s %7.2f us %7.2f us %5.1fx' % ('%s (%s columns): %s' %
+                    (model.db_table_name, len(model.db_columns), label),
+                    slow * 1e6, fast * 1e6, slow / fast)
+
+@benchmark
+def spawns():
+    """Spawning npcs (NPCs per second), building each one through Npc's
+    constructor from a copy of its prototype's attributes (the old way) vs.
+    cloning them from the prototype's spawn template, and resetting a room
+    that spawns 200 of them.
+    """
+    world = make_world()
+    from shinymud.models.area import Area
+    from shinymud.models.npc import Npc
+    area = Area.create({'name': 'bench'})
+    orc = area.new_npc()
+    orc.build_set_name('a hulking orc')
+    orc.build_set_keywords('hulking, orc')
+    orc.build_set_title('A hulking orc glowers at you.')
+    def old_load(spawn_id=None):
+        args = orc.copy_save_attrs()
+        args['dbid'] = None
+        new_npc = Npc(args)
+        new_npc.spawn_id = spawn_id
+        new_npc.events = orc.events
+        new_npc.ai_packs = orc.ai_packs
+        new_npc.permissions = orc.permissions
+        new_npc.location = None
+        new_npc.inventory = []
+        new_npc.actionq = []
+        new_npc.cmdq = []
+        new_npc.remember = []
+        return new_npc
+    count = 20000
+    for label, load in (('constructed', old_load), ('cloned', orc.load)):
+        def spawn():
+            for i in xrange(count):
+                load(i)
+        seconds = timed(spawn, 3)
+        print '  %-50s %10d' % ('%s: npcs per second' % label, count / seconds)
+    room = area.new_room()
+    for _ in xrange(200):
+        room.new_spawn({'id': room.get_spawn_id(), 'room': room, 'obj': orc,
+                        'spawn_type': 'npc'})
+    def reset():
+        room.npcs = []
+        room.reset()
+    # Npcs can still have attributes of their own outside their slots
+    orc.load = old_load
+    report('constructed: resetting a room with 200 npcs', timed(reset, 20))
+    del orc.load
+    report('cloned: resetting a room with 200 npcs', timed(reset, 20))
+
+if __name__ == '__main__':
+    names = sys.argv[1:]
+    for bench in BENCHMARKS:
+        if names and bench.__name__ not in names:
+            continue
+        print '%s: %s' % (bench.__name__, ' '.join(bench.__doc__.split()))
+        bench()
+
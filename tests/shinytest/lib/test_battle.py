@@ -0,0 +1,111 @@
+from shinytest import ShinyTestCase
+
+class TestBattle(ShinyTestCase):
+    def setUp(self):
+        ShinyTestCase.setUp(self)
+        from shinymud.models.area import Area
+        from shinymud.lib.battle import Battle
+        self.area = Area.create({'name': 'arena'})
+        self.room = self.area.new_room()
+        self.prototype = self.area.new_npc()
+        self.battle = Battle()
+        self.world.battle_add(self.battle)
+    
+    def fighter(self, name, team, hp=1000):
+        npc = self.prototype.load()
+        npc.name = name
+        npc.hp = hp
+        npc.location = self.room
+        self.room.add_char(npc)
+        self.battle.add_character(npc, team)
+        return npc
+    
+    def test_left_battle(self):
+        a = self.fighter('a', 'A')
+        b = self.fighter('b', 'B')
+        a.battle_target = b
+        self.battle.remove_character(a)
+        self.battle.remove_character(b)
+        # Someone who has left the battle has nobody left to fight (not even
+        # their own team)
+        self.assertEqual(self.battle.opponents(a), [])
+        self.assertEqual(a.battle_target, None)
+        # An attack that was already under way just doesn't happen
+        from shinymud.commands.attacks import Attack
+        Attack(a, b, self.battle).roll_to_hit()
+        self.assertEqual(b.hp, 1000)
+    
+    def test_membership(self):
+        a = self.fighter('a', 'A')
+        b = self.fighter('b', 'B')
+        c = self.fighter('c', 'B')
+        self.assertEqual(self.battle.team_of(a), 'A')
+        self.assertEqual(self.battle.team_of(c), 'B')
+        self.assertEqual(self.battle.opponents(a), [b, c])
+        self.assertEqual(self.battle.opponents(b), [a])
+        self.assertTrue(a.battle is self.battle)
+        
+        self.battle.remove_character(b)
+        # b is out of the fight straight away...
+        self.assertFalse(self.battle.has_character(b))
+        self.assertEqual(self.battle.team_of(b), None)
+        self.assertEqual(self.battle.opponents(b), [])
+        # ...but the teams aren't rebuilt until cleanup
+        self.assertEqual(self.battle.teamB, [b, c])
+        self.battle.cleanup()
+        self.assertEqual(self.battle.teamB, [c])
+        # Removing someone twice doesn't hurt
+        self.battle.remove_character(b)
+        self.assertEqual(self.battle.remove_list, [])
+    
+    def test_retarget(self):
+        a = self.fighter('a', 'A')
+        b = self.fighter('b', 'B')
+        c = self.fighter('c', 'B')
+        a.battle_target = b
+        self.assertEqual(a.battle_target, b)
+        self.battle.remove_character(b)
+        self.battle.cleanup()
+        self.assertEqual(a.battle_target, c)
+        # A teammate isn't a valid target either
+        c.battle_target = self.fighter('d', 'B')
+        self.assertEqual(c.battle_target, a)
+    
+    def test_initiative(self):
+        from shinymud.commands.attacks import NORMAL_ACTION_COST
+        a = self.fighter('a', 'A')
+        b = self.fighter('b', 'B')
+        c = self.fighter('c', 'B')
+        a.battle_target = b
+        b.battle_target = a
+        c.battle_target = a
+        a.atk = NORMAL_ACTION_COST
+        b.atk = 2 * NORMAL_ACTION_COST
+        c.atk = NORMAL_ACTION_COST - 2
+        order = []
+        def attacks(fighter):
+            def attack():
+                order.append(fighter.name)
+                fighter.atk -= NORMAL_ACTION_COST
+            return attack
+        for fighter in (a, b, c):
+            fighter.attack = attacks(fighter)
+        self.battle.perform_round()
+        # Whoever has the fewest attack points goes first and uses them all
+        # up before the next fighter acts, and c never has enough to act
+        self.assertEqual(order, ['a', 'b', 'b'])
+        self.assertEqual(c.atk, NORMAL_ACTION_COST - 1)
+    
+    def test_dead_fighters_stop_attacking(self):
+        a = self.fighter('a', 'A', hp=1)
+        b = self.fighter('b', 'B')
+        c = self.fighter('c', 'A')
+        for fighter in (a, b, c):
+            fighter.battle_target = self.battle.opponents(fighter)[0]
+            fighter.atk = 100
+        self.battle.perform_round()
+        # a was killed early on, and b kept fighting c
+        self.assertFalse(self.battle.has_character(a))
+        self.assertEqual(a.battle, None)
+        self.assertEqual(self.battle.teamA, [c])
+        self.assertTrue(self.battle.active())
@@ -2,6 +2,10 @@ from shinymud.lib.db import *
 from shinymud.data.config import ROOT_DIR
 from shinytest import ShinyTestCase
 
+import os
+import sqlite3
+import tempfile
+
 class TestDB(ShinyTestCase):
     def setUp(self):
         ShinyTestCase.setUp(self)
@@ -16,5 +20,247 @@ class TestDB(ShinyTestCase):
         self.assertEqual(row.get('id'), id_num, 'INSERT returned id %s, but SELECT returned id %s' % (str(id_num), str(row.get('id'))))
         self.assertEqual(row.get('val1'), 'bar', 'Bad value: "%s" should be "%s"' % (row.get('val1'), 'bar'))
         self.assertEqual(row.get('val2'), 55, 'Bad value: "%s" should be "%s"' % (row.get('val2'), str(55)))
-        
+    
+    def test_select_params(self):
+        db = self.world.db
+        db.insert("into foo (val1, val2) values (?,?)", ['bar', 55])
+        db.insert("into foo (val1, val2) values (?,?)", ['55', 7])
+        class Name(object):
+            def __unicode__(self):
+                return u'bar'
+        # Numbers stay numbers, and anything sqlite can't bind is turned into
+        # unicode
+        self.assertEqual([r['val1'] for r in db.select('* from foo where val2=?', [55])], ['bar'])
+        self.assertEqual([r['val2'] for r in db.select('* from foo where val1=?', [Name()])], [55])
+        rows = db.select('val1, val2 from foo order by id')
+        self.assertEqual(rows, [{'val1': 'bar', 'val2': 55}, {'val1': '55', 'val2': 7}])
+        self.assertEqual(db.select('* from foo where id=?', [99]), [])
+    
+    def test_profile(self):
+        from shinymud.lib.db import DB
+        db = DB(self.world.log, conn=':memory:',
+                profile={'journal_mode': 'WAL', 'synchronous': 'OFF', 'temp_store': 'MEMORY'})
+        # In-memory databases can't use WAL, and the report says so
+        self.assertEqual(db.profile['journal_mode'], 'memory')
+        self.assertEqual(db.profile['synchronous'], 0)
+        self.assertEqual(db.profile['temp_store'], 2)
+        self.assertTrue('journal_mode=memory' in db.profile_report())
+        self.assertFalse(db.start_checkpoints(60))
+        db.conn.close()
+    
+    def test_indexes(self):
+        from shinymud.lib.setup import initialize_database
+        def indexes():
+            rows = self.world.db.select("name FROM sqlite_master WHERE type='index' "
+                                        "AND name LIKE '%_index'")
+            return sorted([row['name'] for row in rows])
+        found = indexes()
+        # Foreign keys and indexed columns get indexes...
+        for name in ['game_item_owner_index', 'game_item_container_index',
+                     'room_exit_room_index', 'room_spawns_room_index',
+                     'npc_event_prototype_index', 'container_build_item_index',
+                     'container_game_item_index']:
+            self.assertTrue(name in found, name)
+        # ...and setting up an existing database again doesn't hurt
+        initialize_database()
+        self.assertEqual(indexes(), found)
+        plan = self.world.db.conn.execute('EXPLAIN QUERY PLAN SELECT * FROM game_item '
+                                          'WHERE owner=?', [1]).fetchall()
+        self.assertTrue('game_item_owner_index' in str(plan))
+    
+    def test_write_behind(self):
+        from shinymud.models.area import Area
+        db = self.world.db
+        db.write_behind = True
+        area = Area.create({'name': 'foo'})
+        other = Area.create({'name': 'bar'})
+        # New models get written straight away, so they have a dbid to use
+        self.assertTrue(area.dbid)
+        area.title = 'Foo Land'
+        area.save()
+        other.title = 'Bar Land'
+        other.save()
+        self.assertEqual(db.dirty, set([area, other]))
+        row = db.conn.execute('SELECT title FROM area WHERE dbid=?', [area.dbid]).fetchone()
+        self.assertEqual(row[0], 'New Area')
+        # Both updates go out together
+        self.assertEqual(db.flush(), 2)
+        self.assertEqual(db.dirty, set())
+        rows = db.select('title FROM area ORDER BY dbid')
+        self.assertEqual([row['title'] for row in rows], ['Foo Land', 'Bar Land'])
+    
+    def test_write_behind_select(self):
+        from shinymud.models.area import Area
+        db = self.world.db
+        db.write_behind = True
+        area = Area.create({'name': 'foo'})
+        area.title = 'Foo Land'
+        area.save()
+        # Reading from the database writes out what's been saved first
+        self.assertEqual(db.select('title FROM area WHERE dbid=?', [area.dbid])[0]['title'],
+                         'Foo Land')
+        self.assertEqual(db.dirty, set())
+        # Only the models in the tables being read get written early; the
+        # rest wait for the next flush
+        room = Area.create({'name': 'bar'}).new_room()
+        room.name = 'A Foo Room'
+        room.save()
+        area.title = 'Foo Land Again'
+        area.save()
+        self.assertEqual(db.select('name FROM room WHERE dbid=?', [room.dbid])[0]['name'],
+                         'A Foo Room')
+        self.assertEqual(db.dirty, set([area]))
+        self.assertEqual(db.select('title FROM area WHERE dbid=?', [area.dbid])[0]['title'],
+                         'Foo Land Again')
+        self.assertEqual(db.dirty, set())
+        # Models that get deleted are forgotten about
+        area.title = 'Gone'
+        area.save()
+        area.destruct()
+        self.assertEqual(db.dirty, set())
+        self.assertEqual(db.flush(), 0)
+    
+    def test_changed_columns(self):
+        from shinymud.models.area import Area
+        db = self.world.db
+        db.write_behind = False
+        area = Area.create({'name': 'foo'})
+        area.builders.append('bob')
+        area.save()
+        # Once it's been loaded, nothing has changed
+        area = Area(db.select('* FROM area WHERE dbid=?', [area.dbid])[0])
+        self.assertEqual(area.changed_save_dict(), (None, None))
+        writes = db.conn.total_changes
+        area.save()
+        self.assertEqual(db.conn.total_changes, writes)
+        # Only what changed gets written, including lists changed in place
+        area.title = 'Foo Land'
+        area.builders.append('alice')
+        save_dict, changes = area.changed_save_dict()
+        self.assertEqual(save_dict, {'dbid': area.dbid, 'title': 'Foo Land',
+                                     'builders': 'bob,alice'})
+        area.save()
+        self.assertEqual(area.changed_save_dict(), (None, None))
+        row = db.select('title, builders FROM area WHERE dbid=?', [area.dbid])[0]
+        self.assertEqual(row, {'title': 'Foo Land', 'builders': 'bob,alice'})
+        # Columns loaded as models (an exit's room) haven't changed either
+        room = area.new_room()
+        room.new_exit({'direction': 'north', 'to_room': room, 'to_room_id': room.id,
+                       'to_area': area.name})
+        room.exits = {}
+        room.load_exits()
+        self.assertEqual(room.exits['north'].changed_save_dict(), (None, None))
+    
 
+class TestDBWriter(ShinyTestCase):
+    def setUp(self):
+        ShinyTestCase.setUp(self)
+        from shinymud.lib.db import DB
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        # The writer needs a database it can open its own connection to
+        self.world.db.conn.close()
+        self.world.db = DB(self.world.log, conn=self.path)
+        from shinymud.lib.setup import initialize_database, EXISTING_TABLES
+        EXISTING_TABLES.clear()
+        initialize_database()
+        self.world.db.conn.execute("CREATE TABLE foo (id INTEGER PRIMARY KEY,val1 TEXT,val2 INTEGER)")
+        self.assertTrue(self.world.db.start_writer())
+    
+    def tearDown(self):
+        self.world.db.stop_writer()
+        ShinyTestCase.tearDown(self)
+        os.remove(self.path)
+    
+    def test_ordering(self):
+        db = self.world.db
+        id_num = db.insert("into foo (val1, val2) values (?,?)", ['bar', 1])
+        futures = [db.update("foo SET val2=? WHERE id=?", [i, id_num]) for i in range(2, 50)]
+        db.delete("FROM foo WHERE val2=?", [49])
+        db.insert("into foo (val1, val2) values (?,?)", ['baz', 1])
+        self.assertEqual(futures[-1].result(), 1)
+        # Selecting waits for everything before it to be written
+        self.assertEqual(db.select("val1 FROM foo"), [{'val1': 'baz'}])
+    
+    def test_unrelated_writes(self):
+        from shinymud.models.area import Area
+        db = self.world.db
+        area = Area.create({'name': 'foo'})
+        id_num = db.insert("into foo (val1, val2) values (?,?)", ['bar', 1])
+        # Hold the write lock from somewhere else, so the writer gets stuck
+        # on the next write
+        blocker = sqlite3.Connection(self.path)
+        blocker.execute('BEGIN IMMEDIATE')
+        future = db.update("foo SET val1=? WHERE id=?", ['baz', id_num])
+        # Reading another table doesn't wait for the stuck write...
+        self.assertEqual(db.select('name FROM area'), [{'name': 'foo'}])
+        self.assertFalse(future.done())
+        blocker.rollback()
+        blocker.close()
+        # ...but reading the table it writes to does
+        self.assertEqual(db.select('val1 FROM foo'), [{'val1': 'baz'}])
+        self.assertTrue(future.done())
+    
+    def test_errors(self):
+        db = self.world.db
+        self.assertRaises(Exception, db.insert, "into nope (val1) values (?)", ['bar'])
+        future = db.update("nope SET val1=?", ['bar'])
+        self.assertRaises(Exception, future.result)
+        # The writer keeps going after a bad write
+        db.insert("into foo (val1, val2) values (?,?)", ['bar', 1])
+        self.assertEqual(len(db.select("* FROM foo")), 1)
+    
+    def test_new_models(self):
+        from shinymud.models.area import Area
+        area = Area.create({'name': 'foo'})
+        rooms = [area.new_room() for _ in range(3)]
+        # New models get their ids straight away, in the order they were made
+        self.assertTrue(area.dbid)
+        self.assertEqual([room.dbid for room in rooms], [1, 2, 3])
+        rows = self.world.db.select('dbid, id FROM room ORDER BY dbid')
+        self.assertEqual([(row['dbid'], row['id']) for row in rows],
+                         [(room.dbid, room.id) for room in rooms])
+    
+    def test_checkpoints(self):
+        import time
+        from shinymud.lib.db import apply_profile
+        db = self.world.db
+        db.stop_writer()
+        db.profile = apply_profile(db.conn, {'journal_mode': 'WAL'})
+        self.assertEqual(db.profile['journal_mode'], 'wal')
+        self.assertTrue(db.start_checkpoints(0.01))
+        self.assertTrue(db.start_writer())
+        for i in range(20):
+            db.insert("into foo (val1, val2) values (?,?)", ['bar', i])
+        checkpointer = db.checkpointer
+        deadline = time.time() + 5
+        while not checkpointer.checkpoints and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(checkpointer.checkpoints)
+        self.assertTrue('journal_mode=wal' in db.profile_report())
+        self.assertTrue('checkpoint every 0.01s' in db.profile_report())
+        db.stop_checkpoints()
+        self.assertFalse(checkpointer.is_alive())
+        self.assertEqual(db.checkpointer, None)
+    
+    def test_shutdown(self):
+        from shinymud.models.area import Area
+        db = self.world.db
+        db.write_behind = True
+        area = Area.create({'name': 'foo'})
+        area.title = 'Foo Land'
+        area.save()
+        for i in range(20):
+            db.insert("into foo (val1, val2) values (?,?)", ['bar', i])
+            db.update("foo SET val1=? WHERE val2=?", ['baz', i])
+        # Stopping the writer writes out the dirty models and everything in
+        # the queue before the thread goes away
+        writer = db.writer
+        db.stop_writer()
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(db.writer, None)
+        conn = sqlite3.Connection(self.path)
+        self.assertEqual(conn.execute("SELECT count(*) FROM foo WHERE val1='baz'").fetchone()[0], 20)
+        self.assertEqual(conn.execute("SELECT title FROM area").fetchone()[0], 'Foo Land')
+        conn.close()
+    
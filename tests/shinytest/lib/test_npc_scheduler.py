@@ -0,0 +1,78 @@
+from shinytest import ShinyTestCase
+
+class FakeNpc(object):
+    """Just enough of an npc for the scheduler: a queue of commands, and a
+    do_tick that runs one of them.
+    """
+    def __init__(self, name, commands, log):
+        self.name = name
+        self.cmdq = range(commands)
+        self.log = log
+    
+    def do_tick(self):
+        if not self.cmdq:
+            return False
+        self.cmdq.pop(0)
+        self.log.append(self.name)
+        return True
+
+
+class TestNpcScheduler(ShinyTestCase):
+    def test_subscribe_once(self):
+        from shinymud.models.area import Area
+        area = Area.create({'name': 'foo'})
+        npc = area.new_npc().load()
+        for _ in range(10):
+            npc.perform('say hello')
+        self.assertEqual(len(npc.cmdq), 10)
+        # No matter how many times it's subscribed, the npc only waits in
+        # line once
+        self.assertEqual(len(self.world.npc_scheduler), 1)
+        self.assertTrue(npc in self.world.npc_scheduler)
+    
+    def test_round_robin(self):
+        from shinymud.lib.npc_scheduler import NpcScheduler
+        log = []
+        scheduler = NpcScheduler()
+        a = FakeNpc('a', 3, log)
+        b = FakeNpc('b', 1, log)
+        scheduler.subscribe(a)
+        scheduler.subscribe(b)
+        scheduler.subscribe(a)
+        # One command per npc per turn
+        self.assertEqual(scheduler.run(), 2)
+        self.assertEqual(log, ['a', 'b'])
+        # b is out of commands, so it drops out
+        self.assertFalse(b in scheduler)
+        self.assertEqual(scheduler.run(), 1)
+        self.assertEqual(scheduler.run(), 1)
+        self.assertEqual(log, ['a', 'b', 'a', 'a'])
+        self.assertEqual(len(scheduler), 0)
+        self.assertEqual(scheduler.run(), 0)
+    
+    def test_budget_carryover(self):
+        from shinymud.lib.npc_scheduler import NpcScheduler
+        log = []
+        scheduler = NpcScheduler(budget=2)
+        for name in 'abcde':
+            scheduler.subscribe(FakeNpc(name, 2, log))
+        self.assertEqual(scheduler.run(), 2)
+        self.assertEqual(log, ['a', 'b'])
+        # The npcs that missed out last turn go first
+        self.assertEqual(scheduler.run(), 2)
+        self.assertEqual(log[2:], ['c', 'd'])
+        # An explicit budget overrides the scheduler's own
+        self.assertEqual(scheduler.run(10), 5)
+        self.assertEqual(log[4:], ['e', 'a', 'b', 'c', 'd'])
+        self.assertEqual(scheduler.run(), 1)
+        self.assertEqual(len(scheduler), 0)
+    
+    def test_idle_npc_drops_out(self):
+        from shinymud.lib.npc_scheduler import NpcScheduler
+        scheduler = NpcScheduler()
+        npc = FakeNpc('a', 0, [])
+        # An npc whose event didn't give it anything to do
+        scheduler.subscribe(npc)
+        self.assertEqual(scheduler.run(), 0)
+        self.assertFalse(npc in scheduler)
+
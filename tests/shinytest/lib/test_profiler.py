@@ -0,0 +1,62 @@
+from shinytest import ShinyTestCase
+
+import json
+
+class TestTickProfiler(ShinyTestCase):
+    def test_percentiles(self):
+        from shinymud.lib.profiler import percentile
+        samples = range(1, 101)
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 95), 95)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile([], 50), 0)
+        self.assertEqual(percentile([7], 99), 7)
+    
+    def test_rolling_window(self):
+        from shinymud.lib.profiler import TickProfiler
+        profiler = TickProfiler(10)
+        for i in range(25):
+            mark = profiler.record('npcs', 0)
+        self.assertEqual(len(profiler.phases['npcs']), 10)
+        stats = profiler.stats()
+        self.assertEqual(stats['npcs']['count'], 10)
+        self.assertTrue(stats['npcs']['p50'] <= stats['npcs']['max'])
+    
+    def test_phases(self):
+        from shinymud.lib.profiler import TickProfiler
+        profiler = TickProfiler()
+        start = mark = 1.0
+        for phase in ['npcs', 'players', 'cleanup']:
+            mark = profiler.record(phase, mark)
+        profiler.end_turn(start)
+        self.assertEqual(profiler.phase_order, ['npcs', 'players', 'cleanup', 'turn'])
+        self.assertEqual(profiler.turns, 1)
+        dump = json.loads(profiler.dump())
+        self.assertEqual(dump['turns'], 1)
+        self.assertEqual(sorted(dump['phases'].keys()),
+                         ['cleanup', 'npcs', 'players', 'turn'])
+        profiler.reset()
+        self.assertEqual(profiler.stats(), {})
+    
+    def test_tickstats_command(self):
+        from shinymud.models.player import Player
+        from shinymud.commands.commands import TickStats
+        from shinymud.data.config import ADMIN
+        bob = Player(('bob', 'bar'))
+        bob.mode = None
+        bob.playerize({'name':'bob', 'password':'pork'})
+        bob.outq = []
+        
+        TickStats(bob, None, 'tickstats').run()
+        self.assertEqual(bob.outq[-1], "You don't have the authority to do that!\n")
+        
+        bob.permissions = bob.permissions | ADMIN
+        self.world.profiler.record('players', 0)
+        TickStats(bob, None, 'tickstats').run()
+        self.assertTrue('players' in bob.outq[-2])
+        self.assertTrue('Output dropped' in bob.outq[-1])
+        TickStats(bob, 'json', 'tickstats').run()
+        self.assertTrue('players' in json.loads(bob.outq[-1])['phases'])
+        TickStats(bob, 'reset', 'tickstats').run()
+        self.assertEqual(self.world.profiler.stats(), {})
+    
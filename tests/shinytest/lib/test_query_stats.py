@@ -0,0 +1,89 @@
+from shinytest import ShinyTestCase
+
+import json
+import threading
+
+class TestQueryStats(ShinyTestCase):
+    def test_normalise(self):
+        stats = self.world.db.query_stats
+        self.assertEqual(stats.normalise("select *  from room\n where id=12 and name='it''s'"),
+                         'select * from room where id=? and name=?')
+        # Numbers that are part of a name aren't literals
+        self.assertEqual(stats.normalise('select * from area1 where dbid=?'),
+                         'select * from area1 where dbid=?')
+    
+    def test_statements(self):
+        db = self.world.db
+        stats = db.query_stats
+        stats.reset()
+        db.conn.execute('CREATE TABLE foo (id INTEGER PRIMARY KEY, val INTEGER)')
+        for i in range(5):
+            db.insert('into foo (val) values (?)', [i])
+            db.select('* from foo where val=%s' % i)
+        calls = dict([(s['statement'], s['calls']) for s in stats.stats()])
+        self.assertEqual(calls, {'insert into foo (val) values (?)': 5,
+                                 'select * from foo where val=?': 5})
+        # Everything counts as slow with a threshold of 0
+        stats.slow_ms = 0
+        db.select('* from foo')
+        self.assertEqual(stats.slow[-1][2], 'select * from foo')
+    
+    def test_scans(self):
+        db = self.world.db
+        stats = db.query_stats
+        stats.explain = True
+        db.select('* from game_item where owner=?', [1])
+        db.select('* from game_item where name=?', ['sword'])
+        # owner has an index, name doesn't
+        self.assertEqual(stats.scans.keys(), ['select * from game_item where name=?'])
+    
+    def test_threads(self):
+        # The world thread and a DBWriter record statements at the same time
+        stats = self.world.db.query_stats
+        stats.reset()
+        stats.slow_ms = 0
+        explained = []
+        class Conn(object):
+            def execute(self, query, params=None):
+                explained.append(query)
+                return self
+            def fetchall(self):
+                return [(0, 0, 0, 'SCAN TABLE foo')]
+        def run():
+            for i in range(200):
+                statement = stats.record('select * from foo where val=%s' % i, 0.001)
+                stats.check_plan(Conn(), 'select * from foo', None, statement)
+                stats.dump()
+        threads = [threading.Thread(target=run) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(stats.stats()[0]['calls'], 800)
+        self.assertEqual(len(explained), 1)
+        self.assertEqual(stats.scans.keys(), ['select * from foo where val=?'])
+    
+    def test_dbstats_command(self):
+        from shinymud.models.player import Player
+        from shinymud.commands.commands import DBStats
+        from shinymud.data.config import ADMIN
+        bob = Player(('bob', 'bar'))
+        bob.mode = None
+        bob.playerize({'name':'bob', 'password':'pork'})
+        bob.outq = []
+        
+        DBStats(bob, None, 'dbstats').run()
+        self.assertEqual(bob.outq[-1], "You don't have the authority to do that!\n")
+        
+        bob.permissions = bob.permissions | ADMIN
+        self.world.db.select('* from area where name=?', ['foo'])
+        DBStats(bob, None, 'dbstats').run()
+        self.assertTrue('select * from area where name=?' in bob.outq[-1])
+        DBStats(bob, 'json', 'dbstats').run()
+        statements = [s['statement'] for s in json.loads(bob.outq[-1])['statements']]
+        self.assertTrue('select * from area where name=?' in statements)
+        DBStats(bob, 'scans', 'dbstats').run()
+        self.assertTrue('DB_EXPLAIN_SCANS' in bob.outq[-1])
+        DBStats(bob, 'reset', 'dbstats').run()
+        self.assertEqual(self.world.db.query_stats.stats(), [])
+
@@ -0,0 +1,106 @@
+from shinytest import ShinyTestCase
+
+import socket
+
+class TestReactor(ShinyTestCase):
+    def setUp(self):
+        ShinyTestCase.setUp(self)
+        from shinymud.lib.connection_handlers.reactor import Reactor
+        from shinymud.lib.connection_handlers.shiny_connections import TelnetConnection
+        
+        self.reactor = Reactor(self.world)
+        self.client, server = socket.socketpair()
+        self.conn = TelnetConnection((server, 'test'), self.world.log)
+        self.reactor.add(self.conn)
+        # Our fake client doesn't care about option negotiation
+        self.client.recv(256)
+    
+    def tearDown(self):
+        self.client.close()
+        if not self.conn.closed:
+            self.conn.close()
+        ShinyTestCase.tearDown(self)
+    
+    def test_idle_connection(self):
+        # Nothing has been sent, so nothing should be ready
+        self.assertEqual(self.reactor.poll(0), 0)
+        self.assertEqual(self.conn.recv(), False)
+    
+    def test_read_ready_connection(self):
+        self.client.send('look\r\n')
+        self.assertEqual(self.reactor.poll(1), 1)
+        self.assertEqual(self.conn.recv(), ['look'])
+        # The input should only be delivered once
+        self.assertEqual(self.conn.recv(), False)
+    
+    def test_client_disconnect(self):
+        self.client.send('quit\r\n')
+        self.client.close()
+        self.reactor.poll(1)
+        self.reactor.poll(1)
+        self.assertTrue(self.conn.closed)
+        self.assertFalse(self.conn.reactor_fd in self.reactor.handlers)
+        # Pending input is still handed over before the player is told the
+        # connection is gone
+        self.assertEqual(self.conn.recv(), ['quit'])
+        self.assertEqual(self.conn.recv(), None)
+    
+    def test_close_removes_connection(self):
+        fd = self.conn.fileno()
+        self.conn.close()
+        self.assertFalse(fd in self.reactor.handlers)
+        # closing twice shouldn't break anything
+        self.reactor.remove(self.conn)
+    
+    def test_add_with_pending_output(self):
+        from shinymud.lib.connection_handlers.shiny_connections import TelnetConnection
+        client, server = socket.socketpair()
+        conn = TelnetConnection((server, 'test'), self.world.log)
+        # As if the socket had only taken part of the option negotiation
+        conn.outbuf = 'the rest'
+        self.reactor.add(conn)
+        self.assertTrue(conn.reactor_fd in self.reactor.writers)
+        self.reactor.poll(1)
+        self.assertEqual(conn.outbuf, '')
+        self.assertFalse(conn.reactor_fd in self.reactor.writers)
+        conn.close()
+        client.close()
+    
+    def test_send_batches_output(self):
+        queue = ['one', 'two', 'three']
+        self.assertTrue(self.conn.send(queue))
+        self.assertEqual(queue, [])
+        self.assertEqual(self.client.recv(256), 'one\r\ntwo\r\nthree')
+        self.assertEqual(self.conn.outbuf, '')
+    
+    def test_slow_client(self):
+        # Make the socket buffers small so we can fill them up quickly
+        self.conn.conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        line = 'x' * 1000
+        # The client isn't reading, so the socket fills up... but the player
+        # shouldn't get disconnected for it
+        for _ in range(200):
+            self.assertTrue(self.conn.send([line]))
+        self.assertTrue(self.conn.outbuf)
+        self.assertTrue(self.conn.reactor_fd in self.reactor.writers)
+        self.assertFalse(self.conn.closed)
+        # Once the client starts reading again, the Reactor sends them the
+        # rest
+        received = 0
+        self.client.settimeout(1)
+        while received < 200 * 1000:
+            received += len(self.client.recv(65536))
+            self.reactor.poll(0)
+        self.assertEqual(received, 200 * 1000)
+        self.assertEqual(self.conn.outbuf, '')
+        self.assertFalse(self.conn.reactor_fd in self.reactor.writers)
+    
+    def test_send_to_closed_client(self):
+        self.client.close()
+        # The first send might make it into the socket buffer before the
+        # kernel notices the client is gone
+        alive = self.conn.send(['hello'])
+        if alive:
+            alive = self.conn.send(['hello again'])
+        self.assertFalse(alive)
@@ -0,0 +1,98 @@
+from shinytest import ShinyTestCase
+
+import socket
+
+class TestTelnetParser(ShinyTestCase):
+    def test_plain_text(self):
+        from shinymud.lib.connection_handlers.telnet import TelnetParser
+        parser = TelnetParser()
+        self.assertEqual(parser.feed('look\r\n'), ('look\r\n', []))
+        # An escaped 255 is just text
+        self.assertEqual(parser.feed('a\xff\xffb'), ('a\xffb', []))
+    
+    def test_split_commands(self):
+        from shinymud.lib.connection_handlers.telnet import TelnetParser, WILL, NAWS, SB
+        parser = TelnetParser()
+        data = 'go \xff\xfb\x1f\xff\xfa\x1f\x00\x78\x00\x32\xff\xf0north'
+        # Feed the data in one byte at a time; commands that got split up
+        # should still come out whole
+        text = ''
+        commands = []
+        for byte in data:
+            t, c = parser.feed(byte)
+            text += t
+            commands += c
+        self.assertEqual(text, 'go north')
+        self.assertEqual(commands, [(WILL, NAWS), (SB, NAWS, '\x00\x78\x00\x32')])
+    
+    def test_parse_naws(self):
+        from shinymud.lib.connection_handlers.telnet import parse_naws
+        self.assertEqual(parse_naws('\x00\x50\x00\x28'), (80, 40))
+        self.assertEqual(parse_naws('\x01\x00\x00\xff'), (256, 255))
+        self.assertEqual(parse_naws('\x00'), None)
+
+
+class TestTelnetConnection(ShinyTestCase):
+    def setUp(self):
+        ShinyTestCase.setUp(self)
+        from shinymud.lib.connection_handlers.shiny_connections import TelnetConnection
+        self.client, server = socket.socketpair()
+        self.client.settimeout(1)
+        self.conn = TelnetConnection((server, 'test'), self.world.log)
+    
+    def tearDown(self):
+        self.client.close()
+        self.conn.close()
+        ShinyTestCase.tearDown(self)
+    
+    def test_negotiation(self):
+        from shinymud.lib.connection_handlers.telnet import (IAC, WILL, WONT,
+                                DO, DONT, SB, SE, LINEMODE, NAWS, COMPRESS2)
+        # The connection asks for linemode and window sizes (and offers to
+        # compress its output) straight away, without waiting for an answer
+        self.assertEqual(self.client.recv(256), IAC + WILL + LINEMODE + IAC + DO + NAWS +
+                                                IAC + WILL + COMPRESS2)
+        self.client.send(IAC + DO + LINEMODE + IAC + WILL + NAWS + IAC + SB + NAWS +
+                         '\x00\x64')
+        self.conn.handle_read()
+        self.assertTrue(self.conn.our_options[LINEMODE])
+        self.assertTrue(self.conn.their_options[NAWS])
+        # Still waiting for the rest of the window size
+        self.assertEqual(self.conn.win_size, (80, 40))
+        self.client.send('\x00\x1e' + IAC + SE)
+        self.conn.handle_read()
+        self.assertEqual(self.conn.win_size, (100, 30))
+        # Options we don't know about get refused
+        self.client.send(IAC + DO + chr(1) + IAC + WILL + chr(24))
+        self.conn.handle_read()
+        self.assertEqual(self.client.recv(256), IAC + WONT + chr(1) + IAC + DONT + chr(24))
+        self.assertEqual(self.conn.recv(), False)
+    
+    def test_lines(self):
+        self.client.send('say hi\r\nlo')
+        self.conn.handle_read()
+        self.assertEqual(self.conn.recv(), ['say hi'])
+        self.client.send('ok\r\n\r\nquit\r\n')
+        self.conn.handle_read()
+        self.assertEqual(self.conn.recv(), ['look', 'quit'])
+    
+    def test_compression(self):
+        import zlib
+        from shinymud.lib.connection_handlers.telnet import IAC, DO, SB, SE, COMPRESS2
+        self.client.recv(256)
+        self.conn.send(['before'])
+        self.assertEqual(self.client.recv(256), 'before')
+        self.client.send(IAC + DO + COMPRESS2)
+        self.conn.handle_read()
+        self.assertEqual(self.client.recv(256), IAC + SB + COMPRESS2 + IAC + SE)
+        # Everything after the client agrees comes out compressed, and each
+        # send can be decompressed right away
+        decompressor = zlib.decompressobj()
+        self.conn.send(['You see a long hallway.'] * 10)
+        self.assertEqual(decompressor.decompress(self.client.recv(4096)),
+                         '\r\n'.join(['You see a long hallway.'] * 10))
+        self.conn.send(['hello'])
+        self.assertEqual(decompressor.decompress(self.client.recv(4096)), 'hello')
+        stats = self.conn.output_stats()
+        self.assertTrue(stats['wire_bytes'] < stats['output_bytes'])
+        self.assertTrue(stats['ratio'] > 1)
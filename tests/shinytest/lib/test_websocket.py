@@ -0,0 +1,160 @@
+from shinytest import ShinyTestCase
+
+import socket
+import struct
+import zlib
+
+def client_frame(opcode, payload, fin=True, compressed=False, mask='abcd'):
+    """Build a frame the way a client would (clients always mask)."""
+    first = opcode | (0x80 if fin else 0) | (0x40 if compressed else 0)
+    if len(payload) < 126:
+        header = struct.pack('!BB', first, 0x80 | len(payload))
+    else:
+        header = struct.pack('!BBH', first, 0x80 | 126, len(payload))
+    masked = ''.join([chr(ord(c) ^ ord(mask[i % 4])) for i, c in enumerate(payload)])
+    return header + mask + masked
+
+def server_frame(data):
+    """Split a frame we got from the server into (first byte, payload)."""
+    first, length = ord(data[0]), ord(data[1])
+    if length == 126:
+        length = struct.unpack('!H', data[2:4])[0]
+        return first, data[4:4 + length]
+    return first, data[2:2 + length]
+
+HANDSHAKE = ('GET / HTTP/1.1\r\n'
+             'Host: localhost:4113\r\n'
+             'Upgrade: websocket\r\n'
+             'Connection: Upgrade\r\n'
+             'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+             'Sec-WebSocket-Version: 13\r\n'
+             '%s\r\n')
+
+class TestWebsocket(ShinyTestCase):
+    def setUp(self):
+        ShinyTestCase.setUp(self)
+        from shinymud.lib.connection_handlers.shiny_connections import WebsocketConnection
+        self.opened = []
+        self.client, server = socket.socketpair()
+        self.client.settimeout(1)
+        self.conn = WebsocketConnection((server, 'test'), self.world.log,
+                                        self.opened.append)
+    
+    def tearDown(self):
+        self.client.close()
+        self.conn.close()
+        ShinyTestCase.tearDown(self)
+    
+    def handshake(self, extensions=''):
+        request = HANDSHAKE % extensions
+        # Send the handshake in two pieces, to make sure we wait for all of it
+        self.client.send(request[:20])
+        self.assertTrue(self.conn.handle_read())
+        self.assertEqual(self.opened, [])
+        self.client.send(request[20:])
+        self.assertTrue(self.conn.handle_read())
+        self.assertEqual(self.opened, [self.conn])
+        return self.client.recv(4096)
+    
+    def test_handshake(self):
+        response = self.handshake()
+        self.assertTrue(response.startswith('HTTP/1.1 101'))
+        # The example from RFC 6455
+        self.assertTrue('Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=\r\n' in response)
+        self.assertFalse('Sec-WebSocket-Extensions' in response)
+    
+    def test_bad_handshake(self):
+        self.client.send('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        self.assertFalse(self.conn.handle_read())
+        self.assertTrue(self.client.recv(4096).startswith('HTTP/1.1 400'))
+        self.assertTrue(self.conn.closed)
+        self.assertEqual(self.opened, [])
+    
+    def test_messages(self):
+        self.handshake()
+        frame = client_frame(0x1, 'look\r\n') + client_frame(0x1, 'say ', fin=False)
+        # Split the second message across a frame, and the frame across reads
+        rest = client_frame(0x0, 'hello there')
+        self.client.send(frame + rest[:3])
+        self.conn.handle_read()
+        self.assertEqual(self.conn.recv(), ['look'])
+        self.client.send(rest[3:])
+        self.conn.handle_read()
+        self.assertEqual(self.conn.recv(), ['say hello there'])
+    
+    def test_batched_output(self):
+        self.handshake()
+        self.assertTrue(self.conn.send(['You see a room.', 'exits: north', '> ']))
+        first, payload = server_frame(self.client.recv(4096))
+        # One final text frame for the whole turn
+        self.assertEqual(first, 0x81)
+        self.assertEqual(payload, 'You see a room.\r\nexits: north\r\n> ')
+    
+    def test_ping_pong(self):
+        self.handshake()
+        self.client.send(client_frame(0x9, 'hi'))
+        self.conn.handle_read()
+        self.assertEqual(server_frame(self.client.recv(4096)), (0x8A, 'hi'))
+        # We ping clients that have been quiet for too long...
+        from shinymud.data.config import WEBSOCKET_PING_INTERVAL
+        quiet = self.conn.last_heard + WEBSOCKET_PING_INTERVAL + 1
+        self.assertTrue(self.conn.keepalive(quiet))
+        self.assertEqual(server_frame(self.client.recv(4096)), (0x89, ''))
+        self.client.send(client_frame(0xA, ''))
+        self.conn.handle_read()
+        self.assertEqual(self.conn.ping_sent, None)
+        # ...and give up on them if they don't answer
+        self.conn.keepalive(quiet)
+        self.client.recv(4096)
+        self.assertFalse(self.conn.keepalive(quiet + WEBSOCKET_PING_INTERVAL + 1))
+        self.assertTrue(self.conn.closed)
+    
+    def test_close(self):
+        self.handshake()
+        self.client.send(client_frame(0x8, struct.pack('!H', 1000)))
+        self.assertFalse(self.conn.handle_read())
+        self.assertEqual(server_frame(self.client.recv(4096)),
+                         (0x88, struct.pack('!H', 1000)))
+        self.assertEqual(self.conn.recv(), None)
+    
+    def assertProtocolError(self, frame):
+        self.handshake()
+        self.client.send(frame)
+        self.assertFalse(self.conn.handle_read())
+        self.assertEqual(server_frame(self.client.recv(4096)),
+                         (0x88, struct.pack('!H', 1002)))
+    
+    def test_fragmented_ping(self):
+        # Control frames can't be fragmented, so this doesn't get answered
+        self.assertProtocolError(client_frame(0x9, 'hi', fin=False))
+    
+    def test_long_ping(self):
+        self.assertProtocolError(client_frame(0x9, 'x' * 126))
+    
+    def test_permessage_deflate(self):
+        response = self.handshake('Sec-WebSocket-Extensions: permessage-deflate; '
+                                  'client_max_window_bits\r\n')
+        self.assertTrue('Sec-WebSocket-Extensions: permessage-deflate\r\n' in response)
+        decompressor = zlib.decompressobj(-15)
+        for text in ('You see a long hallway.', 'You see a long hallway.'):
+            self.conn.send([text])
+            first, payload = server_frame(self.client.recv(4096))
+            # RSV1 is set on compressed messages
+            self.assertEqual(first, 0xC1)
+            self.assertEqual(decompressor.decompress(payload + '\x00\x00\xff\xff'), text)
+        # The client can compress its messages too
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        data = compressor.compress('north') + compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.client.send(client_frame(0x1, data[:-4], compressed=True))
+        self.conn.handle_read()
+        self.assertEqual(self.conn.recv(), ['north'])
+    
+    def test_negotiate_deflate(self):
+        from shinymud.lib.connection_handlers.websocket import negotiate_deflate
+        self.assertEqual(negotiate_deflate(''), (None, None))
+        self.assertEqual(negotiate_deflate('x-webkit-deflate-frame'), (None, None))
+        response, options = negotiate_deflate('permessage-deflate; server_max_window_bits=8, '
+                                              'permessage-deflate; server_no_context_takeover')
+        # The first offer asks for a window zlib can't do
+        self.assertEqual(response, 'permessage-deflate; server_no_context_takeover')
+        self.assertEqual(options, {'wbits': 15, 'no_context_takeover': True})
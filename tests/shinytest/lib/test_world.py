@@ -43,6 +43,38 @@ class TestReset(ShinyTestCase):
         echo = wecho_color + 'hello!' + clear_fcolor
         self.assertTrue(echo in bob.outq)
         self.assertTrue(echo not in alice.outq)
+        
+        # Broadcasts get through to a stalled player unless they're chatter
+        bob.outq = []
+        bob.output_stalled = True
+        self.world.tell_players('shutting down!')
+        self.world.tell_players('anyone there?', priority='low')
+        self.assertEqual(bob.outq, [wecho_color + 'shutting down!' + clear_fcolor])
+    
+    def test_new_player(self):
+        from shinymud.models.player import Player
+        bob = Player('foo')
+        bob.name = 'bob'
+        # Connection handlers hand new players over without touching the
+        # player list; they're added when the next turn starts
+        self.world.new_player(bob)
+        self.assertEqual(self.world.get_player('bob'), None)
+        self.world.add_new_players()
+        self.assertEqual(self.world.get_player('bob'), bob)
+        self.assertTrue(self.world.new_players.empty())
+    
+    def test_write_behind_turn(self):
+        from shinymud.data.config import WRITE_BEHIND_TURNS
+        flushes = []
+        self.world.db.flush = lambda: flushes.append(True)
+        for i in range(WRITE_BEHIND_TURNS - 1):
+            self.world.write_behind_turn()
+        # Resetting the tick stats doesn't change when we flush
+        self.world.profiler.reset()
+        self.assertEqual(flushes, [])
+        self.world.write_behind_turn()
+        self.assertEqual(flushes, [True])
+        del self.world.db.flush
     
     def test_destroy_area(self):
         from shinymud.models.area import Area
@@ -112,3 +112,189 @@ class TestArea(ShinyTestCase):
         self.assertFalse(db_exits)
         
     
+    
+#********** Test area reset scheduling #**********
+    def test_reset_schedule(self):
+        from shinymud.models.area import Area
+        from shinymud.models.player import Player
+        area = Area.create({'name': 'foo'})
+        room = area.new_room()
+        area.time_of_last_reset = 1000
+        scheduler = self.world.reset_scheduler
+        self.assertEqual(len(scheduler), 0)
+        bob = Player(('bob', 'bar'))
+        bob.mode = None
+        bob.playerize({'name':'bob', 'password':'pork'})
+        # Only the first visit since the last reset should schedule a reset
+        room.add_char(bob)
+        room.add_char(bob)
+        self.assertEqual(len(scheduler), 1)
+        due_at = 1000 + area.get_reset_interval()
+        self.assertEqual(area.next_reset, due_at)
+        self.assertEqual(scheduler.pop_due(due_at - 1), [])
+        self.assertEqual(scheduler.pop_due(due_at), [area])
+        self.assertEqual(len(scheduler), 0)
+        # Resetting the area clears the visit count, so the next visit
+        # schedules it again
+        area.reset()
+        self.assertEqual(area.times_visited_since_reset, 0)
+        room.add_char(bob)
+        self.assertTrue(area.next_reset > due_at)
+        # A manual reset means the scheduled one shouldn't happen
+        area.reset()
+        self.assertEqual(scheduler.pop_due(area.time_of_last_reset + 10000), [])
+    
+    def test_build_set_resetinterval(self):
+        from shinymud.models.area import Area
+        from shinymud.data.config import RESET_INTERVAL
+        area = Area.create({'name': 'foo'})
+        self.assertEqual(area.get_reset_interval(), RESET_INTERVAL)
+        echo = area.build_set_resetinterval('60')
+        self.assertEqual(echo, 'Area reset interval set to 60 seconds.')
+        self.assertEqual(area.get_reset_interval(), 60)
+        row = self.world.db.select("reset_interval from area where name=?", [area.name])[0]
+        self.assertEqual(row['reset_interval'], 60)
+        self.assertEqual(area.build_set_resetinterval('soon'),
+                         'The reset interval must be a number of seconds.')
+        area.visit()
+        self.assertEqual(area.next_reset, area.time_of_last_reset + 60)
+        area.build_set_resetinterval('default')
+        self.assertEqual(area.get_reset_interval(), RESET_INTERVAL)
+        self.assertEqual(area.next_reset, area.time_of_last_reset + RESET_INTERVAL)
+    
+    def _spawn_state(self, area):
+        state = {}
+        for room_id, room in area.rooms.items():
+            state[room_id] = (sorted([i.spawn_id for i in room.items]),
+                              sorted([n.spawn_id for n in room.npcs]))
+        return state
+    
+    def test_incremental_reset(self):
+        from shinymud.models.area import Area
+        from shinymud.models.player import Player
+        area = Area.create({'name': 'foo'})
+        area.new_item()
+        area.new_npc()
+        for i in range(5):
+            room = area.new_room()
+            room.build_add_spawn('for item 1')
+            room.build_add_spawn('for npc 1')
+        
+        area.reset()
+        monolithic = self._spawn_state(area)
+        self.assertEqual(len(monolithic['1'][0]), 1)
+        self.assertEqual(len(monolithic['1'][1]), 1)
+        for room in area.rooms.values():
+            room.purge_room()
+        
+        bob = Player(('bob', 'bar'))
+        bob.mode = None
+        bob.playerize({'name':'bob', 'password':'pork'})
+        occupied = area.get_room('3')
+        occupied.add_char(bob)
+        
+        scheduler = self.world.reset_scheduler
+        scheduler.begin_reset(area, 'first')
+        self.assertEqual(area.times_visited_since_reset, 0)
+        self.assertTrue(area.rooms_to_reset[0] is occupied)
+        # A budget of 0 still resets one room per turn
+        turns = 0
+        finished = []
+        while not finished:
+            finished = scheduler.run_resets(0)
+            turns += 1
+        self.assertEqual(turns, 5)
+        self.assertEqual(finished, [area])
+        self.assertEqual(self._spawn_state(area), monolithic)
+        
+        # Resetting again shouldn't duplicate anything that's already there
+        scheduler.begin_reset(area, 'last')
+        self.assertTrue(area.rooms_to_reset[-1] is occupied)
+        self.assertEqual(scheduler.run_resets(10), [area])
+        self.assertEqual(self._spawn_state(area), monolithic)
+    
+    
+    def _build_rooms(self, area, count):
+        """Add count rooms to area, each with an exit back to the first room,
+        and spawns for area's first item and npc."""
+        first = area.get_room('1') or area.new_room()
+        for _ in range(count):
+            room = area.new_room()
+            room.build_add_exit('north to 1')
+            room.build_add_spawn('item 1')
+            room.build_add_spawn('npc 1')
+        return first
+    
+    def test_load_queries(self):
+        from shinymud.models.area import Area
+        area = Area.create({'name': 'foo'})
+        area.new_item().build_add_type('container')
+        npc = area.new_npc()
+        npc.new_ai('merchant')
+        script = area.new_script()
+        npc.build_add_event('pc_enter call script %s' % script.id)
+        self._build_rooms(area, 3)
+        
+        db = self.world.db
+        queries = []
+        select = db.select
+        def counted_select(query, params=None):
+            queries.append(query)
+            return select(query, params)
+        db.select = counted_select
+        def reload():
+            del queries[:]
+            copy = Area(select('* FROM area WHERE name=?', ['foo'])[0])
+            copy.load()
+            return copy
+        
+        copy = reload()
+        few_rooms = len(queries)
+        self.assertEqual(sorted(copy.rooms), sorted(area.rooms))
+        room = copy.get_room('2')
+        self.assertEqual(room.exits['north'].to_room.id, '1')
+        self.assertEqual(len(room.spawns), 2)
+        self.assertEqual(len([i for i in room.items if i.has_type('container')]), 1)
+        self.assertEqual(len(room.npcs), 1)
+        copy_npc = copy.get_npc('1')
+        self.assertTrue(copy_npc.has_ai('merchant'))
+        self.assertTrue(copy_npc.ai_packs['merchant'].sale_items)
+        self.assertEqual(len(copy_npc.events['pc_enter']), 1)
+        self.assertTrue(copy.get_item('1').has_type('container'))
+        # Nothing is left over once the area has loaded
+        self.assertEqual(db.preloaded, {})
+        
+        # The number of queries doesn't depend on how much is in the area
+        self._build_rooms(area, 10)
+        copy = reload()
+        self.assertEqual(len(copy.rooms), 14)
+        self.assertEqual(len(queries), few_rooms)
+        # Nothing is left over if the area fails to load, either
+        from shinymud.models.room import Room
+        def broken(self):
+            raise ValueError('broken room')
+        Room.reset = broken
+        self.assertRaises(ValueError, reload)
+        self.assertEqual(db.preloaded, {})
+        del db.select
+    
+    def test_get_id(self):
+        from shinymud.models.area import Area
+        area = Area.create({'name': 'foo'})
+        self.assertEqual([area.new_room().id for _ in range(3)], ['1', '2', '3'])
+        # Ids aren't handed out again, even if the newest room is destroyed
+        area.destroy_room('3')
+        self.assertEqual(area.new_room().id, '4')
+        # Rooms that come with their own ids (like imported ones) are
+        # accounted for
+        area.new_room({'id': '10'})
+        self.assertEqual(area.new_room().id, '11')
+        # Each type has its own ids
+        self.assertEqual(area.new_item().id, '1')
+        self.assertEqual(area.new_npc().id, '1')
+        self.assertEqual(area.new_script().id, '1')
+        # A freshly loaded area carries on from the highest id it has
+        copy = Area(self.world.db.select('* FROM area WHERE name=?', ['foo'])[0])
+        copy.load()
+        self.assertEqual(copy.get_id('room'), '12')
+        self.assertEqual(copy.get_id('build_item'), '2')
@@ -4,3 +4,43 @@ class TestItem(ShinyTestCase):
     def test_something(self):
         pass
 
+    
+    def test_shared_attrs(self):
+        from shinymud.models.area import Area
+        from shinymud.models.item import GameItem
+        area = Area.create({'name': 'foo'})
+        dagger = area.new_item()
+        dagger.build_set_name('dagger')
+        dagger.build_set_keywords('dagger, knife')
+        dagger.build_add_type('equippable')
+        one = dagger.load()
+        two = dagger.load()
+        # Nothing is stored on the items until it's changed
+        self.assertTrue(one.shared is two.shared)
+        self.assertEqual(getattr(one, '_name', None), None)
+        self.assertEqual(one.keywords, ('dagger', 'knife'))
+        self.assertTrue(one.has_type('equippable'))
+        # A shared list can't be changed in place under every other item
+        # loaded from the same prototype, only replaced on one of them
+        self.assertRaises(AttributeError, lambda: one.keywords.append('shiv'))
+        one.keywords = list(one.keywords) + ['shiv']
+        self.assertEqual(one.keywords, ['dagger', 'knife', 'shiv'])
+        self.assertEqual(two.keywords, ('dagger', 'knife'))
+        one.keywords = ['dagger', 'knife']
+        one.name = 'bloody dagger'
+        self.assertEqual((one.name, two.name), ('bloody dagger', 'dagger'))
+        # Items that have already been loaded don't see changes to the
+        # prototype, but new ones do
+        dagger.build_set_name('sword')
+        self.assertEqual(two.name, 'dagger')
+        self.assertEqual(dagger.load().name, 'sword')
+        # Shared values get saved like any others
+        self.world.db.write_behind = False
+        one.save()
+        two.save()
+        rows = self.world.db.select('* FROM game_item ORDER BY dbid')
+        self.assertEqual([r['name'] for r in rows], ['bloody dagger', 'dagger'])
+        copy = GameItem(rows[1])
+        self.assertEqual(copy.keywords, ['dagger', 'knife'])
+        self.assertEqual(copy.build_id, dagger.id)
+        self.assertTrue(copy.has_type('equippable'))
@@ -0,0 +1,73 @@
+from shinytest import ShinyTestCase
+
+class TestModel(ShinyTestCase):
+    def assertSameColumns(self, model, args):
+        """Load args into one model with its compiled column functions, and
+        into another with Model's generic ones, and make sure they agree.
+        """
+        from shinymud.models import Model
+        fast = model.__new__(model)
+        slow = model.__new__(model)
+        fast.load_columns(args)
+        Model.load_columns(slow, args)
+        for col in model.db_columns:
+            self.assertEqual(getattr(fast, col.name), getattr(slow, col.name))
+        self.assertEqual(fast.saved_state, slow.saved_state)
+        self.assertEqual(fast.create_save_dict(), Model.create_save_dict(slow))
+        self.assertEqual(fast.copy_save_attrs(), Model.copy_save_attrs(slow))
+    
+    def test_compiled_columns(self):
+        from shinymud.models import Model, model_list
+        for model in model_list.values():
+            self.assertNotEqual(model.__dict__.get('load_columns'), None)
+            self.assertSameColumns(model, {})
+            self.assertSameColumns(model, {'dbid': '3'})
+    
+    def test_compiled_rows(self):
+        from shinymud.models.area import Area
+        from shinymud.models.npc import Npc
+        from shinymud.models.item import BuildItem
+        area = Area.create({'name':'foo'})
+        npc = area.new_npc()
+        npc.build_set_name('a shady dealer')
+        npc.build_set_keywords('shady, dealer')
+        item = area.new_item()
+        item.build_set_keywords('shiny, thing')
+        item.build_add_type('equippable')
+        npc.save()
+        item.save()
+        # Rows just as they come out of the database
+        for model, obj in ((Npc, npc), (BuildItem, item)):
+            row = self.world.db.select('* FROM %s WHERE dbid=?' % model.db_table_name,
+                                       [obj.dbid])[0]
+            self.assertSameColumns(model, row)
+        self.assertEqual(Npc(npc.copy_save_attrs()).keywords, ['shady', 'dealer'])
+    
+    def test_compiled_overrides(self):
+        from shinymud.models import Model, Column
+        class Sack(Model):
+            db_table_name = 'sack'
+            db_columns = Model.db_columns + [Column('gold', type='INTEGER',
+                                                    read=int, write=int, default=0)]
+            def create_save_dict(self):
+                result = Model.create_save_dict(self)
+                result['gold'] = min(result['gold'], 100)
+                return result
+        class BigSack(Sack):
+            pass
+        class Purse(Model):
+            db_columns = Sack.db_columns
+        class CoinPurse(Purse):
+            db_columns = Sack.db_columns + [Column('coins')]
+        for model in (Sack, BigSack, Purse, CoinPurse):
+            model.compile_columns()
+        # A model's own create_save_dict (or one it inherits) is left alone,
+        # but the methods it doesn't override still get compiled
+        sack = BigSack({'gold': '500'})
+        self.assertEqual(sack.create_save_dict()['gold'], 100)
+        self.assertTrue(Sack.__dict__['load_columns'].compiled)
+        self.assertEqual(BigSack.__dict__.get('create_save_dict'), None)
+        # A compiled version inherited from another model is compiled again
+        # for the new model's columns
+        self.assertTrue(CoinPurse.__dict__['create_save_dict'].compiled)
+        self.assertEqual(CoinPurse({'coins': 'a few'}).create_save_dict()['coins'], 'a few')
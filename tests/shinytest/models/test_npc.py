@@ -196,3 +196,38 @@ class TestNpc(ShinyTestCase):
 
 
 
+    
+    def test_lazy_registers(self):
+        npc = self.area.new_npc().load()
+        # Registers aren't made until something uses them
+        self.assertEqual(getattr(npc, '_hit', None), None)
+        self.assertEqual(npc.hit.calculate(), 0)
+        npc.hit.append(3)
+        self.assertEqual(npc.hit.calculate(), 3)
+        self.assertEqual(npc.absorb.calculate(), {})
+        self.assertEqual(getattr(npc, '_evade', None), None)
+    
+    def test_load_from_template(self):
+        from shinymud.models.npc import Npc
+        npc = self.area.new_npc()
+        npc.build_set_name('a shady dealer')
+        npc.build_set_keywords('shady, dealer')
+        one = npc.load(1)
+        two = npc.load(2)
+        self.assertEqual(one.spawn_id, 1)
+        self.assertEqual(one.create_save_dict(), two.create_save_dict())
+        self.assertEqual(one.keywords, ['shady', 'dealer'])
+        self.assertEqual(one.title, npc.title)
+        self.assertEqual(one.dbid, None)
+        self.assertTrue(one.events is npc.events)
+        # Everything that gets changed in place is a copy of its own
+        one.keywords.append('dodgy')
+        one.inventory.append('a sack')
+        one.equipped['main-hand'] = 'a knife'
+        one.update_output('Hello.')
+        self.assertEqual(two.keywords, ['shady', 'dealer'])
+        self.assertEqual((two.inventory, two.actionq), ([], []))
+        self.assertEqual(two.equipped['main-hand'], '')
+        # Spawned npcs see changes to the prototype as soon as it's saved
+        npc.build_set_title('A shady dealer lurks in the shadows.')
+        self.assertEqual(npc.load().title, 'A shady dealer lurks in the shadows.')
@@ -1,5 +1,20 @@
 from shinytest import ShinyTestCase
 
+class FakeConnection(object):
+    """Stands in for a player's connection, and remembers what was sent."""
+    def __init__(self):
+        self.unsent = 0
+        self.sent = []
+    
+    def backlog(self):
+        return self.unsent
+    
+    def send(self, queue):
+        self.sent.extend(queue)
+        del queue[:]
+        return True
+
+
 class TestPlayer(ShinyTestCase):
     def setUp(self):
         ShinyTestCase.setUp(self)
@@ -9,3 +24,125 @@ class TestPlayer(ShinyTestCase):
     def test_something(self):
         pass
     
+    
+    def test_load_inventory(self):
+        from shinymud.models.player import Player
+        db = self.world.db
+        bob = Player(('bob', 'bar'))
+        bob.mode = None
+        bob.playerize({'name':'bob', 'password':'pork'})
+        bob.save()
+        bag = self.area.new_item()
+        bag.build_set_name('bag')
+        bag.build_add_type('container')
+        rock = self.area.new_item()
+        rock.build_set_name('rock')
+        def pack(count):
+            # A bag in a bag in a bag..., with a rock in each one
+            outer = bag.load()
+            bob.item_add(outer)
+            container = outer.item_types['container']
+            for i in range(count):
+                container.item_add(rock.load())
+                inner = bag.load()
+                inner.save()
+                container.item_add(inner)
+                container = inner.item_types['container']
+        
+        queries = []
+        select = db.select
+        def counted_select(query, params=None):
+            queries.append(query)
+            return select(query, params)
+        def load():
+            del queries[:]
+            db.select = counted_select
+            copy = Player(('bob', 'bar'))
+            copy.mode = None
+            copy.playerize(select('* FROM player WHERE name=?', ['bob'])[0])
+            db.select = select
+            return copy
+        
+        pack(3)
+        copy = load()
+        few_items = len(queries)
+        self.assertEqual([i.name for i in copy.inventory], ['bag'])
+        container = copy.inventory[0].item_types['container']
+        for i in range(3):
+            self.assertEqual(sorted([i.name for i in container.inventory]), ['bag', 'rock'])
+            inner = [i for i in container.inventory if i.has_type('container')][0]
+            container = inner.item_types['container']
+        self.assertEqual(container.inventory, [])
+        self.assertEqual(db.preloaded, {})
+        # The number of queries doesn't depend on how many items there are,
+        # or how deeply they're nested
+        pack(10)
+        copy = load()
+        self.assertEqual(len(copy.inventory), 2)
+        self.assertEqual(len(queries), few_items)
+        # Big inventories are fetched in batches, and come out the same
+        import shinymud.models.item as item_module
+        item_module.MAX_PARAMS = 4
+        batched = load()
+        item_module.MAX_PARAMS = 999
+        def names(items):
+            return sorted([(i.name, names(i.item_types['container'].inventory)
+                            if i.has_type('container') else []) for i in items])
+        self.assertEqual(names(batched.inventory), names(copy.inventory))
+        self.assertTrue(len(queries) > few_items)
+        self.assertEqual(db.preloaded, {})
+        # Nothing is left preloaded if loading the items goes wrong
+        from shinymud.models.item_types import Container
+        def broken(self):
+            raise ValueError('broken container')
+        Container.load_inventory = broken
+        self.assertRaises(ValueError, load)
+        db.select = select
+        self.assertEqual(db.preloaded, {})
+    
+    def test_output_limits(self):
+        from shinymud.models.player import Player
+        from shinymud.data.config import OUTPUT_HIGH_WATER, OUTPUT_MAX_LINES
+        bob = Player(('bob', 'bar'))
+        bob.mode = None
+        bob.playerize({'name':'bob', 'password':'pork'})
+        bob.outq = []
+        for i in range(OUTPUT_HIGH_WATER):
+            bob.update_output('chatter', priority='low')
+        # Past the high-water mark chatter gets dropped, but important output
+        # still gets through
+        bob.update_output('more chatter', priority='low')
+        bob.update_output('You are hit!')
+        self.assertEqual(len(bob.outq), OUTPUT_HIGH_WATER + 1)
+        self.assertEqual(bob.outq[-1], 'You are hit!')
+        self.assertEqual(bob.dropped_output, {'low': 1, 'normal': 0})
+        # Nothing gets past the hard limit
+        bob.update_output(['hit'] * OUTPUT_MAX_LINES)
+        self.assertEqual(len(bob.outq), OUTPUT_MAX_LINES)
+        self.assertEqual(bob.dropped_output['normal'], OUTPUT_HIGH_WATER + 1)
+        self.assertEqual(self.world.output_drops, bob.dropped_output)
+    
+    def test_stalled_connection(self):
+        from shinymud.models.player import Player
+        from shinymud.data.config import SEND_BUFFER_HIGH_WATER
+        conn = FakeConnection()
+        bob = Player(conn)
+        bob.mode = None
+        bob.playerize({'name':'bob', 'password':'pork'})
+        bob.outq = []
+        conn.unsent = SEND_BUFFER_HIGH_WATER + 1
+        bob.update_output('hello')
+        bob.send_output()
+        # The connection is too far behind, so the output waits
+        self.assertTrue(bob.output_stalled)
+        self.assertEqual(conn.sent, [])
+        self.assertEqual(bob.outq, ['hello'])
+        # ...and chatter gets thrown away until it catches up
+        bob.update_output('chatter', priority='low')
+        self.assertEqual(bob.outq, ['hello'])
+        conn.unsent = 0
+        bob.send_output()
+        self.assertFalse(bob.output_stalled)
+        self.assertEqual(conn.sent[:2], ['hello', '[1 messages were dropped because '
+                                         'your connection is falling behind.]'])
+        self.assertEqual(bob.outq, [])
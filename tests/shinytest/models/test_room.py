@@ -11,6 +11,41 @@ class TestRoom(ShinyTestCase):
         del self.room
         del self.area
     
+    def test_spawn_ids(self):
+        item = self.area.new_item()
+        self.room.build_add_spawn('item 1')
+        self.room.build_add_spawn('item 1')
+        self.assertEqual(sorted(self.room.spawns), ['1', '2'])
+        self.room.build_remove_spawn('2')
+        self.room.build_add_spawn('item 1')
+        self.assertEqual(sorted(self.room.spawns), ['1', '3'])
+        self.room.new_spawn({'id': '7', 'room': self.room, 'obj': item,
+                             'spawn_type': 'item'})
+        self.assertEqual(self.room.get_spawn_id(), '8')
+    
+    def test_shared_defaults(self):
+        from shinymud.models.shiny_types import EMPTY_LIST, EMPTY_DICT
+        other = self.area.new_room()
+        # Empty rooms share their empty lists and dictionaries...
+        self.assertTrue(self.room.items is other.items is EMPTY_LIST)
+        self.assertTrue(self.room.players is other.players is EMPTY_DICT)
+        self.assertRaises(TypeError, EMPTY_LIST.append, 'rock')
+        # ...until they have something to put in them
+        item = self.area.new_item().load()
+        self.room.item_add(item)
+        self.assertEqual(self.room.items, [item])
+        self.assertEqual(other.items, [])
+        self.room.item_remove(item)
+        self.assertEqual(self.room.items, [])
+        # Exits still work like a dictionary of every direction
+        self.assertEqual(len(self.room.exits.items()), 6)
+        self.assertEqual(self.room.exits['north'], None)
+        self.assertRaises(KeyError, self.room.exits.__getitem__, 'sideways')
+        self.room.link_exits('north', other)
+        self.assertEqual(self.room.exits.get('north').to_room, other)
+        self.assertEqual([d for d, e in self.room.exits.items() if e], ['north'])
+        self.assertEqual(other.exits['south'].to_room, self.room)
+    
     def test_add_spawn_item_inroom(self):
         """Test adding a spawn for an item, with a spawn point 'in room'."""
         item = self.area.new_item()